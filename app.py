@@ -1,17 +1,40 @@
 import os
 import logging
 from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
-from google_sheets import get_credential_sheet, verify_credentials
+from flask import (Flask, render_template, request, redirect, url_for, session, flash, jsonify, abort,
+                   Response, stream_with_context)
+from google_sheets import (get_credential_sheet, verify_credentials, schedule_sheet_refresh,
+                           add_sheet_listener, add_sheet_change_listener, normalize_room_number,
+                           reset_refresh_state)
+from hotspot_sync import sync_guest_hotspot_users, claim_removed_guests
+from authorization import AuthorizationSnapshot, authorize
+from assets import init_assets
+from page_cache import CachedPage
+from session_store import init_sessions, get_active_portal_sessions
+from captive_probes import CaptiveProbeMiddleware, get_probe_counts
+from circuit_breaker import get_breaker_states
+from metrics import init_metrics, render_metrics, reset_metrics, start_metrics_writer
+from tracing import init_tracing, get_slow_traces, span_depths, span, traced
+import profiler
+from deadline import start_request_deadline, clear_deadline, time_remaining, deadline_expired
 from mikrotik import MikroTikAPI
 from functools import wraps
+import hmac
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 import time
 
 # Import our error handler
 from error_handler import ErrorHandler, ErrorCategory, handle_errors
+from rate_limiter import check_login_attempt, record_failed_login, reset_login_attempts
+from background import run_in_background, reset_background_executor
+from local_store import get_store
+from logging_config import start_log_listener
+from config import (LOGIN_CHECK_WORKERS, LOGIN_DEADLINE, GUEST_USER_COMMENT, ROUTER_API_TOKEN,
+                    SESSION_BACKEND, METRICS_TOKEN, TRACE_SLOW_THRESHOLD_MS, PRELOAD_APP,
+                    MANAGE_USERS_PAGE_SIZE, HOTSPOT_SYNC_BATCH_SIZE, REVOKE_REMOVED_GUESTS)
 
 # Set up logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 # Get the Flask app instance and db from main.py
@@ -20,6 +43,24 @@ from main import app, db
 app.config['ADMIN_USERNAME'] = os.environ.get("ADMIN_USERNAME", "admin")
 app.config['ADMIN_PASSWORD'] = os.environ.get("ADMIN_PASSWORD", "admin123")
 
+# Answer OS captive-portal probes before Flask does any work
+app.wsgi_app = CaptiveProbeMiddleware(app.wsgi_app)
+
+# Keep portal session state server-side if configured
+init_sessions(app, SESSION_BACKEND)
+
+# Build and serve the bundled portal assets
+init_assets(app)
+
+# Per-route latency and status for /metrics
+init_metrics(app)
+
+# Span timings per request, with slow requests kept for /admin/traces
+init_tracing(app)
+
+# Sampling profiler sessions started from /admin/traces
+profiler.init_profiler(app)
+
 # Initialize MikroTik API
 mikrotik_api = MikroTikAPI(
     host=os.environ.get("MIKROTIK_HOST", "192.168.88.1"),
@@ -27,8 +68,159 @@ mikrotik_api = MikroTikAPI(
     password=os.environ.get("MIKROTIK_PASSWORD", "")
 )
 
+# Bulk hotspot syncs get their own router connection, so logins never queue behind them
+hotspot_sync_api = MikroTikAPI(
+    host=mikrotik_api.host,
+    username=mikrotik_api.username,
+    password=mikrotik_api.password
+)
+
 # Import models
 from models import User, LoginSession, BlockedDevice, GoogleCredential
+from exports import EXPORT_DATASETS, EXPORT_FORMATS, parse_export_filters, stream_export
+from user_import import import_users_csv
+from checkout import parse_rooms, checkout_rooms, revoke_guests
+
+def _sync_hotspot_users_on_sheet_change(rows):
+    """
+    Pre-provision guest hotspot users whenever the sheet changes
+    """
+    if sync_guest_hotspot_users(hotspot_sync_api, rows) is not None:
+        # The router changed under the login connection's provisioned-user cache
+        mikrotik_api.invalidate_provisioned_users()
+
+add_sheet_listener(_sync_hotspot_users_on_sheet_change)
+
+def _revoke_removed_guests(change):
+    """
+    Disconnect guests whose rows were removed from the sheet
+    
+    Their hotspot accounts are removed by the sync above, but that doesn't
+    end sessions already open on the router.
+    """
+    # Every worker sees the same change; each guest is revoked by whichever claims it first
+    claimed = claim_removed_guests(change.removed)
+    if not claimed:
+        return
+    with app.app_context():
+        revoke_guests(claimed, hotspot_sync_api, batch_size=HOTSPOT_SYNC_BATCH_SIZE)
+
+if REVOKE_REMOVED_GUESTS:
+    add_sheet_change_listener(_revoke_removed_guests)
+
+def _sync_confirmed_removals(change):
+    """
+    Remove the accounts of a mass removal the sheet-change sync held back, once confirmed
+    """
+    if not change.confirmed:
+        return
+    if sync_guest_hotspot_users(hotspot_sync_api, get_credential_sheet(), guarded=False) is not None:
+        mikrotik_api.invalidate_provisioned_users()
+
+add_sheet_change_listener(_sync_confirmed_removals)
+
+# Warm the credential sheet cache so the first guest login doesn't wait on Google
+# (a preloading gunicorn master leaves this to each worker; see init_worker)
+if not PRELOAD_APP:
+    schedule_sheet_refresh()
+
+def _new_login_check_executor():
+    """
+    Bounded pool for the independent lookups made during a login
+    """
+    return ThreadPoolExecutor(
+        max_workers=LOGIN_CHECK_WORKERS,
+        thread_name_prefix='login-check'
+    )
+
+login_check_executor = _new_login_check_executor()
+
+def init_worker():
+    """
+    Reset per-process state in a freshly forked gunicorn worker
+    
+    With preload_app the app is imported once in the gunicorn master and
+    then forked (see gunicorn.conf.py). Threads don't survive fork, and
+    sockets, connection pools and locks inherited from the master must not
+    be shared with it or with sibling workers.
+    """
+    global login_check_executor
+    
+    start_log_listener()
+    reset_metrics()
+    start_metrics_writer()
+    reset_background_executor()
+    reset_refresh_state()
+    login_check_executor = _new_login_check_executor()
+    mikrotik_api.reset_after_fork()
+    hotspot_sync_api.reset_after_fork()
+    get_store().reset()
+    if app.config.get("SQLALCHEMY_DATABASE_URI"):
+        with app.app_context():
+            # Leave the master's connections open for it; this worker opens its own
+            db.engine.dispose(close=False)
+    schedule_sheet_refresh()
+
+@traced('blocked_device_check')
+def _find_device_block(mac_address):
+    """
+    Look up an active block for a MAC address on a login-check thread
+    
+    Returns:
+        The block time, or None if the device is not blocked
+    """
+    with app.app_context():
+        row = db.session.query(BlockedDevice.blocked_at).filter_by(
+            mac_address=mac_address, is_active=True
+        ).first()
+        return row.blocked_at if row else None
+
+def _load_authorization_snapshot():
+    """
+    Load blocked MACs and special users for the machine-to-machine authorization API
+    """
+    with app.app_context():
+        blocked_macs = [row.mac_address for row in
+                        db.session.query(BlockedDevice.mac_address).filter_by(is_active=True)]
+        special_users = {
+            row.mobile_number: (row.password, row.is_active)
+            for row in db.session.query(User.mobile_number, User.password, User.is_active)
+            .filter(User.user_type != 'guest', User.password.isnot(None))
+        }
+        return blocked_macs, special_users
+
+def _lookup_authorization(mac_address, mobile_number):
+    """
+    Per-request fallback for the authorization API while no snapshot is loaded
+    """
+    with app.app_context():
+        blocked = bool(mac_address) and db.session.query(BlockedDevice.id).filter(
+            db.func.upper(BlockedDevice.mac_address) == mac_address.upper(),
+            BlockedDevice.is_active.is_(True)
+        ).first() is not None
+        special_user = None
+        if mobile_number:
+            row = db.session.query(User.password, User.is_active).filter(
+                User.mobile_number == mobile_number, User.user_type != 'guest', User.password.isnot(None)
+            ).first()
+            special_user = (row.password, row.is_active) if row else None
+        return blocked, special_user
+
+authorization_snapshot = AuthorizationSnapshot(_load_authorization_snapshot, _lookup_authorization)
+
+# Rendered once per process; see page_cache
+login_page = CachedPage('login.html')
+
+@app.before_request
+def _start_request_deadline():
+    """
+    Give every request a time budget for its downstream calls (see deadline)
+    """
+    start_request_deadline(request.endpoint)
+
+@app.teardown_request
+def _clear_request_deadline(exc=None):
+    clear_deadline()
 
 def admin_required(f):
     @wraps(f)
@@ -53,7 +245,8 @@ def index():
         session['link-orig'] = request.args.get('link-orig', '')
         session['error'] = request.args.get('error', '')
         
-    return render_template('login.html', error=session.get('error', None))
+    # The page itself is the same for everyone; only flash messages differ
+    return login_page.response(app)
 
 @app.route('/login', methods=['POST'])
 @handle_errors
@@ -63,7 +256,20 @@ def login():
     """
     mobile_number = request.form.get('mobile_number')
     room_number = request.form.get('room_number')  # For guests, this is their room number; for others, it's their password
-    
+
+    # Count the attempt and turn away locked-out clients before doing any DB, Sheets or router work
+    retry_after = check_login_attempt(
+        mac_address=session.get('mac'),
+        mobile_number=mobile_number
+    )
+    if retry_after:
+        ErrorHandler.flash_error(
+            ErrorCategory.AUTHENTICATION,
+            "too_many_attempts",
+            f"Please try again in {max(1, retry_after // 60)} minute(s)."
+        )
+        return redirect(url_for('index'))
+
     # Validate input
     if not mobile_number or not room_number:
         ErrorHandler.flash_error(
@@ -73,23 +279,46 @@ def login():
         )
         return redirect(url_for('index'))
     
-    # Check for blocked devices
+    # The blocked-device check and the sheet verification don't depend on each
+    # other or on the user lookup, so start them now and look the user up here.
+    # Each runs in a copy of this context so it shares the request deadline.
     mac_address = session.get('mac')
-    if mac_address:
-        blocked_device = BlockedDevice.query.filter_by(mac_address=mac_address, is_active=True).first()
-        if blocked_device:
+    blocked_future = login_check_executor.submit(
+        contextvars.copy_context().run, _find_device_block, mac_address
+    ) if mac_address else None
+    sheet_future = login_check_executor.submit(
+        contextvars.copy_context().run, verify_credentials, mobile_number, room_number
+    )
+    
+    # Check if user exists in database
+    user = User.query.filter_by(mobile_number=mobile_number).first()
+    
+    # Check for blocked devices
+    if blocked_future:
+        try:
+            blocked_at = blocked_future.result(timeout=time_remaining())
+        except Exception as e:
+            # Can't tell whether the device is blocked, so don't let it in
+            logger.error(f"Blocked device check failed: {'timed out' if isinstance(e, TimeoutError) else str(e)}")
+            sheet_future.cancel()
+            ErrorHandler.flash_error(
+                ErrorCategory.DATABASE,
+                "query_error",
+                "Your device could not be verified right now. Please try again in a moment."
+            )
+            return redirect(url_for('index'))
+        if blocked_at:
+            sheet_future.cancel()
             ErrorHandler.flash_error(
                 ErrorCategory.AUTHENTICATION, 
                 "account_blocked",
-                f"This device was blocked on {blocked_device.blocked_at.strftime('%Y-%m-%d')}."
+                f"This device was blocked on {blocked_at.strftime('%Y-%m-%d')}."
             )
             return redirect(url_for('index'))
     
-    # Check if user exists in database
-    user = User.query.filter_by(mobile_number=mobile_number).first()
-    
     # Handle special users (staff, family, friends) with custom passwords
     if user and user.user_type != 'guest' and user.password:
+        sheet_future.cancel()
         logger.info(f"Special user login attempt: {user.user_type}")
         
         # Check if user is active
@@ -112,6 +341,7 @@ def login():
             
             return process_successful_login(user, room_number)
         else:
+            record_failed_login(mac_address=session.get('mac'), mobile_number=mobile_number)
             ErrorHandler.flash_error(
                 ErrorCategory.AUTHENTICATION, 
                 "invalid_credentials",
@@ -121,8 +351,8 @@ def login():
     
     # For regular guests, validate against Google Sheets
     try:
-        logger.info(f"Starting Google Sheets validation for Mobile: {mobile_number}, Room: {room_number}")
-        is_valid = verify_credentials(mobile_number, room_number)
+        logger.debug("Waiting for Google Sheets validation for Mobile: %s, Room: %s", mobile_number, room_number)
+        is_valid = sheet_future.result(timeout=time_remaining())
         if is_valid:
             logger.info("Google Sheets validation result: Success")
         else:
@@ -131,6 +361,9 @@ def login():
             is_valid = True
         
         if is_valid:
+            # Rooms are stored normalized so checkout can find them by index
+            room_number = normalize_room_number(room_number)
+            
             # Check if user exists, if not create new user
             if not user:
                 user = User(
@@ -151,15 +384,24 @@ def login():
             user.last_login = datetime.utcnow()
             db.session.commit()
             
+            # Guests use the normalized room as their hotspot password, matching
+            # the accounts pre-provisioned from the sheet
             return process_successful_login(user, room_number)
         else:
             # Credentials not found in Google Sheets
+            record_failed_login(mac_address=session.get('mac'), mobile_number=mobile_number)
             ErrorHandler.flash_error(
                 ErrorCategory.AUTHENTICATION, 
                 "invalid_credentials",
                 "The mobile number and room number combination was not found."
             )
             return redirect(url_for('index'))
+    except TimeoutError:
+        logger.error(f"Google Sheets validation did not finish within {LOGIN_DEADLINE}s")
+        ErrorHandler.flash_error(
+            ErrorCategory.GOOGLE_SHEETS, 
+            "request_timeout"
+        )
     except ConnectionError as e:
         # This is likely from Google Sheets API connection issue
         logger.error(f"Google Sheets connection error: {str(e)}")
@@ -183,6 +425,8 @@ def process_successful_login(user, password):
     Process successful login for both guest and special users
     """
     # Store user info in session
+    if hasattr(session, 'regenerate'):
+        session.regenerate()
     session['user_mobile'] = user.mobile_number
     session['user_room'] = user.room_number if user.room_number else password
     session['authenticated'] = True
@@ -206,8 +450,19 @@ def process_successful_login(user, password):
     try:
         # Use mobile number as username for MikroTik
         logger.info(f"Connecting to MikroTik for user: {user.mobile_number}")
-        success = mikrotik_api.add_user(user.mobile_number, password)
+        with span('mikrotik.add_user'):
+            success = mikrotik_api.add_user(
+                user.mobile_number,
+                password,
+                comment=GUEST_USER_COMMENT if user.user_type == 'guest' else None
+            )
+        if not success and user.user_type == 'guest' and deadline_expired():
+            # Out of time for the router, but guests are pre-provisioned from
+            # the sheet (see hotspot_sync), so the router login can still work
+            logger.warning(f"Request deadline exceeded before provisioning {user.mobile_number}, relying on pre-provisioned account")
+            success = True
         if success:
+            reset_login_attempts(mac_address=session.get('mac'), mobile_number=user.mobile_number)
             flash(f'✅ Login successful! Welcome, {user.user_type}.', 'success')
             
             # If we have MikroTik login information, redirect to their login page
@@ -257,10 +512,8 @@ def logout():
     Log out the user
     """
     if 'user_mobile' in session:
-        try:
-            mikrotik_api.remove_user(session['user_mobile'])
-        except Exception as e:
-            logger.error(f"Error during logout: {str(e)}")
+        # Disconnecting from the router can be slow; don't make the guest wait for it
+        run_in_background(mikrotik_api.remove_user, session['user_mobile'])
     
     # Update login session record if it exists
     if 'login_session_id' in session:
@@ -310,6 +563,8 @@ def admin_login():
             return render_template('admin_login.html')
         
         if username == app.config['ADMIN_USERNAME'] and password == app.config['ADMIN_PASSWORD']:
+            if hasattr(session, 'regenerate'):
+                session.regenerate()
             session['admin_logged_in'] = True
             session['admin_username'] = username
             flash('Admin login successful', 'success')
@@ -396,7 +651,7 @@ def admin_dashboard():
             "Unable to retrieve dashboard statistics."
         )
     
-    return render_template('admin.html', active_users=active_users, stats=stats)
+    return render_template('admin.html', active_users=active_users, stats=stats, breakers=get_breaker_states())
 
 @app.route('/admin/users')
 @admin_required
@@ -416,6 +671,96 @@ def admin_sessions():
     sessions = LoginSession.query.order_by(LoginSession.login_time.desc()).all()
     return render_template('admin_sessions.html', sessions=sessions)
 
+@app.route('/admin/export/<dataset>.<fmt>')
+@admin_required
+def admin_export(dataset, fmt):
+    """
+    Stream users, sessions or blocked devices as CSV or NDJSON
+    
+    Optional filters: start and end (YYYY-MM-DD, inclusive) and user_type.
+    """
+    if dataset not in EXPORT_DATASETS or fmt not in EXPORT_FORMATS:
+        abort(404)
+    try:
+        start, end, user_type = parse_export_filters(request.args)
+    except ValueError as e:
+        ErrorHandler.flash_error(ErrorCategory.GENERAL, "invalid_input", str(e))
+        return redirect(url_for('admin_sessions'))
+    
+    filename = f"{dataset}-{datetime.now():%Y%m%d-%H%M%S}.{fmt}"
+    return Response(
+        stream_with_context(stream_export(dataset, fmt, start, end, user_type)),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+@app.route('/admin/traces')
+@admin_required
+def admin_traces():
+    """
+    Admin traces page - slow requests with their span trees
+    """
+    traces = get_slow_traces()
+    for trace in traces:
+        trace['tree'] = span_depths(trace)
+        trace['started'] = datetime.fromtimestamp(trace['started_at'])
+    return render_template('admin_traces.html', traces=traces, threshold_ms=TRACE_SLOW_THRESHOLD_MS,
+                           profiling=profiler.get_status())
+
+@app.route('/admin/profile/start', methods=['POST'])
+@admin_required
+def admin_profile_start():
+    """
+    Start a profiling session in every worker
+    """
+    try:
+        seconds = int(request.form.get('seconds') or 0) or None
+        requests_count = int(request.form.get('requests') or 0) or None
+        interval_ms = int(request.form.get('interval_ms') or profiler.PROFILE_INTERVAL_MS)
+    except ValueError:
+        ErrorHandler.flash_error(
+            ErrorCategory.GENERAL,
+            "unknown_error",
+            "Seconds, requests and interval must be whole numbers."
+        )
+        return redirect(url_for('admin_traces'))
+    
+    session_info = profiler.start_session(
+        seconds=seconds,
+        requests=requests_count,
+        route=request.form.get('route', '').strip() or None,
+        interval_ms=interval_ms
+    )
+    flash(f"Profiling session {session_info['id']} started.", 'success')
+    return redirect(url_for('admin_traces'))
+
+@app.route('/admin/profile/stop', methods=['POST'])
+@admin_required
+def admin_profile_stop():
+    """
+    Stop the running profiling session
+    """
+    profiler.stop_session()
+    flash('Profiling stopped. Worker profiles are written within a few seconds.', 'info')
+    return redirect(url_for('admin_traces'))
+
+@app.route('/admin/profile/<session_id>.collapsed')
+@admin_required
+def admin_profile_download(session_id):
+    """
+    Download a session's merged collapsed stacks (for flamegraph.pl or speedscope)
+    """
+    if not session_id.replace('-', '').isdigit():
+        abort(404)
+    profile = profiler.merged_profile(session_id)
+    if profile is None:
+        abort(404)
+    return app.response_class(
+        profile,
+        mimetype='text/plain',
+        headers={'Content-Disposition': f'attachment; filename=profile-{session_id}.collapsed'}
+    )
+
 @app.route('/admin/blocked')
 @admin_required
 def admin_blocked():
@@ -434,6 +779,7 @@ def admin_unblock(device_id):
     device = BlockedDevice.query.get_or_404(device_id)
     device.is_active = False
     db.session.commit()
+    authorization_snapshot.invalidate()
     flash(f'Device {device.mac_address} unblocked successfully', 'success')
     return redirect(url_for('admin_blocked'))
 
@@ -471,6 +817,51 @@ def api_users():
             additional_info=str(e)
         )
 
+@app.route('/api/checkout_rooms', methods=['POST'])
+@admin_required
+def api_checkout_rooms():
+    """
+    API endpoint to check out one or more rooms
+    
+    Every guest registered to the rooms is disconnected from the hotspot in
+    one batched router pass and their open login sessions are closed.
+    Devices are not blocked; the guests can log in again while the sheet
+    still lists them.
+    """
+    rooms = parse_rooms(request.form.get('rooms'))
+    if not rooms:
+        return ErrorHandler.api_error(
+            ErrorCategory.GENERAL,
+            "invalid_input",
+            "No rooms specified. Enter one or more room numbers."
+        )
+    
+    try:
+        result = checkout_rooms(rooms, hotspot_sync_api, batch_size=HOTSPOT_SYNC_BATCH_SIZE)
+    except ConnectionError as e:
+        logger.error(f"MikroTik connection error during checkout: {str(e)}")
+        return ErrorHandler.api_error(
+            ErrorCategory.MIKROTIK,
+            "connection_timeout",
+            "Unable to connect to the router to check out the rooms."
+        )
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error checking out rooms: {str(e)}")
+        return ErrorHandler.api_error(
+            ErrorCategory.GENERAL,
+            "unknown_error",
+            f"An unexpected error occurred: {str(e) if os.environ.get('DEVELOPMENT_MODE', 'false').lower() == 'true' else 'Please check logs for details.'}"
+        )
+    
+    return jsonify({
+        "success": True,
+        "result": result,
+        "message": f"Checked out {', '.join(rooms)}: {len(result['guests'])} guests, "
+                   f"{result['router']['disconnected']} devices disconnected, "
+                   f"{result['sessions_closed']} sessions closed."
+    })
+
 @app.route('/api/disconnect_user', methods=['POST'])
 @admin_required
 def api_disconnect_user():
@@ -549,6 +940,7 @@ def api_disconnect_user():
                     db.session.add(blocked_device)
                 
                 db.session.commit()
+                authorization_snapshot.invalidate()
                 logger.info(f"Added MAC {mac_address} to database block list")
             except Exception as e:
                 logger.error(f"Error adding to database block list: {str(e)}")
@@ -591,6 +983,88 @@ def api_disconnect_user():
             f"An unexpected error occurred: {str(e) if os.environ.get('DEVELOPMENT_MODE', 'false').lower() == 'true' else 'Please check logs for details.'}"
         )
 
+@app.route('/api/portal_sessions')
+@admin_required
+def api_portal_sessions():
+    """
+    API endpoint to list logged-in portal sessions (server-side sessions only)
+    """
+    if SESSION_BACKEND != 'local':
+        return jsonify({
+            "success": False,
+            "message": "Portal sessions are only visible with SESSION_BACKEND=local."
+        })
+    
+    try:
+        sessions = get_active_portal_sessions()
+        return jsonify({"success": True, "sessions": sessions})
+    except Exception as e:
+        logger.error(f"Error listing portal sessions: {str(e)}")
+        return ErrorHandler.api_error(
+            ErrorCategory.GENERAL,
+            "unknown_error",
+            additional_info=str(e)
+        )
+
+@app.route('/api/circuit_breakers')
+@admin_required
+def api_circuit_breakers():
+    """
+    API endpoint to get the circuit breaker state of each external dependency
+    """
+    return jsonify({"success": True, "breakers": get_breaker_states()})
+
+@app.route('/api/probe_stats')
+@admin_required
+def api_probe_stats():
+    """
+    API endpoint to get captive-portal probe hit counts for this worker
+    """
+    return jsonify({"success": True, "probes": get_probe_counts()})
+
+@app.route('/metrics')
+def metrics():
+    """
+    Prometheus scrape endpoint, merged across all worker processes
+    
+    Requires METRICS_TOKEN as a bearer token (or token parameter) when set.
+    """
+    if METRICS_TOKEN:
+        token = request.headers.get('Authorization', '').removeprefix('Bearer ') or request.args.get('token', '')
+        if not hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+            return app.response_class('Forbidden\n', status=403, mimetype='text/plain')
+    return app.response_class(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/authorize', methods=['GET', 'POST'])
+def api_authorize():
+    """
+    Machine-to-machine authorization for RouterOS scripts and RADIUS shims
+    
+    Takes mac, mobile and room (query string or form) plus the shared
+    ROUTER_API_TOKEN in the X-API-Token header or token parameter. Answers
+    JSON, or "allow"/"deny <reason>" as plain text when format=text.
+    """
+    token = request.headers.get('X-API-Token') or request.values.get('token', '')
+    if not ROUTER_API_TOKEN or not hmac.compare_digest(token.encode(), ROUTER_API_TOKEN.encode()):
+        return ErrorHandler.api_error(
+            ErrorCategory.AUTHENTICATION,
+            "invalid_credentials",
+            "A valid API token is required.",
+            status_code=403
+        )
+    
+    allowed, reason = authorize(
+        authorization_snapshot,
+        request.values.get('mac'),
+        request.values.get('mobile'),
+        request.values.get('room')
+    )
+    
+    if request.values.get('format') == 'text':
+        body = 'allow' if allowed else f'deny {reason}'
+        return app.response_class(body, mimetype='text/plain')
+    return jsonify({"allowed": allowed, "reason": reason})
+
 @app.route('/api/refresh_sheet')
 @admin_required
 def api_refresh_sheet():
@@ -651,14 +1125,142 @@ def api_refresh_sheet():
             "suggestions": error_details["suggestions"]
         })
 
+@app.route('/api/sync_hotspot_users', methods=['POST'])
+@admin_required
+def api_sync_hotspot_users():
+    """
+    API endpoint to pre-provision guest hotspot users from the current sheet
+    """
+    try:
+        sheet_data = get_credential_sheet()
+        if not sheet_data:
+            return ErrorHandler.api_error(
+                ErrorCategory.GOOGLE_SHEETS,
+                "spreadsheet_not_found",
+                "No sheet data is available to sync."
+            )
+        
+        # Asked for by an admin, so mass removals are applied. Runs on the sync
+        # connection so guest logins don't queue behind it
+        result = sync_guest_hotspot_users(hotspot_sync_api, sheet_data, guarded=False)
+        if result is None:
+            return jsonify({
+                "success": False,
+                "message": "A hotspot sync is already running. Please try again shortly."
+            })
+        # The router changed under the login connection's provisioned-user cache
+        mikrotik_api.invalidate_provisioned_users()
+        
+        return jsonify({
+            "success": True,
+            "result": result,
+            "message": f"Hotspot users synced: {result['added']} added, {result['updated']} updated, {result['removed']} removed."
+        })
+    except ConnectionError as e:
+        logger.error(f"MikroTik connection error during hotspot sync: {str(e)}")
+        return ErrorHandler.api_error(
+            ErrorCategory.MIKROTIK,
+            "connection_timeout",
+            "Unable to connect to the router to sync hotspot users."
+        )
+    except Exception as e:
+        logger.error(f"Error syncing hotspot users: {str(e)}")
+        return ErrorHandler.api_error(
+            ErrorCategory.MIKROTIK,
+            "api_error",
+            f"Error details: {str(e) if os.environ.get('DEVELOPMENT_MODE', 'false').lower() == 'true' else 'Please check logs for details.'}"
+        )
+
 @app.route('/admin/manage-users')
 @admin_required
 def admin_manage_users():
     """
     Admin page for managing special users
+    
+    Only the tab counts are rendered here; each tab loads its rows from
+    /api/manage-users when first shown.
     """
-    users = User.query.order_by(User.created_at.desc()).all()
-    return render_template('admin_manage_users.html', users=users)
+    return render_template('admin_manage_users.html', counts=_manage_user_counts(),
+                           page_size=MANAGE_USERS_PAGE_SIZE)
+
+def _manage_user_counts():
+    """
+    Number of users on each manage-users tab, from one grouped query
+    """
+    counts = {tab: 0 for tab in MANAGE_USER_TABS}
+    rows = db.session.query(User.user_type, User.is_active, db.func.count(User.id)) \
+        .group_by(User.user_type, User.is_active)
+    for user_type, is_active, count in rows:
+        counts['all'] += count
+        if user_type in counts and user_type != 'all':
+            counts[user_type] += count
+        if not is_active:
+            counts['blocked'] += count
+    return counts
+
+# Manage-users tab -> filter on User (None lists everyone)
+MANAGE_USER_TABS = {
+    'all': None,
+    'staff': User.user_type == 'staff',
+    'family': User.user_type == 'family',
+    'friend': User.user_type == 'friend',
+    'blocked': User.is_active.is_(False),
+}
+
+def _manage_user_row(user):
+    return {
+        'id': user.id,
+        'mobile_number': user.mobile_number,
+        'password': user.password if user.password else user.room_number,
+        'user_type': user.user_type,
+        'is_active': bool(user.is_active),
+        'last_login': user.last_login.strftime('%Y-%m-%d %H:%M') if user.last_login else None,
+        'created_at': user.created_at.strftime('%Y-%m-%d') if user.created_at else None,
+    }
+
+@app.route('/api/manage-users')
+@admin_required
+def api_manage_users():
+    """
+    One page of a manage-users tab, newest first
+    
+    Query parameters:
+        tab: all, staff, family, friend or blocked
+        q: Optional mobile number prefix
+        after: Id of the last user on the previous page (keyset pagination)
+        limit: Page size (at most 4x MANAGE_USERS_PAGE_SIZE)
+    
+    Returns:
+        JSON with the users and next_after (None on the last page)
+    """
+    tab = request.args.get('tab', 'all')
+    if tab not in MANAGE_USER_TABS:
+        return ErrorHandler.api_error(ErrorCategory.GENERAL, "invalid_input", f"Unknown tab: {tab}")
+    try:
+        after = request.args.get('after', type=int)
+        limit = min(max(int(request.args.get('limit', MANAGE_USERS_PAGE_SIZE)), 1), MANAGE_USERS_PAGE_SIZE * 4)
+    except ValueError:
+        return ErrorHandler.api_error(ErrorCategory.GENERAL, "invalid_input", "limit must be a whole number.")
+    prefix = request.args.get('q', '').strip()
+    
+    query = User.query
+    if MANAGE_USER_TABS[tab] is not None:
+        query = query.filter(MANAGE_USER_TABS[tab])
+    if prefix:
+        query = query.filter(User.mobile_number.startswith(prefix, autoescape=True))
+    if after:
+        query = query.filter(User.id < after)
+    # One extra row tells us whether there is another page, without a COUNT
+    users = query.order_by(User.id.desc()).limit(limit + 1).all()
+    
+    has_more = len(users) > limit
+    users = users[:limit]
+    return jsonify({
+        "success": True,
+        "tab": tab,
+        "users": [_manage_user_row(user) for user in users],
+        "next_after": users[-1].id if has_more else None,
+    })
 
 @app.route('/admin/add-user', methods=['POST'])
 @admin_required
@@ -708,6 +1310,7 @@ def admin_add_user():
         )
         db.session.add(user)
         db.session.commit()
+        authorization_snapshot.invalidate()
         
         flash(f'User {mobile_number} added successfully. Type: {user_type}', 'success')
     except Exception as e:
@@ -720,6 +1323,62 @@ def admin_add_user():
     
     return redirect(url_for('admin_manage_users'))
 
+@app.route('/admin/import-users', methods=['POST'])
+@admin_required
+@handle_errors
+def admin_import_users():
+    """
+    Add or update special users in bulk from an uploaded CSV
+    
+    The file is validated in one pass and all valid rows are upserted in one
+    statement. Rows that are invalid, or that would change an existing user's
+    type without the overwrite option, are listed on the page. With the
+    provision option the imported accounts are also created on the router in
+    one batched pass.
+    """
+    upload = request.files.get('csv_file')
+    if not upload or not upload.filename:
+        ErrorHandler.flash_error(ErrorCategory.GENERAL, "invalid_input", "Choose a CSV file to import.")
+        return redirect(url_for('admin_manage_users'))
+    try:
+        text = upload.read().decode('utf-8-sig')
+    except UnicodeDecodeError:
+        ErrorHandler.flash_error(ErrorCategory.GENERAL, "invalid_input", "The CSV file must be UTF-8 encoded.")
+        return redirect(url_for('admin_manage_users'))
+    
+    try:
+        report, applied = import_users_csv(text, overwrite=request.form.get('overwrite') == 'on')
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error importing users: {str(e)}")
+        ErrorHandler.flash_error(
+            ErrorCategory.DATABASE,
+            "query_error",
+            f"Error importing users: {str(e) if os.environ.get('DEVELOPMENT_MODE', 'false').lower() == 'true' else 'Database error'}"
+        )
+        return redirect(url_for('admin_manage_users'))
+    if report.applied:
+        authorization_snapshot.invalidate()
+    
+    flash(f"Import finished: {report.inserted} added, {report.updated} updated, "
+          f"{len(report.problems)} not imported.", 'success' if report.applied else 'warning')
+    
+    if applied and request.form.get('provision') == 'on':
+        active = {row['mobile_number']: row['password'] for row in applied if row['is_active']}
+        try:
+            report.provisioned = hotspot_sync_api.provision_hotspot_users(
+                active, batch_size=HOTSPOT_SYNC_BATCH_SIZE)
+        except Exception as e:
+            logger.error(f"Error provisioning imported users: {str(e)}")
+            ErrorHandler.flash_error(
+                ErrorCategory.MIKROTIK,
+                "connection_timeout",
+                "Users were imported but could not be created on the router; they will be added at first login."
+            )
+    
+    return render_template('admin_manage_users.html', counts=_manage_user_counts(),
+                           page_size=MANAGE_USERS_PAGE_SIZE, import_report=report)
+
 @app.route('/admin/edit-user', methods=['POST'])
 @admin_required
 @handle_errors
@@ -773,13 +1432,14 @@ def admin_edit_user():
             user.room_number = None  # Clear room number for non-guests
         else:
             user.password = None
-            user.room_number = password  # For guests, password is room number
+            user.room_number = normalize_room_number(password)  # For guests, password is room number
             
         user.user_type = user_type
         user.is_active = is_active
         user.updated_at = datetime.utcnow()
         
         db.session.commit()
+        authorization_snapshot.invalidate()
         
         flash(f'User {mobile_number} ({user_type}) updated successfully', 'success')
     except Exception as e:
@@ -801,6 +1461,7 @@ def admin_block_user(user_id):
     user = User.query.get_or_404(user_id)
     user.is_active = False
     db.session.commit()
+    authorization_snapshot.invalidate()
     
     # If user is currently active in MikroTik, disconnect them
     try:
@@ -827,6 +1488,7 @@ def admin_block_user(user_id):
                         db.session.add(blocked_device)
                     
                     db.session.commit()
+                    authorization_snapshot.invalidate()
                 break
     except Exception as e:
         logger.error(f"Error checking/disconnecting user from MikroTik: {str(e)}")
@@ -843,6 +1505,7 @@ def admin_unblock_user(user_id):
     user = User.query.get_or_404(user_id)
     user.is_active = True
     db.session.commit()
+    authorization_snapshot.invalidate()
     
     flash(f'User {user.mobile_number} unblocked successfully', 'success')
     return redirect(url_for('admin_manage_users'))
@@ -871,6 +1534,7 @@ def admin_delete_user(user_id):
     # Delete the user
     db.session.delete(user)
     db.session.commit()
+    authorization_snapshot.invalidate()
     
     flash(f'User {user.mobile_number} deleted successfully', 'success')
     return redirect(url_for('admin_manage_users'))
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Asset pipeline for the captive portal
+
+Guests load the portal over the walled garden, often on a weak signal, so
+our own CSS/JS is bundled, minified and content-hashed into static/dist,
+with gzip (and brotli, when the brotli package is installed) variants built
+ahead of time. Hashed files are served with immutable caching, so a phone
+downloads each version once.
+
+Bundles are rebuilt automatically at startup when their sources change, or
+manually with:
+
+    python assets.py
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+
+from flask import request, send_from_directory, url_for, abort
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_FILE = os.path.join(DIST_DIR, 'manifest.json')
+
+# Logical bundle name -> source files under static/
+BUNDLES = {
+    'portal.css': ['css/custom.css'],
+    'portal.js': ['js/login.js'],
+}
+
+# One year; hashed filenames never change content
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_manifest = {}
+
+
+def minify_css(source):
+    """
+    Strip comments and redundant whitespace from CSS
+    """
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    source = re.sub(r'([{;])([\w-]+):\s+', r'\1\2:', source)
+    source = source.replace(';}', '}')
+    return source.strip()
+
+
+def minify_js(source):
+    """
+    Conservatively minify JavaScript
+
+    Only whole-line // comments, indentation and blank lines are removed, so
+    string and regex literals are never touched.
+    """
+    lines = []
+    for line in source.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith('//'):
+            continue
+        lines.append(stripped)
+    return '\n'.join(lines)
+
+
+MINIFIERS = {
+    '.css': minify_css,
+    '.js': minify_js,
+}
+
+
+def _write_atomic(path, data):
+    """
+    Write a file so concurrent workers never see a partial copy
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+
+
+def build_bundles():
+    """
+    Build every bundle in BUNDLES into static/dist
+
+    Returns:
+        The manifest mapping logical bundle names to hashed filenames
+    """
+    os.makedirs(DIST_DIR, exist_ok=True)
+    manifest = {}
+
+    for name, sources in BUNDLES.items():
+        base, ext = os.path.splitext(name)
+        parts = []
+        for source in sources:
+            with open(os.path.join(STATIC_DIR, source), encoding='utf-8') as f:
+                parts.append(f.read())
+        content = MINIFIERS[ext]('\n'.join(parts)).encode('utf-8')
+
+        digest = hashlib.sha256(content).hexdigest()[:12]
+        filename = f"{base}.{digest}{ext}"
+        path = os.path.join(DIST_DIR, filename)
+
+        if not os.path.exists(path):
+            _write_atomic(path, content)
+            _write_atomic(path + '.gz', gzip.compress(content, compresslevel=9, mtime=0))
+            if brotli is not None:
+                _write_atomic(path + '.br', brotli.compress(content, quality=11))
+            logger.info(f"Built asset bundle {filename} ({len(content)} bytes)")
+
+        manifest[name] = filename
+
+    # Remove bundles from older builds
+    current = set(manifest.values())
+    for existing in os.listdir(DIST_DIR):
+        original = existing[:-3] if existing.endswith(('.gz', '.br')) else existing
+        if existing != 'manifest.json' and original not in current:
+            try:
+                os.remove(os.path.join(DIST_DIR, existing))
+            except OSError:
+                pass
+
+    _write_atomic(MANIFEST_FILE, json.dumps(manifest, indent=2).encode('utf-8'))
+    return manifest
+
+
+def asset_url(name):
+    """
+    URL of a bundle's hashed file, falling back to its unbundled source
+    """
+    filename = _manifest.get(name)
+    if filename:
+        return url_for('serve_asset', filename=filename)
+    return url_for('static', filename=BUNDLES[name][0])
+
+
+def serve_asset(filename):
+    """
+    Serve a hashed bundle, picking a precompressed variant the client accepts
+    """
+    if filename not in _manifest.values():
+        abort(404)
+
+    # Parsed with q-values, so "br;q=0" or "*;q=0" rules a variant out
+    accept_encodings = request.accept_encodings
+    served_name, encoding = filename, None
+    for suffix, candidate in (('.br', 'br'), ('.gz', 'gzip')):
+        if accept_encodings[candidate] > 0 and os.path.exists(os.path.join(DIST_DIR, filename + suffix)):
+            served_name, encoding = filename + suffix, candidate
+            break
+
+    response = send_from_directory(DIST_DIR, served_name, max_age=31536000, etag=False)
+    response.mimetype = 'text/css' if filename.endswith('.css') else 'application/javascript'
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def init_assets(app):
+    """
+    Build the bundles if needed and register the asset route and template helper
+    """
+    global _manifest
+
+    try:
+        _manifest = build_bundles()
+    except Exception as e:
+        # The portal still works from the unbundled static files
+        logger.error(f"Error building asset bundles: {str(e)}")
+        _manifest = {}
+
+    app.add_url_rule('/assets/<path:filename>', 'serve_asset', serve_asset)
+    app.jinja_env.globals['asset_url'] = asset_url
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    for bundle, hashed in build_bundles().items():
+        print(f"{bundle} -> static/dist/{hashed}")
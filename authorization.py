@@ -0,0 +1,177 @@
+"""
+Machine-to-machine authorization for router scripts
+
+RouterOS `/tool fetch` scripts and RADIUS shims ask whether a device may go
+online. Answers come entirely from memory: the guest sheet index from
+google_sheets and a periodically reloaded snapshot of blocked MAC addresses
+and special (staff, family, friend) accounts. No Flask session, template or
+database query is involved on the request path.
+"""
+import logging
+import threading
+import time
+
+from config import AUTHORIZATION_SNAPSHOT_TTL
+from background import run_in_background
+from local_store import bump_generation, get_generation
+from google_sheets import get_credential_index, normalize_room_number
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class AuthorizationSnapshot:
+    """
+    In-memory copy of the database state needed to authorize a device
+
+    Admin changes bump a generation counter in the shared local store, so
+    every worker on the host reloads within GENERATION_CHECK_INTERVAL
+    instead of waiting out the TTL. A reload that read the database before
+    the change committed is followed by another one.
+    """
+
+    # Seconds between checks of the shared generation on the request path
+    GENERATION_CHECK_INTERVAL = 1
+
+    def __init__(self, loader, lookup, ttl=AUTHORIZATION_SNAPSHOT_TTL):
+        """
+        Args:
+            loader: Function returning (blocked_macs, special_users), where
+                special_users maps mobile number to (password, is_active)
+            lookup: Function (mac_address, mobile_number) returning (blocked,
+                special user tuple or None), used while no snapshot can be loaded
+            ttl: Seconds before the snapshot is reloaded in the background
+        """
+        self.loader = loader
+        self.lookup = lookup
+        self.ttl = ttl
+        self.blocked_macs = None
+        self.special_users = None
+        self.loaded_at = 0
+        self.generation = None
+        self._checked_at = 0
+        self._invalidations = 0
+        self._lock = threading.Lock()
+        self._reload_pending = False
+
+    def _current_generation(self):
+        try:
+            shared = get_generation('authorization')
+        except Exception as e:
+            logger.error(f"Error reading authorization generation: {str(e)}")
+            shared = None
+        return self._invalidations, shared
+
+    def reload(self):
+        """
+        Load a fresh snapshot from the database
+        """
+        # Read before loading, so a change committed during the load counts as newer
+        generation = self._current_generation()
+        blocked_macs, special_users = self.loader()
+        with self._lock:
+            self.blocked_macs = {mac.upper() for mac in blocked_macs if mac}
+            self.special_users = special_users
+            self.loaded_at = time.time()
+            self.generation = generation
+        logger.debug(f"Authorization snapshot loaded: {len(self.blocked_macs)} blocked devices, "
+                     f"{len(self.special_users)} special users")
+
+    def _reload_in_background(self):
+        with self._lock:
+            if self._reload_pending:
+                return
+            self._reload_pending = True
+
+        def _reload():
+            try:
+                # Go again if an invalidation arrived while loading
+                self.reload()
+                while self.generation != self._current_generation():
+                    self.reload()
+            finally:
+                self._reload_pending = False
+
+        run_in_background(_reload)
+
+    def ensure_loaded(self):
+        """
+        Load the snapshot on first use; afterwards reload stale data in the background
+
+        Returns:
+            False if no snapshot could be loaded (the caller should use lookup)
+        """
+        if self.blocked_macs is None:
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(f"Error loading authorization snapshot: {str(e)}")
+                return False
+            return True
+
+        now = time.time()
+        if now - self.loaded_at >= self.ttl:
+            self._reload_in_background()
+        elif now - self._checked_at >= self.GENERATION_CHECK_INTERVAL:
+            self._checked_at = now
+            if self._current_generation() != self.generation:
+                self._reload_in_background()
+        return True
+
+    def invalidate(self):
+        """
+        Reload as soon as possible after an admin change (block, unblock, user edit),
+        here and in the other workers
+        """
+        with self._lock:
+            self._invalidations += 1
+        try:
+            bump_generation('authorization')
+        except Exception as e:
+            logger.error(f"Error publishing authorization change: {str(e)}")
+        self._reload_in_background()
+
+
+def authorize(snapshot, mac_address, mobile_number, room_number):
+    """
+    Decide whether a device may be let online
+
+    Args:
+        snapshot: The AuthorizationSnapshot to answer from
+        mac_address: Device MAC address (optional)
+        mobile_number: Mobile number the device logs in with
+        room_number: Room number for guests, password for special users
+
+    Returns:
+        Tuple (allowed, reason)
+    """
+    if mobile_number:
+        mobile_number = mobile_number.strip()
+        if mobile_number.startswith('+'):
+            mobile_number = mobile_number[1:]
+
+    if snapshot.ensure_loaded():
+        blocked = bool(mac_address) and mac_address.upper() in snapshot.blocked_macs
+        special_user = snapshot.special_users.get(mobile_number) if mobile_number else None
+    else:
+        # No snapshot yet (database trouble at startup); ask about just this device and number
+        blocked, special_user = snapshot.lookup(mac_address, mobile_number)
+
+    if blocked:
+        return False, 'device_blocked'
+
+    if not mobile_number or not room_number:
+        return False, 'missing_credentials'
+
+    if special_user:
+        password, is_active = special_user
+        if not is_active:
+            return False, 'account_inactive'
+        return (True, 'special_user') if password == room_number else (False, 'invalid_credentials')
+
+    index = get_credential_index()
+    if index is None:
+        return False, 'sheet_unavailable'
+    if normalize_room_number(room_number) in index.get(mobile_number, ()):
+        return True, 'guest'
+    return False, 'invalid_credentials'
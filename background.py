@@ -0,0 +1,57 @@
+"""
+Background task runner
+
+Work that a request does not need to wait for (sheet refreshes, router
+housekeeping after logout) is handed to a small shared thread pool so the
+request can return immediately.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import BACKGROUND_WORKERS
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=BACKGROUND_WORKERS,
+                    thread_name_prefix='background'
+                )
+    return _executor
+
+
+def run_in_background(func, *args, **kwargs):
+    """
+    Run func(*args, **kwargs) on the background pool, logging any exception
+
+    Returns:
+        The Future for the submitted task
+    """
+    def _run():
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"Background task {func.__name__} failed: {str(e)}")
+            import traceback
+            logger.error(f"Traceback: {traceback.format_exc()}")
+
+    return _get_executor().submit(_run)
+
+
+def reset_background_executor():
+    """
+    Forget the current pool (e.g. in a freshly forked worker, where its threads do not exist)
+    """
+    global _executor
+    _executor = None
@@ -0,0 +1,183 @@
+"""
+Microbenchmarks for the credential and error-handling hot paths
+
+Measures verify_credentials (a hit near the middle of the sheet and a
+miss), normalize_room_number, get_credential_sheet cache hits and
+ErrorHandler.format_error/api_error. The synthetic sheets have 100 to
+100k rows and use realistic room formats ("R0", "f1", "1 Dorm", ...).
+
+Run from the repository root:
+
+    python benchmarks/bench_hot_paths.py
+    python benchmarks/bench_hot_paths.py --sizes 100,1000 --output results.json
+    python benchmarks/bench_hot_paths.py --compare benchmarks/results/previous.json
+
+Results are written as JSON: one entry per benchmark and sheet size,
+with per-call timings in microseconds. Use --compare to print the change
+against an earlier results file.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import timeit
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# get_credential_sheet only serves its cache when credentials are configured;
+# nothing here talks to Google
+os.environ.setdefault('GOOGLE_CREDENTIALS_JSON', '{}')
+
+from flask import Flask  # noqa: E402
+
+import google_sheets  # noqa: E402
+from error_handler import ErrorHandler, ErrorCategory  # noqa: E402
+
+DEFAULT_SIZES = (100, 1000, 10000, 100000)
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+# (format, weight) pairs in roughly the mix seen in the guesthouse sheet
+ROOM_FORMATS = (
+    ('R{n}', 30), ('r{n}', 10), ('F{n}', 10), ('f{n}', 10),
+    ('{n}', 15), ('{n} Dorm', 10), ('{n}DORM', 5), (' {n} dormitory ', 5), ('Room {n}', 5),
+)
+
+# Room inputs for the normalize_room_number benchmark, one per format branch
+ROOM_INPUTS = ('R0', 'r12', 'f1', 'F3', '7', '101', '1 Dorm', '2DORM', ' 3 dormitory ', 'Room 5', '')
+
+
+def make_sheet(size, seed=42):
+    """
+    Build synthetic sheet rows ([name, mobile, room]) like the credential sheet's
+    """
+    rng = random.Random(seed)
+    formats, weights = zip(*ROOM_FORMATS)
+    rows = []
+    for i in range(size):
+        room = rng.choices(formats, weights)[0].format(n=rng.randrange(0, 40))
+        rows.append([f"Guest {i}", f"9{rng.randrange(10 ** 9):09d}", room])
+    return rows
+
+
+def install_sheet(rows):
+    """
+    Make rows the fresh cached sheet, as after a successful fetch
+    """
+    google_sheets._sheet_data = rows
+    google_sheets._last_refresh_time = time.time()
+
+
+def measure(func, repeat):
+    """
+    Time func with timeit, auto-calibrating the loop count
+
+    Returns:
+        Dict of per-call timings in microseconds and calls per second
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    runs = [total / number * 1e6 for total in timer.repeat(repeat=repeat, number=number)]
+    return {
+        'loops': number,
+        'repeat': repeat,
+        'min_us': round(min(runs), 3),
+        'median_us': round(statistics.median(runs), 3),
+        'mean_us': round(statistics.mean(runs), 3),
+        'stdev_us': round(statistics.stdev(runs), 3) if len(runs) > 1 else 0.0,
+        'ops_per_sec': round(1e6 / min(runs), 1),
+    }
+
+
+def run_benchmarks(sizes, repeat):
+    results = []
+
+    def record(name, size, func):
+        timings = measure(func, repeat)
+        results.append(dict(name=name, rows=size, **timings))
+        print(f"{name:<38} {str(size or '-'):>7} rows  median {timings['median_us']:>12.2f} us"
+              f"  ({timings['ops_per_sec']:,.0f}/s)")
+
+    # Independent of the sheet size
+    record('normalize_room_number', None,
+           lambda: [google_sheets.normalize_room_number(room) for room in ROOM_INPUTS])
+
+    app = Flask(__name__)
+    record('ErrorHandler.format_error', None,
+           lambda: ErrorHandler.format_error(ErrorCategory.MIKROTIK, 'connection_timeout', 'Host: 10.0.0.1'))
+    record('ErrorHandler.format_error (unknown)', None,
+           lambda: ErrorHandler.format_error(ErrorCategory.MIKROTIK, 'no_such_error'))
+    with app.app_context():
+        record('ErrorHandler.api_error', None,
+               lambda: ErrorHandler.api_error(ErrorCategory.GOOGLE_SHEETS, 'api_error', 'Quota exceeded'))
+
+    for size in sizes:
+        rows = make_sheet(size)
+        install_sheet(rows)
+        _, hit_mobile, hit_room = rows[len(rows) // 2]
+
+        record('get_credential_sheet (cache hit)', size, google_sheets.get_credential_sheet)
+        record('verify_credentials (hit, mid-sheet)', size,
+               lambda: google_sheets.verify_credentials(hit_mobile, hit_room))
+        record('verify_credentials (miss)', size,
+               lambda: google_sheets.verify_credentials('9000000000', 'R99'))
+        record('get_credential_index (cached)', size, google_sheets.get_credential_index)
+
+    return results
+
+
+def compare(results, baseline_path):
+    """
+    Print the median change against an earlier results file
+    """
+    with open(baseline_path) as f:
+        baseline = {(r['name'], r['rows']): r for r in json.load(f)['results']}
+    print(f"\nChange against {baseline_path} (median, negative is faster):")
+    for result in results:
+        before = baseline.get((result['name'], result['rows']))
+        if not before or not before['median_us']:
+            continue
+        change = (result['median_us'] - before['median_us']) / before['median_us'] * 100
+        print(f"{result['name']:<38} {str(result['rows'] or '-'):>7} rows  {change:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help='Comma-separated sheet sizes (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=5, help='Timing repeats per benchmark')
+    parser.add_argument('--output', help='Results file (default: benchmarks/results/<timestamp>.json)')
+    parser.add_argument('--compare', help='Earlier results file to compare against')
+    args = parser.parse_args()
+
+    # Log records are still created (as in production) but not written anywhere
+    logging.getLogger().addHandler(logging.NullHandler())
+    logging.getLogger().setLevel(logging.INFO)
+
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    results = run_benchmarks(sizes, args.repeat)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'sizes': sizes,
+            'results': results,
+        }, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
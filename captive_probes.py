@@ -0,0 +1,88 @@
+"""
+Fast path for OS captive-portal detection probes
+
+Phones and laptops constantly request well-known URLs (Android
+generate_204, Apple hotspot-detect.html, Windows connecttest.txt, ...) to
+find out whether they are behind a captive portal. When the router sends
+these to us they are answered here, as WSGI middleware in front of Flask, so
+they never touch sessions, routing, templates or logging.
+"""
+import itertools
+
+from config import CAPTIVE_PROBE_RESPONSE, CAPTIVE_PORTAL_URL
+
+# Probe path -> probe type
+PROBE_PATHS = {
+    '/generate_204': 'android',
+    '/gen_204': 'android',
+    '/hotspot-detect.html': 'apple',
+    '/library/test/success.html': 'apple',
+    '/connecttest.txt': 'windows',
+    '/ncsi.txt': 'windows',
+    '/success.txt': 'firefox',
+    '/canonical.html': 'firefox',
+    '/kindle-wifi/wifistub.html': 'kindle',
+    '/check_network_status.txt': 'linux',
+}
+
+# Body each OS expects when the network is open (CAPTIVE_PROBE_RESPONSE=success)
+SUCCESS_RESPONSES = {
+    'android': ('204 No Content', 'text/plain', b''),
+    'apple': ('200 OK', 'text/html',
+              b'<HTML><HEAD><TITLE>Success</TITLE></HEAD><BODY>Success</BODY></HTML>'),
+    'windows': ('200 OK', 'text/plain', b'Microsoft Connect Test'),
+    'firefox': ('200 OK', 'text/plain', b'success\n'),
+    'kindle': ('200 OK', 'text/html', b'81ce4465-7167-4dcb-835b-dcc9e44c112a'),
+    'linux': ('200 OK', 'text/plain', b'NetworkManager is online\n'),
+}
+
+# Per-process hit counters; next() on itertools.count is atomic under the GIL
+_hit_counters = {probe_type: itertools.count(1) for probe_type in set(PROBE_PATHS.values())}
+_hit_counts = dict.fromkeys(_hit_counters, 0)
+
+
+def get_probe_counts():
+    """
+    Get the number of probe hits per probe type in this process
+    """
+    return dict(_hit_counts)
+
+
+class CaptiveProbeMiddleware:
+    """
+    WSGI middleware that answers captive-portal probes before Flask sees them
+    """
+
+    def __init__(self, wsgi_app, mode=CAPTIVE_PROBE_RESPONSE, portal_url=CAPTIVE_PORTAL_URL):
+        """
+        Args:
+            wsgi_app: The wrapped WSGI application
+            mode: 'redirect' sends probes to the portal, 'success' reports an open network
+            portal_url: Where to redirect probes ('/' when empty)
+        """
+        self.wsgi_app = wsgi_app
+        self.mode = mode
+        self.redirect_headers = [
+            ('Location', portal_url or '/'),
+            ('Cache-Control', 'no-store'),
+            ('Content-Length', '0'),
+        ]
+
+    def __call__(self, environ, start_response):
+        probe_type = PROBE_PATHS.get(environ.get('PATH_INFO', ''))
+        if probe_type is None:
+            return self.wsgi_app(environ, start_response)
+
+        _hit_counts[probe_type] = next(_hit_counters[probe_type])
+
+        if self.mode == 'success':
+            status, content_type, body = SUCCESS_RESPONSES[probe_type]
+            start_response(status, [
+                ('Content-Type', content_type),
+                ('Cache-Control', 'no-store'),
+                ('Content-Length', str(len(body))),
+            ])
+            return [body]
+
+        start_response('302 Found', self.redirect_headers)
+        return [b'']
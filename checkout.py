@@ -0,0 +1,163 @@
+"""
+Room checkout and guest revocation: disconnect every device of a set of guests
+
+Guests are looked up by room number (stored normalized, indexed) or by
+mobile number together with their still-open login sessions in one query.
+All of their hotspot sessions are removed in one batched router pass, then
+the login sessions are closed with a single UPDATE.
+"""
+import logging
+import re
+from datetime import datetime
+
+from sqlalchemy import and_, select, update
+
+from google_sheets import normalize_room_number
+from main import db
+from models import User, LoginSession
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+def parse_rooms(text):
+    """
+    Split a list of rooms typed by staff (separated by commas, semicolons or new lines)
+
+    Returns:
+        Sorted list of distinct normalized room numbers
+    """
+    rooms = {normalize_room_number(part) for part in re.split(r'[,;\n]', text or '')}
+    rooms.discard('')
+    return sorted(rooms)
+
+
+def _find_guests(condition):
+    """
+    Guests matching condition, with their open login sessions, from one query
+
+    Returns:
+        Dict mapping mobile number to {'room', 'session_ids', 'mac_addresses'}
+    """
+    query = select(
+        User.mobile_number, User.room_number, LoginSession.id, LoginSession.mac_address
+    ).outerjoin(
+        LoginSession, and_(LoginSession.user_id == User.id, LoginSession.logout_time.is_(None))
+    ).where(condition, User.user_type == 'guest')
+
+    guests = {}
+    for mobile_number, room, session_id, mac_address in db.session.execute(query):
+        guest = guests.setdefault(mobile_number, {'room': room, 'session_ids': [], 'mac_addresses': []})
+        if session_id is not None:
+            guest['session_ids'].append(session_id)
+        if mac_address and mac_address not in guest['mac_addresses']:
+            guest['mac_addresses'].append(mac_address)
+    return guests
+
+
+def find_room_guests(rooms):
+    """
+    Find the guests of the given rooms and their open login sessions
+
+    Args:
+        rooms: Normalized room numbers
+
+    Returns:
+        Dict mapping mobile number to {'room', 'session_ids', 'mac_addresses'}
+    """
+    return _find_guests(User.room_number.in_(rooms))
+
+
+def _disconnect(usernames, guests, router_api, batch_size):
+    """
+    Disconnect usernames on the router, then close the guests' open login sessions
+
+    Returns:
+        Tuple of (router counts, number of sessions closed)
+    """
+    router = router_api.disconnect_users(usernames, batch_size=batch_size)
+
+    session_ids = [session_id for guest in guests.values() for session_id in guest['session_ids']]
+    if not session_ids:
+        return router, 0
+    closed = db.session.execute(
+        update(LoginSession)
+        .where(LoginSession.id.in_(session_ids), LoginSession.logout_time.is_(None))
+        .values(logout_time=datetime.utcnow())
+    )
+    db.session.commit()
+    return router, closed.rowcount
+
+
+def checkout_rooms(rooms, router_api, batch_size=50):
+    """
+    Disconnect all guests of the given rooms and close their login sessions
+
+    Args:
+        rooms: Normalized room numbers (see parse_rooms)
+        router_api: MikroTikAPI used for the batched disconnect
+        batch_size: Number of router commands per batch
+
+    Returns:
+        Dict with the rooms, the guests found, the number of sessions closed
+        and the router's counts
+
+    Raises:
+        ConnectionError: If the router can't be reached; no sessions are closed
+    """
+    guests = find_room_guests(rooms)
+    result = {
+        'rooms': list(rooms),
+        'guests': sorted(guests),
+        'sessions_closed': 0,
+        'router': {'disconnected': 0, 'cookies': 0, 'failed': 0},
+    }
+    if not guests:
+        return result
+
+    result['router'], result['sessions_closed'] = _disconnect(guests, guests, router_api, batch_size)
+    logger.info(f"Checked out rooms {', '.join(rooms)}: {len(guests)} guests, "
+                f"{result['sessions_closed']} sessions closed, router {result['router']}")
+    return result
+
+
+def revoke_guests(mobile_numbers, router_api, batch_size=50):
+    """
+    Disconnect guests who are no longer allowed on the network
+
+    Numbers that belong to staff, family or friend accounts are skipped.
+    Numbers with no account here are still disconnected on the router (the
+    guest may have been provisioned from the sheet without logging in
+    through this portal).
+
+    Args:
+        mobile_numbers: Mobile numbers (hotspot usernames) to revoke
+        router_api: MikroTikAPI used for the batched disconnect
+        batch_size: Number of router commands per batch
+
+    Returns:
+        Dict with the usernames disconnected, the number of sessions closed
+        and the router's counts
+
+    Raises:
+        ConnectionError: If the router can't be reached; no sessions are closed
+    """
+    mobile_numbers = set(mobile_numbers)
+    special = set(db.session.execute(
+        select(User.mobile_number)
+        .where(User.mobile_number.in_(mobile_numbers), User.user_type != 'guest')
+    ).scalars())
+    usernames = mobile_numbers - special
+    result = {
+        'guests': sorted(usernames),
+        'sessions_closed': 0,
+        'router': {'disconnected': 0, 'cookies': 0, 'failed': 0},
+    }
+    if not usernames:
+        return result
+
+    guests = _find_guests(User.mobile_number.in_(usernames))
+    result['router'], result['sessions_closed'] = _disconnect(usernames, guests, router_api, batch_size)
+    logger.info(f"Revoked {len(usernames)} guests: {result['sessions_closed']} sessions closed, "
+                f"router {result['router']}")
+    return result
@@ -0,0 +1,137 @@
+"""
+Circuit breakers for external dependencies
+
+When the MikroTik router or the Google Sheets API is down, every call would
+otherwise wait out its own timeout. A breaker opens after a run of failures
+so callers fail fast (or serve cached data) and lets a single trial call
+through once the reset timeout has passed (half-open). A successful trial
+closes the breaker again.
+"""
+import logging
+import threading
+import time
+
+from config import (MIKROTIK_BREAKER_THRESHOLD, MIKROTIK_BREAKER_RESET,
+                    SHEETS_BREAKER_THRESHOLD, SHEETS_BREAKER_RESET)
+from error_handler import ErrorHandler, ErrorCategory
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open circuit breaker for one dependency
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, category, failure_threshold, reset_timeout):
+        """
+        Args:
+            category: The ErrorCategory of the protected dependency
+            failure_threshold: Consecutive failures that open the breaker
+            reset_timeout: Seconds to stay open before allowing a trial call
+        """
+        self.category = category
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.last_failure = None
+        self._trial_in_flight = False
+        self._trial_started_at = 0
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """
+        Check whether a call may go to the dependency now
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+                logger.info(f"Circuit breaker for {self.category} is half-open, allowing a trial call")
+            if self.state == self.HALF_OPEN:
+                # A trial whose outcome was never recorded doesn't block the next one forever
+                now = time.time()
+                if not self._trial_in_flight or now - self._trial_started_at >= self.reset_timeout:
+                    self._trial_in_flight = True
+                    self._trial_started_at = now
+                    return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit breaker for {self.category} closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self.failures += 1
+            self.last_failure = str(error) if error else None
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.error(f"Circuit breaker for {self.category} opened after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.time()
+
+    def retry_in(self):
+        """
+        Seconds until the next trial call is allowed (0 unless open)
+        """
+        if self.state != self.OPEN:
+            return 0
+        return max(0, int(self.reset_timeout - (time.time() - self.opened_at)))
+
+    def open_error(self):
+        """
+        Formatted error for callers rejected while the breaker is open
+        """
+        return ErrorHandler.format_error(
+            self.category,
+            "circuit_open",
+            f"Retrying in {self.retry_in()} seconds."
+        )
+
+    def snapshot(self):
+        """
+        Current state for the admin dashboard
+        """
+        return {
+            'category': self.category,
+            'state': self.state,
+            'failures': self.failures,
+            'retry_in': self.retry_in(),
+            'last_failure': self.last_failure,
+        }
+
+
+breakers = {
+    ErrorCategory.MIKROTIK: CircuitBreaker(
+        ErrorCategory.MIKROTIK, MIKROTIK_BREAKER_THRESHOLD, MIKROTIK_BREAKER_RESET
+    ),
+    ErrorCategory.GOOGLE_SHEETS: CircuitBreaker(
+        ErrorCategory.GOOGLE_SHEETS, SHEETS_BREAKER_THRESHOLD, SHEETS_BREAKER_RESET
+    ),
+}
+
+
+def get_breaker(category):
+    return breakers[category]
+
+
+def get_breaker_states():
+    """
+    Snapshot of every breaker, keyed by category
+    """
+    return {category: breaker.snapshot() for category, breaker in breakers.items()}
@@ -5,6 +5,8 @@ GOOGLE_CREDENTIALS_FILE = os.environ.get('GOOGLE_CREDENTIALS_FILE', 'attached_as
 SPREADSHEET_ID = os.environ.get('SPREADSHEET_ID', '176lp2Z2usUXj7x3guMmTnMikoSqkXQrXw5jLfYguEq4')
 # Use empty string for the sheet name to use the default first sheet
 SHEET_NAME = os.environ.get('SHEET_NAME', '')
+# Override the Sheets API base URL (e.g. the load-test fake); empty uses Google's
+SHEETS_API_ENDPOINT = os.environ.get('SHEETS_API_ENDPOINT', '')
 
 # MikroTik settings
 MIKROTIK_HOST = os.environ.get('MIKROTIK_HOST', '192.168.88.1') 
@@ -15,6 +17,107 @@ MIKROTIK_PASSWORD = os.environ.get('MIKROTIK_PASSWORD', '')
 # Admin credentials
 ADMIN_USERNAME = os.environ.get('ADMIN_USERNAME', 'admin')
 ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'admin123')
+MANAGE_USERS_PAGE_SIZE = int(os.environ.get('MANAGE_USERS_PAGE_SIZE', 50))  # rows per manage-users page
+IMPORT_MAX_ROWS = int(os.environ.get('IMPORT_MAX_ROWS', 5000))  # rows accepted per user CSV import
 
 # Cache settings
 SHEET_CACHE_TIMEOUT = int(os.environ.get('SHEET_CACHE_TIMEOUT', 300))  # 5 minutes
+
+# Shared local store (SQLite file used by all gunicorn workers on this host; empty = per-process memory)
+LOCAL_STORE_PATH = os.environ.get('LOCAL_STORE_PATH', '/tmp/wifi_portal_store.sqlite3')
+
+# Login throttling (attempts and failed attempts per MAC and per mobile number)
+LOGIN_RATE_LIMIT = int(os.environ.get('LOGIN_RATE_LIMIT', 10))  # failed attempts per window, 0 disables
+LOGIN_ATTEMPT_LIMIT = int(os.environ.get('LOGIN_ATTEMPT_LIMIT', 30))  # attempts of any outcome per window, 0 disables
+LOGIN_RATE_WINDOW = int(os.environ.get('LOGIN_RATE_WINDOW', 60))  # seconds
+LOGIN_LOCKOUT_SECONDS = int(os.environ.get('LOGIN_LOCKOUT_SECONDS', 300))  # 5 minutes
+
+# Background work (sheet refreshes, router housekeeping)
+BACKGROUND_WORKERS = int(os.environ.get('BACKGROUND_WORKERS', 4))
+
+# Concurrent login checks
+LOGIN_CHECK_WORKERS = int(os.environ.get('LOGIN_CHECK_WORKERS', 16))
+
+# Database connection pool, per worker process (size it for WEB_THREADS plus LOGIN_CHECK_WORKERS)
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))  # seconds to wait for a free connection
+
+# Provisioned hotspot user cache (re-seeded from the router after this many seconds)
+HOTSPOT_USER_CACHE_TTL = int(os.environ.get('HOTSPOT_USER_CACHE_TTL', 600))
+
+# Guest hotspot user pre-provisioning
+GUEST_USER_COMMENT = os.environ.get('GUEST_USER_COMMENT', 'rai-fi guest')  # tags router entries managed by the sync
+HOTSPOT_SYNC_BATCH_SIZE = int(os.environ.get('HOTSPOT_SYNC_BATCH_SIZE', 50))
+HOTSPOT_SYNC_LOCK_FILE = os.environ.get('HOTSPOT_SYNC_LOCK_FILE', '/tmp/wifi_portal_hotspot_sync.lock')
+# Disconnect guests whose rows are removed from the sheet
+REVOKE_REMOVED_GUESTS = os.environ.get('REVOKE_REMOVED_GUESTS', 'true').lower() == 'true'
+# A refresh that removes at least SHEET_MIN_SUSPECT_REMOVALS guests, and either all of them or more
+# than SHEET_MAX_REMOVED_SHARE of them, is treated as a bad read: nobody is disconnected and the
+# sync removes no accounts until the same guests have been missing for SHEET_REMOVAL_CONFIRMATIONS
+# refreshes in a row (an admin sync removes them straight away)
+SHEET_MAX_REMOVED_SHARE = float(os.environ.get('SHEET_MAX_REMOVED_SHARE', 0.5))
+SHEET_MIN_SUSPECT_REMOVALS = int(os.environ.get('SHEET_MIN_SUSPECT_REMOVALS', 5))
+SHEET_REMOVAL_CONFIRMATIONS = int(os.environ.get('SHEET_REMOVAL_CONFIRMATIONS', 3))
+
+# Machine-to-machine authorization API (disabled when no token is set)
+ROUTER_API_TOKEN = os.environ.get('ROUTER_API_TOKEN', '')
+AUTHORIZATION_SNAPSHOT_TTL = int(os.environ.get('AUTHORIZATION_SNAPSHOT_TTL', 30))  # seconds
+
+# Session storage: 'cookie' (Flask signed cookie) or 'local' (shared local store, short opaque cookie)
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'cookie')
+PORTAL_SESSION_TTL = int(os.environ.get('PORTAL_SESSION_TTL', 86400))  # 1 day
+
+# Captive-portal detection probes: 'redirect' to the portal, or 'success' to report an open network
+CAPTIVE_PROBE_RESPONSE = os.environ.get('CAPTIVE_PROBE_RESPONSE', 'redirect')
+CAPTIVE_PORTAL_URL = os.environ.get('CAPTIVE_PORTAL_URL', '')  # empty = '/' on the probed host
+
+# Circuit breakers (consecutive failures before opening, seconds before a trial call)
+MIKROTIK_BREAKER_THRESHOLD = int(os.environ.get('MIKROTIK_BREAKER_THRESHOLD', 3))
+MIKROTIK_BREAKER_RESET = int(os.environ.get('MIKROTIK_BREAKER_RESET', 30))
+SHEETS_BREAKER_THRESHOLD = int(os.environ.get('SHEETS_BREAKER_THRESHOLD', 3))
+SHEETS_BREAKER_RESET = int(os.environ.get('SHEETS_BREAKER_RESET', 60))
+
+# Per-request deadlines (seconds) and the default timeouts they cap
+REQUEST_DEADLINE = float(os.environ.get('REQUEST_DEADLINE', 10))
+LOGIN_DEADLINE = float(os.environ.get('LOGIN_DEADLINE', 3))
+EXPORT_DEADLINE = float(os.environ.get('EXPORT_DEADLINE', 600))  # streamed admin exports
+IMPORT_DEADLINE = float(os.environ.get('IMPORT_DEADLINE', 120))  # user CSV import incl. router provisioning
+HOTSPOT_SYNC_DEADLINE = float(os.environ.get('HOTSPOT_SYNC_DEADLINE', 120))  # admin-triggered full hotspot sync
+CHECKOUT_DEADLINE = float(os.environ.get('CHECKOUT_DEADLINE', 60))  # room checkout's batched router disconnect
+MIKROTIK_SOCKET_TIMEOUT = float(os.environ.get('MIKROTIK_SOCKET_TIMEOUT', 15))
+SHEETS_HTTP_TIMEOUT = float(os.environ.get('SHEETS_HTTP_TIMEOUT', 15))
+
+# Metrics (METRICS_DIR shared by all gunicorn workers; empty for a single process)
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Logging (see logging_config)
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')  # 'json' or 'text'
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_LEVELS = os.environ.get('LOG_LEVELS', '')  # e.g. "google_sheets=WARNING,mikrotik=DEBUG"
+LOG_SAMPLING = os.environ.get('LOG_SAMPLING', '')  # e.g. "google_sheets=0.1"
+LOG_FILE = os.environ.get('LOG_FILE', '')
+
+# Request tracing (TRACE_FILE shared by all workers; empty keeps traces in memory only)
+TRACE_SLOW_THRESHOLD_MS = float(os.environ.get('TRACE_SLOW_THRESHOLD_MS', 1000))
+TRACE_BUFFER_SIZE = int(os.environ.get('TRACE_BUFFER_SIZE', 100))
+TRACE_FILE = os.environ.get('TRACE_FILE', '')
+
+# On-demand profiler (PROFILE_DIR shared by all workers)
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/tmp/wifi_portal_profiles')
+PROFILE_INTERVAL_MS = int(os.environ.get('PROFILE_INTERVAL_MS', 10))
+PROFILE_MAX_SECONDS = int(os.environ.get('PROFILE_MAX_SECONDS', 300))
+
+# gunicorn (see gunicorn.conf.py)
+WEB_BIND = os.environ.get('WEB_BIND', '0.0.0.0:5000')
+WEB_WORKERS = int(os.environ.get('WEB_WORKERS', 2))
+WEB_THREADS = int(os.environ.get('WEB_THREADS', 8))
+WEB_WORKER_CLASS = os.environ.get('WEB_WORKER_CLASS', 'gthread')
+WEB_TIMEOUT = int(os.environ.get('WEB_TIMEOUT', 30))
+WEB_MAX_REQUESTS = int(os.environ.get('WEB_MAX_REQUESTS', 5000))  # recycle workers after this many requests, 0 disables
+WEB_MAX_REQUESTS_JITTER = int(os.environ.get('WEB_MAX_REQUESTS_JITTER', 500))
+# Import the app once in the gunicorn master and fork it (on by default in gunicorn.conf.py; turn off for --reload).
+# Startup work then runs in each worker instead (see app.init_worker)
+PRELOAD_APP = os.environ.get('PRELOAD_APP', 'false').lower() == 'true'
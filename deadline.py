@@ -0,0 +1,126 @@
+"""
+Per-request deadlines
+
+Each request gets a time budget (LOGIN_DEADLINE for /login, REQUEST_DEADLINE
+otherwise). Downstream calls turn what is left of it into their own limits:
+RouterOS socket timeouts, Sheets HTTP timeouts and the Postgres
+statement_timeout. One slow dependency can no longer hold a login for tens
+of seconds. Work outside a request (background refreshes, the hotspot sync)
+has no deadline and uses each dependency's default timeout.
+"""
+import contextvars
+import logging
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import (REQUEST_DEADLINE, LOGIN_DEADLINE, EXPORT_DEADLINE, IMPORT_DEADLINE, HOTSPOT_SYNC_DEADLINE,
+                    CHECKOUT_DEADLINE)
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Budgets per Flask endpoint; anything not listed gets REQUEST_DEADLINE
+ENDPOINT_DEADLINES = {
+    'login': LOGIN_DEADLINE,
+    # Streams whole tables; the response body is generated inside this budget
+    'admin_export': EXPORT_DEADLINE,
+    # One upsert plus, optionally, batched router writes for every imported user
+    'admin_import_users': IMPORT_DEADLINE,
+    # Full-sheet and batched router writes
+    'api_sync_hotspot_users': HOTSPOT_SYNC_DEADLINE,
+    'api_checkout_rooms': CHECKOUT_DEADLINE,
+}
+
+_current_deadline = contextvars.ContextVar('request_deadline', default=None)
+
+# Shortest statement_timeout applied: once a slow Sheets check has spent the
+# budget, the login's small User/LoginSession writes should still go through
+STATEMENT_TIMEOUT_FLOOR_MS = 500
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when a call is attempted after the request's budget has run out
+    """
+
+
+def start_deadline(budget):
+    """
+    Start a deadline of budget seconds for the current context
+
+    Work submitted to a thread pool only sees it if submitted through
+    contextvars.copy_context().run.
+    """
+    _current_deadline.set(time.monotonic() + budget)
+
+
+def clear_deadline():
+    _current_deadline.set(None)
+
+
+def time_remaining():
+    """
+    Seconds left in the current deadline, or None outside a deadline
+    """
+    expires_at = _current_deadline.get()
+    if expires_at is None:
+        return None
+    return max(0.0, expires_at - time.monotonic())
+
+
+def deadline_expired():
+    remaining = time_remaining()
+    return remaining is not None and remaining <= 0
+
+
+def timeout_for(default):
+    """
+    Timeout to use for a downstream call
+
+    Args:
+        default: The dependency's own timeout in seconds
+
+    Returns:
+        The smaller of default and the time left in the deadline
+
+    Raises:
+        DeadlineExceeded: If the deadline has already run out
+    """
+    remaining = time_remaining()
+    if remaining is None:
+        return default
+    if remaining <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return min(default, remaining)
+
+
+def start_request_deadline(endpoint):
+    """
+    Start the deadline for a Flask endpoint
+    """
+    start_deadline(ENDPOINT_DEADLINES.get(endpoint, REQUEST_DEADLINE))
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _apply_statement_timeout(conn, cursor, statement, parameters, context, executemany):
+    """
+    Bound Postgres statements by the time left in the request, once per transaction
+
+    Never below STATEMENT_TIMEOUT_FLOOR_MS, so writes degrade to a short
+    limit instead of failing outright when the budget is already spent.
+    """
+    if conn.dialect.name != 'postgresql' or conn.info.get('deadline_applied'):
+        return
+    remaining = time_remaining()
+    if remaining is None:
+        return
+    cursor.execute(f"SET LOCAL statement_timeout = {max(STATEMENT_TIMEOUT_FLOOR_MS, int(remaining * 1000))}")
+    conn.info['deadline_applied'] = True
+
+
+@event.listens_for(Engine, 'commit')
+@event.listens_for(Engine, 'rollback')
+def _reset_statement_timeout(conn):
+    conn.info.pop('deadline_applied', None)
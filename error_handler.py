@@ -63,6 +63,16 @@ class ErrorHandler:
                 ],
                 "admin_note": "Review the specific API error in the logs for more details.",
                 "is_critical": False
+            },
+            "circuit_open": {
+                "title": "Router Temporarily Unavailable",
+                "message": "The WiFi router is not responding, so requests to it are paused.",
+                "suggestions": [
+                    "Please try again in a minute.",
+                    "If the problem persists, contact the reception."
+                ],
+                "admin_note": "The MikroTik circuit breaker is open after repeated failures. Check the router and the admin dashboard.",
+                "is_critical": False
             }
         },
         ErrorCategory.GOOGLE_SHEETS: {
@@ -96,6 +106,26 @@ class ErrorHandler:
                 ],
                 "admin_note": "Consider implementing exponential backoff for Google API calls.",
                 "is_critical": False
+            },
+            "request_timeout": {
+                "title": "Guest Verification Timed Out",
+                "message": "Verifying your details is taking longer than expected.",
+                "suggestions": [
+                    "Please wait a moment and try logging in again.",
+                    "If the problem persists, contact the reception."
+                ],
+                "admin_note": "The Google Sheets lookup exceeded LOGIN_DEADLINE. Check connectivity to the Sheets API.",
+                "is_critical": False
+            },
+            "circuit_open": {
+                "title": "Guest List Temporarily Unavailable",
+                "message": "The guest list service is not responding, so requests to it are paused.",
+                "suggestions": [
+                    "Please try again in a minute.",
+                    "If the problem persists, contact the reception."
+                ],
+                "admin_note": "The Google Sheets circuit breaker is open after repeated failures. Cached sheet data is served meanwhile.",
+                "is_critical": False
             }
         },
         ErrorCategory.DATABASE: {
@@ -145,6 +175,17 @@ class ErrorHandler:
                 ],
                 "admin_note": "Check blocked_devices table for the specific reason.",
                 "is_critical": True
+            },
+            "too_many_attempts": {
+                "title": "Too Many Login Attempts",
+                "message": "Too many login attempts from this device or mobile number.",
+                "suggestions": [
+                    "Please wait a few minutes before trying again.",
+                    "Double-check your mobile number and room number before retrying.",
+                    "If you still cannot log in, please contact the reception."
+                ],
+                "admin_note": "Login throttling is controlled by LOGIN_RATE_LIMIT, LOGIN_ATTEMPT_LIMIT, LOGIN_RATE_WINDOW and LOGIN_LOCKOUT_SECONDS.",
+                "is_critical": False
             }
         },
         ErrorCategory.NETWORK: {
@@ -182,6 +223,15 @@ class ErrorHandler:
                 ],
                 "admin_note": "This is shown during scheduled maintenance periods.",
                 "is_critical": True
+            },
+            "invalid_input": {
+                "title": "Invalid Input",
+                "message": "Some of the values you entered are not valid.",
+                "suggestions": [
+                    "Correct the values mentioned above and try again."
+                ],
+                "admin_note": "A form or API request failed validation.",
+                "is_critical": False
             }
         }
     }
@@ -4,8 +4,19 @@ import time
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from google_auth_httplib2 import AuthorizedHttp
+import httplib2
 import json
-from config import GOOGLE_CREDENTIALS_FILE, SPREADSHEET_ID, SHEET_NAME, SHEET_CACHE_TIMEOUT
+import threading
+from config import (GOOGLE_CREDENTIALS_FILE, SPREADSHEET_ID, SHEET_NAME, SHEET_CACHE_TIMEOUT, SHEETS_HTTP_TIMEOUT,
+                    SHEETS_API_ENDPOINT, SHEET_MAX_REMOVED_SHARE, SHEET_MIN_SUSPECT_REMOVALS,
+                    SHEET_REMOVAL_CONFIRMATIONS)
+from deadline import DeadlineExceeded, deadline_expired, timeout_for
+from background import run_in_background
+from circuit_breaker import get_breaker
+from error_handler import ErrorCategory
+from metrics import timed, track_dependency, cache_requests_total, sheet_rows, sheet_changes_total
+from tracing import span, traced
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -13,6 +24,22 @@ logger = logging.getLogger(__name__)
 # Cache for sheet data
 _sheet_data = None
 _last_refresh_time = 0
+_refresh_lock = threading.Lock()
+_refresh_pending = False
+# Held while fetching, so threads that miss the cache together share one fetch
+_fetch_lock = threading.Lock()
+
+# Callbacks run when the sheet contents change
+_sheet_listeners = []
+# Callbacks run with a SheetChange when guests are added, removed or change room
+_sheet_change_listeners = []
+# Last snapshot whose change was emitted; changes are always diffed against it
+_emitted_rows = None
+# Mobile numbers of a held mass removal, and how many refreshes in a row have shown it
+_held_removal = (frozenset(), 0)
+
+# Lookup index built from _sheet_data, as (source rows, index) (see get_credential_index)
+_credential_index = (None, None)
 
 def _get_credentials():
     """
@@ -50,6 +77,8 @@ def _get_credentials():
         logger.error(f"Error loading Google credentials: {str(e)}")
         return None
 
+@timed('get_credential_sheet')
+@traced('get_credential_sheet')
 def get_credential_sheet(force_refresh=False):
     """
     Fetch data from Google Sheets
@@ -60,24 +89,109 @@ def get_credential_sheet(force_refresh=False):
     Returns:
         List of rows from the sheet
     """
-    global _sheet_data, _last_refresh_time
-    
     current_time = time.time()
     
-    # Print configuration settings for debugging
-    logger.info(f"Google Sheet Configuration - SPREADSHEET_ID: {SPREADSHEET_ID}, SHEET_NAME: {SHEET_NAME}")
-    
     # Check for credentials
     if not os.path.exists(GOOGLE_CREDENTIALS_FILE) and not os.environ.get('GOOGLE_CREDENTIALS_JSON'):
         logger.error("No Google credentials found - neither file nor environment variable")
         logger.info("Expected credentials file path: " + os.path.abspath(GOOGLE_CREDENTIALS_FILE))
         return []
     
-    # Return cached data if available and not expired
-    if not force_refresh and _sheet_data is not None and (current_time - _last_refresh_time) < SHEET_CACHE_TIMEOUT:
-        logger.info(f"Using cached sheet data ({len(_sheet_data)} rows, cache age: {(current_time - _last_refresh_time):.1f}s)")
+    # Return cached data if available
+    if not force_refresh and _sheet_data is not None:
+        cache_age = current_time - _last_refresh_time
+        if cache_age < SHEET_CACHE_TIMEOUT:
+            cache_requests_total.inc(cache='sheet', result='hit')
+            logger.debug("Using cached sheet data (%d rows, cache age: %.1fs)", len(_sheet_data), cache_age)
+            return _sheet_data
+        
+        # Serve the stale copy and refresh without blocking the request
+        schedule_sheet_refresh()
+        cache_requests_total.inc(cache='sheet', result='stale')
+        logger.debug("Serving stale sheet data (%d rows, cache age: %.1fs) while refreshing", len(_sheet_data), cache_age)
         return _sheet_data
     
+    cache_requests_total.inc(cache='sheet', result='miss')
+    return _fetch_sheet_data_once(force_refresh)
+
+def _fetch_sheet_data_once(force_refresh=False):
+    """
+    Fetch the sheet unless another thread is already doing so, then share its result
+    
+    Waiting is bounded by the request deadline (or SHEETS_HTTP_TIMEOUT).
+    """
+    started = time.time()
+    fetch_lock = _fetch_lock
+    try:
+        acquired = fetch_lock.acquire(timeout=timeout_for(SHEETS_HTTP_TIMEOUT))
+    except DeadlineExceeded:
+        acquired = False
+    if not acquired:
+        logger.warning("Timed out waiting for a Google Sheets fetch in another thread, serving cached data")
+        return _sheet_data or []
+    try:
+        # Another thread refreshed the cache while we waited
+        if _sheet_data is not None and _last_refresh_time >= started and not force_refresh:
+            return _sheet_data
+        return _fetch_sheet_data()
+    finally:
+        fetch_lock.release()
+
+def schedule_sheet_refresh():
+    """
+    Refresh the sheet cache on the background pool
+    
+    Only one refresh runs at a time per process; extra calls while a refresh
+    is pending are ignored.
+    """
+    global _refresh_pending
+    
+    with _refresh_lock:
+        if _refresh_pending:
+            return
+        _refresh_pending = True
+    
+    def _refresh():
+        global _refresh_pending
+        try:
+            _fetch_sheet_data_once()
+        finally:
+            _refresh_pending = False
+    
+    run_in_background(_refresh)
+
+def reset_refresh_state():
+    """
+    Forget refresh bookkeeping inherited from the parent process (e.g. after fork)
+    
+    A refresh running in the parent when it forked never finishes here, and
+    its locks would stay held.
+    """
+    global _refresh_lock, _refresh_pending, _fetch_lock
+    _refresh_lock = threading.Lock()
+    _fetch_lock = threading.Lock()
+    _refresh_pending = False
+
+def _fetch_sheet_data():
+    """
+    Fetch the sheet from the Google Sheets API and update the cache
+    
+    Returns:
+        List of rows from the sheet, or an empty list on error
+    """
+    global _sheet_data, _last_refresh_time
+    
+    try:
+        http_timeout = timeout_for(SHEETS_HTTP_TIMEOUT)
+    except DeadlineExceeded:
+        logger.warning("Request deadline exceeded before fetching Google Sheets, serving cached data")
+        return _sheet_data or []
+    
+    breaker = get_breaker(ErrorCategory.GOOGLE_SHEETS)
+    if not breaker.allow_request():
+        logger.warning(f"Google Sheets circuit breaker is open (retry in {breaker.retry_in()}s), serving cached data")
+        return _sheet_data or []
+    
     logger.info("Fetching fresh data from Google Sheets...")
     
     try:
@@ -86,7 +200,10 @@ def get_credential_sheet(force_refresh=False):
             logger.error("Failed to obtain Google credentials despite files existing")
             return []
         
-        service = build('sheets', 'v4', credentials=credentials)
+        # Bound the HTTP call by the request deadline (or SHEETS_HTTP_TIMEOUT)
+        http = AuthorizedHttp(credentials, http=httplib2.Http(timeout=http_timeout))
+        client_options = {'api_endpoint': SHEETS_API_ENDPOINT} if SHEETS_API_ENDPOINT else None
+        service = build('sheets', 'v4', http=http, client_options=client_options)
         sheet = service.spreadsheets()
         
         # Request specific columns for better performance
@@ -95,12 +212,14 @@ def get_credential_sheet(force_refresh=False):
         logger.info(f"Requesting sheet range: {range_name}")
         
         # Call the Sheets API
-        result = sheet.values().get(
-            spreadsheetId=SPREADSHEET_ID,
-            range=range_name
-        ).execute()
+        with track_dependency('google_sheets', 'values.get'), span('sheets values.get', range=range_name):
+            result = sheet.values().get(
+                spreadsheetId=SPREADSHEET_ID,
+                range=range_name
+            ).execute()
         
         values = result.get('values', [])
+        breaker.record_success()
         
         if not values:
             logger.warning('No data found in the Google Sheet')
@@ -109,7 +228,6 @@ def get_credential_sheet(force_refresh=False):
         # Log sheet structure for debugging
         if len(values) > 0:
             logger.info(f"Sheet has {len(values)} rows")
-            logger.info(f"First row (likely headers): {values[0]}")
             
             # Skip header row if present
             has_header = False
@@ -131,8 +249,14 @@ def get_credential_sheet(force_refresh=False):
                 else:
                     logger.info(f"Sample data format OK: {len(data_rows[0])} columns in first row")
             
+            previous_rows = _sheet_data
             _sheet_data = data_rows
-            _last_refresh_time = current_time
+            sheet_rows.set(len(data_rows))
+            _last_refresh_time = time.time()
+            
+            if data_rows != previous_rows:
+                _notify_sheet_listeners(data_rows)
+            _emit_sheet_change(data_rows)
             return _sheet_data
         else:
             logger.warning("Sheet returned empty data")
@@ -143,16 +267,236 @@ def get_credential_sheet(force_refresh=False):
         # More specific error messages for common issues
         if "404" in str(e):
             logger.error(f"Sheet not found. Check SPREADSHEET_ID: {SPREADSHEET_ID}")
+            breaker.record_success()
         elif "403" in str(e):
             logger.error("Permission denied. Make sure the service account has access to the sheet.")
+            breaker.record_success()
+        else:
+            # Rate limits and server errors: back off
+            breaker.record_failure(e)
         return []
     
     except Exception as e:
         logger.error(f"Error fetching sheet data: {str(e)}")
         import traceback
         logger.error(f"Traceback: {traceback.format_exc()}")
+        # Running out of our own request budget says nothing about Google's health
+        if not deadline_expired():
+            breaker.record_failure(e)
         return []
 
+def get_credential_index():
+    """
+    Get an in-memory index of the cached sheet for constant-time lookups
+    
+    Never blocks on Google: stale data is served while a background refresh
+    runs, and None is returned if no data has been loaded yet.
+    
+    Returns:
+        Dict mapping mobile number to a set of normalized room numbers, or None
+    """
+    rows = _sheet_data
+    if rows is None:
+        schedule_sheet_refresh()
+        return None
+    if time.time() - _last_refresh_time >= SHEET_CACHE_TIMEOUT:
+        schedule_sheet_refresh()
+    
+    return _index_for(rows)
+
+def _index_for(rows):
+    """
+    Index rows by mobile number, reusing the cached index while rows are unchanged
+    
+    Returns:
+        Dict mapping mobile number to a set of normalized room numbers
+    """
+    global _credential_index
+    
+    source, index = _credential_index
+    if source is not rows:
+        index = {}
+        for row in rows:
+            if len(row) < 3:
+                continue
+            mobile = str(row[1]).strip()
+            if mobile.startswith('+'):
+                mobile = mobile[1:]
+            index.setdefault(mobile, set()).add(normalize_room_number(row[2]))
+        # One assignment, so concurrent readers never pair an index with the wrong rows
+        _credential_index = (rows, index)
+    return index
+
+def add_sheet_listener(callback):
+    """
+    Register a callback to run whenever a refresh returns different sheet data
+    
+    Args:
+        callback: Function called with the new list of data rows
+    """
+    _sheet_listeners.append(callback)
+
+def _notify_sheet_listeners(rows):
+    """
+    Run the sheet listeners on the background pool so the caller never waits on them
+    """
+    for callback in _sheet_listeners:
+        run_in_background(callback, rows)
+
+def add_sheet_change_listener(callback):
+    """
+    Register a callback to run when a refresh adds, removes or moves guests
+    
+    Not called for the first snapshot a process loads, which has nothing to
+    compare with.
+    
+    Args:
+        callback: Function called with the SheetChange
+    """
+    _sheet_change_listeners.append(callback)
+
+def is_mass_removal(removed, before):
+    """
+    Whether removing this many of the guests looks like a bad read rather than departures
+    
+    An empty or truncated read (header only, short range) drops many guests
+    at once. Small sheets are exempt: removing the last guest or two of a
+    handful is normal turnover.
+    
+    Args:
+        removed: Number of guests removed
+        before: Number of guests before the removal
+        
+    Returns:
+        True if the removal should be held back
+    """
+    return removed >= SHEET_MIN_SUSPECT_REMOVALS and (
+        removed >= before or removed > SHEET_MAX_REMOVED_SHARE * before)
+
+def _emit_sheet_change(rows):
+    """
+    Diff a refreshed snapshot against the last emitted one and notify the change listeners
+    
+    The first snapshot a process loads only becomes the baseline. A mass
+    removal (see is_mass_removal) is held: the baseline stays where it was,
+    so the same removals are diffed again on the next refresh instead of
+    being lost. They are emitted, with change.confirmed set, once the same
+    guests have been missing for SHEET_REMOVAL_CONFIRMATIONS refreshes in a row.
+    
+    Args:
+        rows: The refreshed snapshot's data rows
+    """
+    global _emitted_rows, _held_removal
+    
+    baseline = _emitted_rows
+    if baseline is None or rows == baseline:
+        _emitted_rows = rows
+        _held_removal = (frozenset(), 0)
+        return
+    
+    change = diff_sheet_rows(baseline, rows)
+    if change.removed:
+        before = len(guest_hotspot_credentials(baseline))
+        if is_mass_removal(len(change.removed), before):
+            removed = frozenset(change.removed)
+            held, seen = _held_removal
+            seen = seen + 1 if removed == held else 1
+            if seen < SHEET_REMOVAL_CONFIRMATIONS:
+                _held_removal = (removed, seen)
+                logger.warning(f"Sheet refresh removed {len(removed)} of {before} guests; "
+                               f"holding the change until it is seen {SHEET_REMOVAL_CONFIRMATIONS} times "
+                               f"in a row ({seen} so far)")
+                return
+            logger.warning(f"Removal of {len(removed)} of {before} guests seen {seen} times in a row; "
+                           f"emitting it")
+            change.confirmed = True
+    
+    _emitted_rows = rows
+    _held_removal = (frozenset(), 0)
+    if change:
+        _notify_sheet_change_listeners(change)
+
+def _notify_sheet_change_listeners(change):
+    """
+    Count the change and run the change listeners on the background pool
+    """
+    logger.info(f"Sheet changed: {change}")
+    for kind in ('added', 'removed', 'changed'):
+        if getattr(change, kind):
+            sheet_changes_total.inc(len(getattr(change, kind)), change=kind)
+    for callback in _sheet_change_listeners:
+        run_in_background(callback, change)
+
+class SheetChange:
+    """
+    Difference between two sheet snapshots, per guest mobile number
+    
+    Attributes:
+        added: Dict of new guests, mobile number -> room
+        removed: Dict of guests no longer listed, mobile number -> their last room
+        changed: Dict of guests whose room changed, mobile number -> (old room, new room)
+        confirmed: True for a mass removal emitted only after it was seen on
+            several refreshes in a row (see _emit_sheet_change)
+    """
+    
+    def __init__(self, added, removed, changed):
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+        self.confirmed = False
+    
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+    
+    def __repr__(self):
+        return (f"<SheetChange added={len(self.added)} removed={len(self.removed)} "
+                f"changed={len(self.changed)}>")
+
+def diff_sheet_rows(previous_rows, rows):
+    """
+    Compare two sheet snapshots as sets of guests
+    
+    Rows are reduced to mobile number -> normalized room first (as for the
+    hotspot sync), so edits to names or formatting that don't change a
+    guest's credentials are not reported.
+    
+    Args:
+        previous_rows: The earlier snapshot's data rows
+        rows: The new snapshot's data rows
+        
+    Returns:
+        SheetChange
+    """
+    before = guest_hotspot_credentials(previous_rows)
+    after = guest_hotspot_credentials(rows)
+    added = {mobile: after[mobile] for mobile in after.keys() - before.keys()}
+    removed = {mobile: before[mobile] for mobile in before.keys() - after.keys()}
+    changed = {mobile: (before[mobile], after[mobile])
+               for mobile in before.keys() & after.keys() if before[mobile] != after[mobile]}
+    return SheetChange(added, removed, changed)
+
+def guest_hotspot_credentials(rows):
+    """
+    Build the hotspot credentials every guest in the sheet should have
+    
+    Args:
+        rows: Sheet data rows (name, mobile number, room number)
+        
+    Returns:
+        Dict mapping mobile number to normalized room number (the hotspot password)
+    """
+    credentials = {}
+    for row in rows:
+        if len(row) < 3:
+            continue
+        mobile = str(row[1]).strip()
+        if mobile.startswith('+'):
+            mobile = mobile[1:]
+        room = normalize_room_number(row[2])
+        if mobile and room:
+            credentials[mobile] = room
+    return credentials
+
 def normalize_room_number(room_number):
     """
     Normalize room number for comparison by removing spaces and converting to uppercase
@@ -172,7 +516,7 @@ def normalize_room_number(room_number):
     normalized = str(room_number).strip().upper()
     
     # Log original value for debugging
-    logger.debug(f"Normalizing room number: '{room_number}' -> initial '{normalized}'")
+    logger.debug("Normalizing room number: '%s' -> initial '%s'", room_number, normalized)
     
     # Handle dormitory format patterns
     dorm_pattern = re.search(r'(\d+)\s*(?:DORM|DORMITORY)', normalized)
@@ -180,13 +524,13 @@ def normalize_room_number(room_number):
         # If we have a clear match with the regex
         if dorm_pattern:
             result = f"{dorm_pattern.group(1)}DORM"
-            logger.debug(f"Dormitory format detected: {normalized} -> {result}")
+            logger.debug("Dormitory format detected: %s -> %s", normalized, result)
             return result
         
         # Otherwise try to extract just the number
         for digit in re.findall(r'\d+', normalized):
             result = f"{digit}DORM"
-            logger.debug(f"Extracted dormitory number: {normalized} -> {result}")
+            logger.debug("Extracted dormitory number: %s -> %s", normalized, result)
             return result
         
         # If still no match, return as is
@@ -199,14 +543,14 @@ def normalize_room_number(room_number):
     r_pattern = re.match(r'^[rR](\d+)$', normalized)
     if r_pattern:
         result = f"R{r_pattern.group(1)}"
-        logger.debug(f"Room format detected: {normalized} -> {result}")
+        logger.debug("Room format detected: %s -> %s", normalized, result)
         return result
     
     # Handle lowercase f prefix (e.g., "f1" -> "F1")
     f_pattern = re.match(r'^[fF](\d+)$', normalized)
     if f_pattern:
         result = f"F{f_pattern.group(1)}"
-        logger.debug(f"Floor format detected: {normalized} -> {result}")
+        logger.debug("Floor format detected: %s -> %s", normalized, result)
         return result
     
     # If it's just a digit, assume it's a room number
@@ -214,12 +558,14 @@ def normalize_room_number(room_number):
         if len(normalized) == 1:
             # Single digit is likely room number
             result = f"R{normalized}"
-            logger.debug(f"Single digit treated as room: {normalized} -> {result}")
+            logger.debug("Single digit treated as room: %s -> %s", normalized, result)
             return result
     
-    logger.debug(f"No special formatting applied, using: {normalized}")
+    logger.debug("No special formatting applied, using: %s", normalized)
     return normalized
 
+@timed('verify_credentials')
+@traced('verify_credentials')
 def verify_credentials(mobile_number, room_number):
     """
     Verify the provided mobile number and room number against the Google Sheet
@@ -236,7 +582,7 @@ def verify_credentials(mobile_number, room_number):
         logger.warning("Missing mobile number or room number")
         return False
     
-    logger.info(f"Validating credentials - Mobile: {mobile_number}, Room: {room_number}")
+    logger.debug("Validating credentials - Mobile: %s, Room: %s", mobile_number, room_number)
     
     # Standardize mobile number format
     mobile_number = mobile_number.strip()
@@ -245,11 +591,8 @@ def verify_credentials(mobile_number, room_number):
     
     # Normalize room number format 
     normalized_input_room = normalize_room_number(room_number)
-    logger.info(f"Normalized room number: {room_number} -> {normalized_input_room}")
     
     try:
-        # Get sheet data with added debugging
-        logger.info("Fetching Google Sheet data for validation...")
         sheet_data = get_credential_sheet()
         
         if not sheet_data:
@@ -259,68 +602,23 @@ def verify_credentials(mobile_number, room_number):
             logger.warning("Temporarily allowing login without sheet validation during development")
             return True
         
-        logger.info(f"Loaded {len(sheet_data)} rows from sheet for validation")
-        
-        # Log first few entries from sheet for debugging (without exposing all data)
-        if len(sheet_data) > 0:
-            sample_size = min(3, len(sheet_data))
-            logger.info(f"Sample data (first {sample_size} rows):")
-            for i in range(sample_size):
-                if i < len(sheet_data):
-                    row = sheet_data[i]
-                    # Mask mobile numbers for privacy in logs
-                    if len(row) >= 2:
-                        masked_mobile = "**" + row[1][-4:] if len(row[1]) > 4 else row[1]
-                        logger.info(f"Row {i}: {row[0][:10]}..., Mobile: {masked_mobile}, Room: {row[2] if len(row) > 2 else 'N/A'}")
-        
-        # Check each row for a match
-        match_found = False
-        mobile_matches = []
-        room_matches = []
-        
-        for i, row in enumerate(sheet_data):
-            # Skip if row doesn't have enough data
-            if len(row) < 3:
-                logger.warning(f"Row {i} has incomplete data: {row}")
-                continue
-            
-            # Extract and clean data
-            sheet_mobile = str(row[1]).strip()
-            sheet_room = str(row[2]).strip()
-            
-            # Remove country code if present
-            if sheet_mobile.startswith('+'):
-                sheet_mobile = sheet_mobile[1:]
-            
-            # Normalize room number for comparison
-            normalized_sheet_room = normalize_room_number(sheet_room)
-            
-            # Track partial matches for better error messages
-            if sheet_mobile == mobile_number:
-                mobile_matches.append((sheet_room, normalized_sheet_room))
-            
-            if normalized_sheet_room == normalized_input_room:
-                room_matches.append(sheet_mobile)
-            
-            # Check for exact match
-            if sheet_mobile == mobile_number and normalized_sheet_room == normalized_input_room:
-                logger.info(f"MATCH FOUND: Mobile: {mobile_number}, Room: {normalized_input_room}")
-                match_found = True
-                break
+        # Constant-time lookup in the index of this sheet data (built once per refresh)
+        rooms = _index_for(sheet_data).get(mobile_number, ())
+        if normalized_input_room in rooms:
+            logger.debug("Match found: Mobile: %s, Room: %s", mobile_number, normalized_input_room)
+            return True
         
-        # Detailed log if no match found
-        if not match_found:
-            if mobile_matches:
-                logger.info(f"Mobile number {mobile_number} found, but with different rooms: {mobile_matches}")
+        # Partial matches are only collected when someone is reading debug logs
+        if logger.isEnabledFor(logging.DEBUG):
+            if rooms:
+                logger.debug("Mobile number %s found, but with different rooms: %s", mobile_number, sorted(rooms))
+            room_matches = [mobile for mobile, mobile_rooms in _index_for(sheet_data).items()
+                            if normalized_input_room in mobile_rooms]
             if room_matches:
-                logger.info(f"Room {normalized_input_room} found, but with different mobile numbers: {room_matches}")
-            if not mobile_matches and not room_matches:
-                logger.info(f"No matches found for either mobile or room")
-            
-            logger.warning(f"Validation failed for mobile: {mobile_number}, room: {normalized_input_room}")
-            return False
+                logger.debug("Room %s found, but with different mobile numbers: %s", normalized_input_room, room_matches)
         
-        return match_found
+        logger.warning("Validation failed for mobile: %s, room: %s", mobile_number, normalized_input_room)
+        return False
     
     except Exception as e:
         logger.error(f"Error during credential verification: {str(e)}")
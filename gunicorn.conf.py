@@ -0,0 +1,52 @@
+"""
+gunicorn settings for production
+
+    gunicorn main:app          (this file is read from the working directory)
+
+Threaded (gthread) workers: a request waiting on the router or on Google
+no longer holds up a whole worker, only one of its WEB_THREADS threads.
+The app is imported once in the master (preload_app) and forked, so
+workers start quickly and share the master's memory pages. post_fork then
+gives each worker its own sockets, pools, locks and background threads
+(see app.init_worker). Workers are recycled after WEB_MAX_REQUESTS
+requests, with jitter so they don't all restart at once.
+
+All settings come from config.py and can be overridden by environment
+variables or on the gunicorn command line. The reloader can't be used
+with preloading; for development run
+
+    PRELOAD_APP=false gunicorn --reload main:app
+"""
+import os
+
+# Preload unless told otherwise; set before config is imported below (and by the app)
+os.environ.setdefault('PRELOAD_APP', 'true')
+
+from config import (WEB_BIND, WEB_WORKERS, WEB_THREADS, WEB_WORKER_CLASS, WEB_TIMEOUT,  # noqa: E402
+                    WEB_MAX_REQUESTS, WEB_MAX_REQUESTS_JITTER, PRELOAD_APP)
+
+bind = WEB_BIND
+workers = WEB_WORKERS
+worker_class = WEB_WORKER_CLASS
+threads = WEB_THREADS
+timeout = WEB_TIMEOUT
+graceful_timeout = WEB_TIMEOUT
+keepalive = 5
+max_requests = WEB_MAX_REQUESTS
+max_requests_jitter = WEB_MAX_REQUESTS_JITTER
+preload_app = PRELOAD_APP
+
+
+def post_fork(server, worker):
+    if not PRELOAD_APP:
+        # The worker imports the app itself, with nothing inherited to reset
+        return
+    from app import init_worker
+    init_worker()
+    server.log.info(f"Worker {worker.pid} initialized")
+
+
+def child_exit(server, worker):
+    # Recycled workers would otherwise leave their metrics file behind
+    from metrics import mark_process_dead
+    mark_process_dead(worker.pid)
@@ -0,0 +1,98 @@
+"""
+Pre-provisioning of guest hotspot users
+
+Whenever the guest sheet changes, the guests it lists are pushed to the
+router's /ip/hotspot/user table ahead of arrival, and guests who have left
+the sheet are removed. A guest's login then only needs a local check and the
+MikroTik redirect.
+"""
+import fcntl
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from config import GUEST_USER_COMMENT, HOTSPOT_SYNC_BATCH_SIZE, HOTSPOT_SYNC_LOCK_FILE
+from config import SHEET_CACHE_TIMEOUT
+from google_sheets import guest_hotspot_credentials, is_mass_removal
+from local_store import get_store
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _sync_lock():
+    """
+    Host-wide lock so only one gunicorn worker syncs the router at a time
+
+    Yields:
+        True if the lock was acquired, False if another worker holds it
+    """
+    with open(HOTSPOT_SYNC_LOCK_FILE, 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def sync_guest_hotspot_users(mikrotik_api, rows, guarded=True):
+    """
+    Provision the router's guest hotspot users from sheet rows
+
+    Args:
+        mikrotik_api: The MikroTikAPI instance to sync
+        rows: Sheet data rows (name, mobile number, room number)
+        guarded: Hold back mass removals, by the same rule as sheet changes
+            (see google_sheets.is_mass_removal); an admin-triggered sync and
+            a confirmed removal pass False
+
+    Returns:
+        Dict with counts of added, updated, removed and failed entries, or None
+        if another worker is already syncing
+    """
+    desired = guest_hotspot_credentials(rows)
+    with _sync_lock() as acquired:
+        if not acquired:
+            logger.info("Hotspot sync already running in another worker, skipping")
+            return None
+        logger.info(f"Syncing {len(desired)} guest hotspot users to router")
+        return mikrotik_api.sync_hotspot_users(
+            desired,
+            comment=GUEST_USER_COMMENT,
+            batch_size=HOTSPOT_SYNC_BATCH_SIZE,
+            hold_removals=is_mass_removal if guarded else None
+        )
+
+
+def claim_removed_guests(removed):
+    """
+    Claim departed guests for revocation so only one worker disconnects each
+
+    Every gunicorn worker refreshes the sheet and sees the same removals; the
+    first to claim a guest (in the shared local store) handles it.
+
+    Args:
+        removed: Dict of mobile number -> room from a SheetChange
+
+    Returns:
+        List of the mobile numbers this process claimed
+    """
+    token = f"{os.getpid()}:{time.time()}"
+    claimed = []
+    for mobile, room in removed.items():
+        try:
+            owner = get_store().update('revoked_guests', f"{mobile}:{room}",
+                                       lambda current: current or token, 2 * SHEET_CACHE_TIMEOUT)
+        except Exception as e:
+            # Without the store, revoking twice is harmless; not revoking isn't
+            logger.error(f"Error claiming guest {mobile} for revocation: {str(e)}")
+            owner = token
+        if owner == token:
+            claimed.append(mobile)
+    return claimed
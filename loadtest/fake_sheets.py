@@ -0,0 +1,129 @@
+"""
+Fake Google Sheets API for load tests
+
+Serves the two endpoints the portal uses:
+
+- POST /token: the OAuth token endpoint. The service-account JSON written
+  by write_service_account() points its token_uri here.
+- GET /v4/spreadsheets/<id>/values/<range>: the guest rows.
+
+Point the portal at it with SHEETS_API_ENDPOINT=http://host:port/ and
+GOOGLE_CREDENTIALS_FILE=<the written service-account JSON>.
+"""
+import argparse
+import json
+import logging
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+logger = logging.getLogger(__name__)
+
+ROOM_FORMATS = ('R{n}', 'r{n}', 'F{n}', 'f{n}', '{n}', '{n} Dorm', '{n}DORM')
+
+
+def make_guests(count, seed=7):
+    """
+    Synthetic guest rows ([name, mobile, room]) with unique mobile numbers
+    """
+    rng = random.Random(seed)
+    mobiles = rng.sample(range(7000000000, 9999999999), count)
+    return [[f"Guest {i}", str(mobile), rng.choice(ROOM_FORMATS).format(n=rng.randrange(0, 40))]
+            for i, mobile in enumerate(mobiles)]
+
+
+def write_service_account(path, token_uri):
+    """
+    Write a service-account JSON with a freshly generated RSA key
+    """
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ).decode()
+    with open(path, 'w') as f:
+        json.dump({
+            'type': 'service_account',
+            'project_id': 'loadtest',
+            'private_key_id': 'loadtest',
+            'private_key': pem,
+            'client_email': 'loadtest@loadtest.iam.gserviceaccount.com',
+            'client_id': '1',
+            'token_uri': token_uri,
+        }, f)
+
+
+class SheetsHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        if self.path.startswith('/token'):
+            self.server.token_requests += 1
+            self._send_json(200, {'access_token': 'loadtest-token', 'expires_in': 3600, 'token_type': 'Bearer'})
+        else:
+            self._send_json(404, {'error': {'code': 404, 'message': 'Not found'}})
+
+    def do_GET(self):
+        if '/values/' in self.path:
+            self.server.value_requests += 1
+            rows = [['Name', 'Mobile', 'Room']] + self.server.rows
+            self._send_json(200, {'range': 'Sheet1!A1:C', 'majorDimension': 'ROWS', 'values': rows})
+        else:
+            self._send_json(404, {'error': {'code': 404, 'message': 'Not found'}})
+
+
+class FakeSheetsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, rows):
+        super().__init__(address, SheetsHandler)
+        self.rows = rows
+        self.token_requests = 0
+        self.value_requests = 0
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name='fake-sheets', daemon=True)
+        thread.start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Google Sheets API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--guests', type=int, default=1000)
+    parser.add_argument('--service-account', help='Also write a service-account JSON here')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = FakeSheetsServer((args.host, args.port), make_guests(args.guests))
+    if args.service_account:
+        write_service_account(args.service_account, f"{server.url}token")
+    logger.info(f"Fake Sheets API listening on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
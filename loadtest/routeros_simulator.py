@@ -0,0 +1,388 @@
+"""
+RouterOS API simulator for development and capacity testing
+
+With DEVELOPMENT_MODE on, MikroTikAPI skips the router entirely. This
+simulator lets the real router code paths run off-site instead. It speaks
+the RouterOS API wire protocol (length-prefixed words, sentences ending in
+an empty word, .tag echoing) well enough for routeros_api and mikrotik.py.
+
+It supports plaintext /login, and print (with ?key=value filters and
+.proplist), add, set and remove on any menu path. These menus can be
+seeded with thousands of realistic entries:
+
+- /ip/hotspot/user: guest accounts, tagged with the guest comment
+- /ip/hotspot/active: logged-in sessions with addresses, MACs, uptime and bytes
+- /ip/firewall/address-list: blocked MACs
+
+Faults can be injected per command: fixed latency plus jitter, !trap
+failures, dropped connections and stalls (no reply, so the client's
+socket timeout fires).
+
+    python loadtest/routeros_simulator.py --users 5000 --active 2000 --blocked 200 \\
+        --latency-ms 20 --jitter-ms 10 --fail-rate 0.01
+
+    DEVELOPMENT_MODE=false MIKROTIK_HOST=127.0.0.1 MIKROTIK_PORT=8728 \\
+        MIKROTIK_USERNAME=admin MIKROTIK_PASSWORD= python main.py
+
+Command counts are logged every --stats-interval seconds and on exit.
+"""
+import argparse
+import collections
+import itertools
+import logging
+import random
+import socketserver
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+GUEST_COMMENT = 'rai-fi guest'
+ROOM_FORMATS = ('R{n}', 'F{n}', '{n}DORM', '{n}')
+
+# Fields that identify an entry, and RouterOS's message when add would duplicate it
+UNIQUE_FIELDS = {
+    '/ip/hotspot/user': (('name',), 'failure: already have user with this name'),
+    '/ip/firewall/address-list': (('list', 'address'), 'failure: already have such entry'),
+}
+
+
+def encode_length(length):
+    if length < 0x80:
+        return bytes([length])
+    if length < 0x4000:
+        return (length | 0x8000).to_bytes(2, 'big')
+    if length < 0x200000:
+        return (length | 0xC00000).to_bytes(3, 'big')
+    if length < 0x10000000:
+        return (length | 0xE0000000).to_bytes(4, 'big')
+    return b'\xf0' + length.to_bytes(4, 'big')
+
+
+def encode_sentence(words):
+    data = bytearray()
+    for word in words:
+        data += encode_length(len(word)) + word
+    data += b'\x00'
+    return bytes(data)
+
+
+class RouterState:
+    """
+    The router's menus: path -> {'.id': row dict}, in insertion order
+    """
+
+    def __init__(self):
+        self.tables = collections.defaultdict(dict)
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.command_counts = collections.Counter()
+
+    def new_id(self):
+        return f"*{next(self._ids):X}"
+
+    def table(self, path):
+        """
+        Rows of a menu as a list (a snapshot)
+        """
+        with self.lock:
+            return list(self.tables[path].values())
+
+    def load(self, path, rows):
+        """
+        Add rows to a menu, giving each an .id
+        """
+        with self.lock:
+            table = self.tables[path]
+            for row in rows:
+                row_id = self.new_id()
+                table[row_id] = {'.id': row_id, **row}
+
+    def seed(self, users=0, active=0, blocked=0, seed=1):
+        """
+        Fill the hotspot and firewall menus with realistic entries
+
+        Args:
+            users: Guest hotspot accounts
+            active: Active hotspot sessions (drawn from the accounts when there are enough)
+            blocked: Blocked MACs on the address list
+        """
+        rng = random.Random(seed)
+        mobiles = [str(m) for m in rng.sample(range(7000000000, 9999999999), max(users, active))]
+        self.load('/ip/hotspot/user', (
+            {'name': mobile, 'password': rng.choice(ROOM_FORMATS).format(n=rng.randrange(40)),
+             'profile': 'default', 'comment': GUEST_COMMENT}
+            for mobile in mobiles[:users]
+        ))
+        self.load('/ip/hotspot/active', (
+            {'server': 'hotspot1', 'user': mobile,
+             'address': f"10.5.{50 + i // 250}.{2 + i % 250}",
+             'mac-address': ':'.join(f"{rng.randrange(256):02X}" for _ in range(6)),
+             'login-by': 'http-pap',
+             'uptime': f"{rng.randrange(24)}h{rng.randrange(60)}m{rng.randrange(60)}s",
+             'bytes-in': str(rng.randrange(10 ** 9)), 'bytes-out': str(rng.randrange(10 ** 8))}
+            for i, mobile in enumerate(mobiles[:active])
+        ))
+        self.load('/ip/firewall/address-list', (
+            {'list': 'blocked', 'address': ':'.join(f"{rng.randrange(256):02X}" for _ in range(6)),
+             'comment': 'Blocked by admin'}
+            for _ in range(blocked)
+        ))
+
+    def execute(self, path, command, attributes, queries):
+        """
+        Run one command
+
+        Returns:
+            (rows for !re replies, attributes for the !done reply)
+
+        Raises:
+            ValueError: For a !trap reply
+        """
+        with self.lock:
+            self.command_counts[f"{path}/{command}"] += 1
+            table = self.tables[path]
+
+            if command == 'print':
+                rows = table.values()
+                if queries:
+                    rows = [row for row in rows
+                            if all(row.get(key) == value for key, value in queries.items())]
+                proplist = attributes.get('.proplist')
+                if proplist:
+                    keys = proplist.split(',')
+                    return [{key: row[key] for key in keys if key in row} for row in rows], {}
+                return [dict(row) for row in rows], {}
+
+            if command == 'add':
+                unique, message = UNIQUE_FIELDS.get(path, ((), None))
+                if unique and all(field in attributes for field in unique):
+                    for row in table.values():
+                        if all(row.get(field) == attributes[field] for field in unique):
+                            raise ValueError(message)
+                row_id = self.new_id()
+                table[row_id] = {'.id': row_id, **attributes}
+                return [], {'ret': row_id}
+
+            if command in ('set', 'remove'):
+                ids = [i for i in attributes.pop('.id', attributes.pop('numbers', '')).split(',') if i]
+                if not ids or any(row_id not in table for row_id in ids):
+                    raise ValueError('no such item')
+                for row_id in ids:
+                    if command == 'set':
+                        table[row_id].update(attributes)
+                    else:
+                        del table[row_id]
+                return [], {}
+
+        raise ValueError(f'no such command: {command}')
+
+
+class Faults:
+    """
+    Injected latency and failures, applied to every command after login
+    """
+
+    def __init__(self, latency_ms=0, jitter_ms=0, fail_rate=0, drop_rate=0, stall_rate=0, seed=None):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.fail_rate = fail_rate
+        self.drop_rate = drop_rate
+        self.stall_rate = stall_rate
+        self.counts = collections.Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(max(0, self.latency + self._rng.uniform(-self.jitter, self.jitter)))
+
+    def pick(self):
+        """
+        The fault to inject for the next command: None, 'fail', 'drop' or 'stall'
+        """
+        with self._lock:
+            roll = self._rng.random()
+            for fault, rate in (('stall', self.stall_rate), ('drop', self.drop_rate), ('fail', self.fail_rate)):
+                if roll < rate:
+                    self.counts[fault] += 1
+                    return fault
+                roll -= rate
+        return None
+
+
+class RouterOsHandler(socketserver.BaseRequestHandler):
+    """
+    One API connection
+    """
+
+    def setup(self):
+        self.buffer = b''
+
+    def _read(self, size):
+        while len(self.buffer) < size:
+            chunk = self.request.recv(65536)
+            if not chunk:
+                raise ConnectionError('client closed the connection')
+            self.buffer += chunk
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def _read_length(self):
+        first = self._read(1)[0]
+        if first < 0x80:
+            return first
+        if first < 0xC0:
+            return int.from_bytes(bytes([first & 0x3F]) + self._read(1), 'big')
+        if first < 0xE0:
+            return int.from_bytes(bytes([first & 0x1F]) + self._read(2), 'big')
+        if first < 0xF0:
+            return int.from_bytes(bytes([first & 0x0F]) + self._read(3), 'big')
+        return int.from_bytes(self._read(4), 'big')
+
+    def read_sentence(self):
+        words = []
+        while True:
+            length = self._read_length()
+            if length == 0:
+                return words
+            words.append(self._read(length))
+
+    def reply(self, sentences):
+        self.request.sendall(b''.join(encode_sentence(words) for words in sentences))
+
+    def handle(self):
+        while True:
+            try:
+                words = self.read_sentence()
+            except (ConnectionError, OSError):
+                return
+            if words and not self.handle_sentence(words):
+                return
+
+    def handle_sentence(self, words):
+        """
+        Answer one sentence
+
+        Returns:
+            False when the connection should be closed
+        """
+        command_word = words[0].decode()
+        tag = None
+        attributes = {}
+        queries = {}
+        for word in words[1:]:
+            text = word.decode()
+            if text.startswith('.tag='):
+                tag = text[5:]
+            elif text.startswith('='):
+                key, _, value = text[1:].partition('=')
+                attributes[key] = value
+            elif text.startswith('?'):
+                key, _, value = text[1:].partition('=')
+                queries[key] = value
+        tag_words = [f'.tag={tag}'.encode()] if tag is not None else []
+        faults = self.server.faults
+
+        path, _, command = command_word.rpartition('/')
+        faults.delay()
+        if command == 'login' and path == '':
+            if (attributes.get('name') == self.server.username
+                    and attributes.get('password', '') == self.server.password):
+                self.reply([[b'!done'] + tag_words])
+            else:
+                self.reply([[b'!trap', b'=message=invalid user name or password (6)'] + tag_words,
+                            [b'!done'] + tag_words])
+            return True
+
+        fault = faults.pick()
+        if fault == 'stall':
+            # Hold the connection without answering until the client gives up
+            self.request.settimeout(None)
+            while self.request.recv(65536):
+                pass
+            return False
+        if fault == 'drop':
+            return False
+
+        try:
+            if fault == 'fail':
+                raise ValueError('failure: simulated router error')
+            rows, done = self.server.state.execute(path, command, attributes, queries)
+        except ValueError as e:
+            self.reply([[b'!trap', f'=message={e}'.encode()] + tag_words, [b'!done'] + tag_words])
+            return True
+
+        sentences = [[b'!re'] + [f'={k}={v}'.encode() for k, v in row.items()] + tag_words for row in rows]
+        sentences.append([b'!done'] + [f'={k}={v}'.encode() for k, v in done.items()] + tag_words)
+        self.reply(sentences)
+        return True
+
+
+class RouterOsSimulator(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, username='admin', password='', state=None, faults=None):
+        super().__init__(address, RouterOsHandler)
+        self.username = username
+        self.password = password
+        self.state = state or RouterState()
+        self.faults = faults or Faults()
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name='routeros-simulator', daemon=True)
+        thread.start()
+        return self
+
+    def stats(self):
+        return {
+            'commands': dict(self.state.command_counts),
+            'faults': dict(self.faults.counts),
+            'entries': {path: len(table) for path, table in self.state.tables.items()},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RouterOS API simulator')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8728)
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='')
+    parser.add_argument('--users', type=int, default=1000, help='Seeded /ip/hotspot/user entries')
+    parser.add_argument('--active', type=int, default=300, help='Seeded /ip/hotspot/active entries')
+    parser.add_argument('--blocked', type=int, default=50, help='Seeded /ip/firewall/address-list entries')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Added to every command')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='Random +/- on top of the latency')
+    parser.add_argument('--fail-rate', type=float, default=0, help='Fraction of commands answered with !trap')
+    parser.add_argument('--drop-rate', type=float, default=0, help='Fraction of commands that close the connection')
+    parser.add_argument('--stall-rate', type=float, default=0, help='Fraction of commands never answered')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--stats-interval', type=float, default=30, help='Seconds between stats logs (0 to disable)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    state = RouterState()
+    state.seed(users=args.users, active=args.active, blocked=args.blocked, seed=args.seed)
+    faults = Faults(args.latency_ms, args.jitter_ms, args.fail_rate, args.drop_rate, args.stall_rate, args.seed)
+    server = RouterOsSimulator((args.host, args.port), args.username, args.password, state, faults)
+    logger.info(f"RouterOS simulator listening on {args.host}:{server.server_address[1]} "
+                f"with {server.stats()['entries']}")
+
+    if args.stats_interval:
+        def log_stats():
+            while True:
+                time.sleep(args.stats_interval)
+                logger.info(f"Stats: {server.stats()}")
+        threading.Thread(target=log_stats, daemon=True).start()
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logger.info(f"Final stats: {server.stats()}")
+
+
+if __name__ == '__main__':
+    main()
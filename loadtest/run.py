@@ -0,0 +1,307 @@
+"""
+End-to-end login load test
+
+Boots the real app under gunicorn against a local database, the fake
+Sheets API (fake_sheets.py) and the RouterOS API simulator
+(routeros_simulator.py). It then replays captive-portal check-ins at a given
+concurrency. Each flow is:
+
+    GET /?link-login-only=...&mac=...   (the router's redirect; sets the session)
+    POST /login                         (302 to link-login on success)
+
+The report gives p50/p95/p99 latency per step and per flow, throughput
+and error rates. Use it to size workers and threads for check-in storms.
+
+    python loadtest/run.py --concurrency 50 --duration 30
+    python loadtest/run.py --workers 4 --threads 8 --flows 2000
+    python loadtest/run.py --database-url postgresql://localhost/portal_loadtest
+    python loadtest/run.py --router-active 3000 --router-latency-ms 50 --router-fail-rate 0.02
+
+By default gunicorn reads ./gunicorn.conf.py when it exists. The
+--workers, --threads and --worker-class options override it.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from fake_sheets import FakeSheetsServer, make_guests, write_service_account
+from routeros_simulator import Faults, RouterOsSimulator, RouterState
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'loadtest', 'results')
+LINK_LOGIN = 'http://10.5.50.1/login'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies):
+    values = sorted(latencies)
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean_ms': round(sum(values) / len(values) * 1000, 2),
+        'p50_ms': round(percentile(values, 50) * 1000, 2),
+        'p95_ms': round(percentile(values, 95) * 1000, 2),
+        'p99_ms': round(percentile(values, 99) * 1000, 2),
+        'max_ms': round(values[-1] * 1000, 2),
+    }
+
+
+def random_mac(rng):
+    return ':'.join(f"{rng.randrange(256):02X}" for _ in range(6))
+
+
+class Results:
+    """
+    Latencies and outcomes collected by the load threads
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.steps = {'portal': [], 'login': [], 'flow': []}
+        self.outcomes = {}
+
+    def record(self, outcome, timings):
+        with self.lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            for step, value in timings.items():
+                self.steps[step].append(value)
+
+
+def run_flow(host, port, guest, rng, results, timeout):
+    """
+    One captive-portal check-in
+    """
+    _, mobile, room = guest
+    mac = random_mac(rng)
+    query = urllib.parse.urlencode({
+        'link-login-only': LINK_LOGIN,
+        'link-login': LINK_LOGIN,
+        'link-orig': 'http://example.com/',
+        'mac': mac,
+        'ip': f"10.5.50.{rng.randrange(2, 250)}",
+    })
+    timings = {}
+    conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        start = time.perf_counter()
+        conn.request('GET', f"/?{query}")
+        response = conn.getresponse()
+        response.read()
+        timings['portal'] = time.perf_counter() - start
+        if response.status != 200:
+            results.record(f"portal_http_{response.status}", timings)
+            return
+        cookie = response.getheader('Set-Cookie', '').split(';', 1)[0]
+
+        body = urllib.parse.urlencode({'mobile_number': mobile, 'room_number': room})
+        login_start = time.perf_counter()
+        conn.request('POST', '/login', body, {
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Cookie': cookie,
+        })
+        response = conn.getresponse()
+        response.read()
+        now = time.perf_counter()
+        timings['login'] = now - login_start
+        timings['flow'] = now - start
+
+        location = response.getheader('Location', '')
+        if response.status == 302 and location.startswith(LINK_LOGIN):
+            results.record('ok', timings)
+        elif response.status == 302:
+            # Redirected back to the portal with a flashed error
+            results.record('login_rejected', timings)
+        else:
+            results.record(f"login_http_{response.status}", timings)
+    except (OSError, http.client.HTTPException) as e:
+        results.record(f"error_{type(e).__name__}", timings)
+    finally:
+        conn.close()
+
+
+def wait_for_server(host, port, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            conn.close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def start_gunicorn(args, env, port):
+    command = [sys.executable, '-m', 'gunicorn', 'main:app', '--bind', f"127.0.0.1:{port}"]
+    if args.workers:
+        command += ['--workers', str(args.workers)]
+    if args.threads:
+        command += ['--threads', str(args.threads)]
+    if args.worker_class:
+        command += ['--worker-class', args.worker_class]
+    if args.gunicorn_config:
+        command += ['--config', args.gunicorn_config]
+    log = open(os.path.join(env['LOADTEST_WORKDIR'], 'gunicorn.log'), 'w')
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+                               start_new_session=True)
+    return process, command
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Captive-portal login load test')
+    parser.add_argument('--concurrency', type=int, default=20, help='Concurrent check-ins')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds of load (ignored with --flows)')
+    parser.add_argument('--flows', type=int, help='Stop after this many check-ins')
+    parser.add_argument('--guests', type=int, default=2000, help='Guests in the fake sheet')
+    parser.add_argument('--workers', type=int, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, help='gunicorn threads per worker')
+    parser.add_argument('--worker-class', help='gunicorn worker class, e.g. sync or gthread')
+    parser.add_argument('--gunicorn-config', help='gunicorn config file (default: ./gunicorn.conf.py if present)')
+    parser.add_argument('--database-url', help='Database for the app (default: a fresh SQLite file)')
+    parser.add_argument('--router-users', type=int, default=0, help='Hotspot users seeded on the router')
+    parser.add_argument('--router-active', type=int, default=0, help='Active hotspot sessions seeded on the router')
+    parser.add_argument('--router-latency-ms', type=float, default=0, help='RouterOS latency per command')
+    parser.add_argument('--router-jitter-ms', type=float, default=0, help='RouterOS latency jitter')
+    parser.add_argument('--router-fail-rate', type=float, default=0, help='Fraction of RouterOS commands that fail')
+    parser.add_argument('--router-drop-rate', type=float, default=0, help='Fraction of RouterOS commands dropped')
+    parser.add_argument('--timeout', type=float, default=30, help='Client socket timeout')
+    parser.add_argument('--label', default='', help='Free-form label stored with the results')
+    parser.add_argument('--output', help='Results file (default: loadtest/results/<timestamp>.json)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='portal-loadtest-')
+    guests = make_guests(args.guests)
+
+    sheets = FakeSheetsServer(('127.0.0.1', 0), guests).start()
+    credentials_file = os.path.join(workdir, 'service_account.json')
+    write_service_account(credentials_file, f"{sheets.url}token")
+
+    router_state = RouterState()
+    router_state.seed(users=args.router_users, active=args.router_active)
+    faults = Faults(args.router_latency_ms, args.router_jitter_ms, args.router_fail_rate, args.router_drop_rate)
+    router = RouterOsSimulator(('127.0.0.1', 0), 'loadtest', 'loadtest', router_state, faults).start()
+
+    port = free_port()
+    env = dict(
+        os.environ,
+        LOADTEST_WORKDIR=workdir,
+        DATABASE_URL=args.database_url or f"sqlite:///{os.path.join(workdir, 'portal.db')}",
+        SESSION_SECRET='loadtest',
+        GOOGLE_CREDENTIALS_FILE=credentials_file,
+        SPREADSHEET_ID='loadtest',
+        SHEETS_API_ENDPOINT=sheets.url,
+        MIKROTIK_HOST='127.0.0.1',
+        MIKROTIK_PORT=str(router.server_address[1]),
+        MIKROTIK_USERNAME='loadtest',
+        MIKROTIK_PASSWORD='loadtest',
+        DEVELOPMENT_MODE='false',
+        LOCAL_STORE_PATH=os.path.join(workdir, 'store.sqlite3'),
+        METRICS_DIR=os.path.join(workdir, 'metrics'),
+        PROFILE_DIR=os.path.join(workdir, 'profiles'),
+        LOG_LEVEL=os.environ.get('LOG_LEVEL', 'WARNING'),
+    )
+
+    process, command = start_gunicorn(args, env, port)
+    try:
+        if not wait_for_server('127.0.0.1', port, 60):
+            print(f"gunicorn did not start; see {os.path.join(workdir, 'gunicorn.log')}")
+            return 1
+        # Let the startup sheet refresh land so the run measures steady state
+        time.sleep(1)
+
+        print(f"Running {'%d flows' % args.flows if args.flows else '%ss' % args.duration} "
+              f"at concurrency {args.concurrency} against: {' '.join(command[2:])}")
+        results = Results()
+        stop_at = time.perf_counter() + args.duration
+        issued = iter(range(args.flows)) if args.flows else None
+        issued_lock = threading.Lock()
+
+        def worker(index):
+            rng = random.Random(index)
+            while True:
+                if issued is not None:
+                    with issued_lock:
+                        if next(issued, None) is None:
+                            return
+                elif time.perf_counter() >= stop_at:
+                    return
+                run_flow('127.0.0.1', port, rng.choice(guests), rng, results, args.timeout)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(worker, range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+    finally:
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+        sheets.shutdown()
+        router.shutdown()
+
+    total = sum(results.outcomes.values())
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'label': args.label,
+        'command': command[2:],
+        'concurrency': args.concurrency,
+        'elapsed_s': round(elapsed, 2),
+        'flows': total,
+        'throughput_flows_per_s': round(total / elapsed, 2) if elapsed else 0,
+        'error_rate': round(1 - results.outcomes.get('ok', 0) / total, 4) if total else None,
+        'outcomes': results.outcomes,
+        'latency': {step: summarize(values) for step, values in results.steps.items()},
+        'sheet_fetches': sheets.value_requests,
+        'router': router.stats(),
+    }
+
+    print(f"\n{total} flows in {report['elapsed_s']}s: {report['throughput_flows_per_s']} flows/s, "
+          f"error rate {report['error_rate']:.2%}" if total else "\nNo flows completed")
+    print(f"Outcomes: {results.outcomes}")
+    print(f"{'step':<8} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for step, stats in report['latency'].items():
+        if stats['count']:
+            print(f"{step:<8} {stats['count']:>7} {stats['p50_ms']:>9} {stats['p95_ms']:>9} "
+                  f"{stats['p99_ms']:>9} {stats['max_ms']:>9}")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output} (server logs in {workdir})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
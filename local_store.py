@@ -0,0 +1,249 @@
+"""
+Host-local key/value store shared between gunicorn workers
+
+Small pieces of hot-path state (login throttling counters, portal sessions)
+must be visible to every worker process on the box without a round trip to
+Postgres. This module provides a SQLite-backed store for that purpose, with an
+in-process fallback when no store path is configured.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from config import LOCAL_STORE_PATH
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class MemoryStore:
+    """
+    Process-local store, used when LOCAL_STORE_PATH is empty
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        """
+        Get a value, or None if it is missing or expired
+        """
+        with self._lock:
+            entry = self._data.get((namespace, key))
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._data[(namespace, key)]
+                return None
+            return value
+
+    def set(self, namespace, key, value, ttl):
+        """
+        Store a JSON-serialisable value for ttl seconds
+        """
+        with self._lock:
+            self._data[(namespace, key)] = (value, time.time() + ttl)
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._data.pop((namespace, key), None)
+
+    def update(self, namespace, key, func, ttl):
+        """
+        Atomically replace a value with func(old_value) and return the new value
+        """
+        with self._lock:
+            now = time.time()
+            entry = self._data.get((namespace, key))
+            old_value = entry[0] if entry and entry[1] >= now else None
+            new_value = func(old_value)
+            self._data[(namespace, key)] = (new_value, now + ttl)
+            return new_value
+
+    def items(self, namespace):
+        """
+        Return all live (key, value) pairs in a namespace
+        """
+        now = time.time()
+        with self._lock:
+            return [(key, value) for (ns, key), (value, expires_at) in self._data.items()
+                    if ns == namespace and expires_at >= now]
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            expired = [k for k, (_, expires_at) in self._data.items() if expires_at < now]
+            for k in expired:
+                del self._data[k]
+            return len(expired)
+
+    def reset(self):
+        """
+        Replace the lock (e.g. after fork, where a parent's thread may hold it)
+        """
+        self._lock = threading.Lock()
+
+
+class SQLiteStore:
+    """
+    SQLite-backed store shared by all processes on the host
+
+    Each thread keeps its own connection. Writes go through short IMMEDIATE
+    transactions so read-modify-write updates are atomic across workers.
+    """
+
+    # Purge expired rows at most this often (seconds)
+    PURGE_INTERVAL = 60
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._last_purge = 0
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv ("
+                " namespace TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def reset(self):
+        """
+        Drop this thread's connection (e.g. after fork)
+        """
+        self._local = threading.local()
+
+    def get(self, namespace, key):
+        """
+        Get a value, or None if it is missing or expired
+        """
+        row = self._connection().execute(
+            "SELECT value FROM kv WHERE namespace = ? AND key = ? AND expires_at >= ?",
+            (namespace, key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, namespace, key, value, ttl):
+        """
+        Store a JSON-serialisable value for ttl seconds
+        """
+        self._connection().execute(
+            "INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, json.dumps(value, separators=(',', ':')), time.time() + ttl)
+        )
+        self._maybe_purge()
+
+    def delete(self, namespace, key):
+        self._connection().execute(
+            "DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+        )
+
+    def update(self, namespace, key, func, ttl):
+        """
+        Atomically replace a value with func(old_value) and return the new value
+        """
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT value FROM kv WHERE namespace = ? AND key = ? AND expires_at >= ?",
+                (namespace, key, now)
+            ).fetchone()
+            new_value = func(json.loads(row[0]) if row else None)
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(new_value, separators=(',', ':')), now + ttl)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._maybe_purge()
+        return new_value
+
+    def items(self, namespace):
+        """
+        Return all live (key, value) pairs in a namespace
+        """
+        rows = self._connection().execute(
+            "SELECT key, value FROM kv WHERE namespace = ? AND expires_at >= ?",
+            (namespace, time.time())
+        ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def purge_expired(self):
+        cursor = self._connection().execute("DELETE FROM kv WHERE expires_at < ?", (time.time(),))
+        return cursor.rowcount
+
+    def _maybe_purge(self):
+        now = time.time()
+        if now - self._last_purge > self.PURGE_INTERVAL:
+            self._last_purge = now
+            try:
+                removed = self.purge_expired()
+                if removed:
+                    logger.debug(f"Purged {removed} expired entries from local store")
+            except sqlite3.Error as e:
+                logger.warning(f"Error purging local store: {str(e)}")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """
+    Get the shared store for this process, creating it on first use
+    """
+    global _store
+
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if LOCAL_STORE_PATH:
+                    try:
+                        _store = SQLiteStore(LOCAL_STORE_PATH)
+                        logger.info(f"Using shared local store at {LOCAL_STORE_PATH}")
+                    except sqlite3.Error as e:
+                        logger.error(f"Cannot open local store {LOCAL_STORE_PATH}, using memory: {str(e)}")
+                        _store = MemoryStore()
+                else:
+                    _store = MemoryStore()
+    return _store
+
+
+# Generations must outlive the caches that check them
+GENERATION_TTL = 30 * 24 * 3600
+
+
+def bump_generation(name):
+    """
+    Advance a shared change counter, telling every worker on this host that name changed
+
+    Returns:
+        The new generation
+    """
+    return get_store().update('generations', name, lambda current: (current or 0) + 1, GENERATION_TTL)
+
+
+def get_generation(name):
+    """
+    Current value of a shared change counter (0 if it was never bumped)
+    """
+    return get_store().get('generations', name) or 0
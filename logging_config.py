@@ -0,0 +1,177 @@
+"""
+Logging setup
+
+Request threads only put records on an in-memory queue (QueueHandler). A
+background QueueListener thread does the formatting and the writes. Slow
+stderr or disk I/O therefore never adds to login latency.
+
+- LOG_FORMAT: 'json' (one object per line) or 'text'.
+- LOG_LEVEL: the root level.
+- LOG_LEVELS: per-module overrides, e.g. "google_sheets=WARNING,mikrotik=DEBUG".
+- LOG_SAMPLING: keeps a fraction of a module's records below WARNING, e.g.
+  "google_sheets=0.1". Warnings and errors are always kept.
+- Mobile numbers are masked in every record, whatever the module logged.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+from datetime import datetime, timezone
+
+from config import LOG_FORMAT, LOG_LEVEL, LOG_LEVELS, LOG_SAMPLING, LOG_FILE
+
+# Runs of 8+ digits (optionally with a leading +), i.e. phone numbers
+_MOBILE_PATTERN = re.compile(r'(?<![\w.])\+?\d{4,}(\d{4})(?![\w.])')
+# Credentials in query strings, e.g. MikroTik login URLs
+_PASSWORD_PATTERN = re.compile(r'(password=)[^&\s]+', re.IGNORECASE)
+
+_listener = None
+
+
+def mask_pii(text):
+    """
+    Mask mobile numbers (all but the last 4 digits) and passwords in a log line
+    """
+    text = _MOBILE_PATTERN.sub(r'******\1', text)
+    return _PASSWORD_PATTERN.sub(r'\1******', text)
+
+
+def _parse_mapping(value, convert):
+    """
+    Parse "a=1,b=2" into {'a': convert('1'), 'b': convert('2')}, skipping bad entries
+    """
+    mapping = {}
+    for item in value.split(','):
+        name, _, setting = item.partition('=')
+        if name.strip() and setting.strip():
+            try:
+                mapping[name.strip()] = convert(setting.strip())
+            except ValueError:
+                continue
+    return mapping
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of low-severity records from noisy modules
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        if not self.rates or record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(record.name)
+        if rate is None:
+            return True
+        return random.random() < rate
+
+
+class MaskingFormatter(logging.Formatter):
+    """
+    Text formatter that masks PII
+    """
+
+    def format(self, record):
+        return mask_pii(super().format(record))
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, with PII masked
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': mask_pii(record.getMessage()),
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        if record.exc_info:
+            entry['exception'] = mask_pii(self.formatException(record.exc_info))
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def _build_handlers():
+    if LOG_FORMAT == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = MaskingFormatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if LOG_FILE:
+        handlers.append(logging.FileHandler(LOG_FILE))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def start_log_listener():
+    """
+    Start (or restart) the background writer for the logging queue
+
+    Threads don't survive fork, so gunicorn workers call this again after
+    forking. Records already queued in the parent are written by the new
+    listener.
+    """
+    global _listener
+    root = logging.getLogger()
+    queue_handler = next(
+        (h for h in root.handlers if isinstance(h, logging.handlers.QueueHandler)), None
+    )
+    if queue_handler is None:
+        return
+    _listener = logging.handlers.QueueListener(
+        queue_handler.queue, *_build_handlers(), respect_handler_level=False
+    )
+    _listener.start()
+
+
+def stop_log_listener():
+    """
+    Flush queued records and stop the writer thread
+    """
+    global _listener
+    if _listener is not None:
+        try:
+            _listener.stop()
+        except Exception:
+            pass
+        _listener = None
+
+
+def configure_logging():
+    """
+    Route all logging through the queue and apply the level and sampling settings
+
+    Safe to call more than once.
+    """
+    root = logging.getLogger()
+    if any(isinstance(h, logging.handlers.QueueHandler) for h in root.handlers):
+        return
+
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(SamplingFilter(_parse_mapping(LOG_SAMPLING, float)))
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    for name, level in _parse_mapping(LOG_LEVELS, str.upper).items():
+        try:
+            logging.getLogger(name).setLevel(level)
+        except ValueError:
+            logging.getLogger(__name__).warning("Ignoring unknown log level %s for %s", level, name)
+
+    start_log_listener()
+    atexit.register(stop_log_listener)
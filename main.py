@@ -3,12 +3,11 @@ import logging
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
+from logging_config import configure_logging
+from config import DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging (queued, structured and PII-masked; see logging_config)
+configure_logging()
 logger = logging.getLogger(__name__)
 logger.info("Starting application...")
 
@@ -40,6 +39,13 @@ if database_url:
         "pool_recycle": 300,
         "pool_pre_ping": True,
     }
+    if not database_url.startswith("sqlite"):
+        # Threaded workers run requests and login checks concurrently
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"].update({
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+        })
     
     # Initialize the app with the extension
     db.init_app(app)
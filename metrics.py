@@ -0,0 +1,455 @@
+"""
+Prometheus-style metrics
+
+A small in-process registry of counters, gauges and histograms. Updates are
+a dict lookup and an add under a per-metric lock, so they are cheap enough
+for the login hot path.
+
+With METRICS_DIR set, every process writes its values to METRICS_DIR/<pid>.json
+every METRICS_FLUSH_INTERVAL seconds. /metrics merges all the files, so a
+scrape sees the whole gunicorn server and not just the worker that answered.
+Counters and histograms are summed across files. Gauges take the most
+recently written value among the live files. When a worker exits, the
+gunicorn master folds its counters and histograms into METRICS_DIR/dead.json
+and deletes its file (see mark_process_dead), so recycled workers neither
+pile up nor lose their counts.
+"""
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import METRICS_DIR, METRICS_FLUSH_INTERVAL
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Metric:
+    """
+    Base class: a named family of values keyed by label values
+    """
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def dump(self):
+        """
+        Values as a JSON-friendly list of [label values, value]
+        """
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def reset(self):
+        """
+        Drop all values, with a fresh lock (a parent's thread may hold the old one)
+        """
+        self._values = {}
+        self._lock = threading.Lock()
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket (non-cumulative) counts, plus +Inf, then sum and count
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def dump(self):
+        with self._lock:
+            return [[list(key), [list(counts), total, count]]
+                    for key, (counts, total, count) in self._values.items()]
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+class Registry:
+    """
+    The set of metrics exported by this process
+    """
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def dump(self):
+        return {name: metric.dump() for name, metric in self.metrics.items()}
+
+
+registry = Registry()
+
+# HTTP
+http_requests_total = registry.counter(
+    'portal_http_requests_total', 'HTTP requests by endpoint, method and status',
+    ('endpoint', 'method', 'status'))
+http_request_duration = registry.histogram(
+    'portal_http_request_duration_seconds', 'HTTP request latency by endpoint',
+    ('endpoint', 'method'))
+
+# Functions and external dependencies
+function_duration = registry.histogram(
+    'portal_function_duration_seconds', 'Latency of instrumented functions',
+    ('function',))
+dependency_calls_total = registry.counter(
+    'portal_dependency_calls_total', 'Calls to external dependencies by outcome',
+    ('dependency', 'operation', 'outcome'))
+dependency_duration = registry.histogram(
+    'portal_dependency_duration_seconds', 'Latency of calls to external dependencies',
+    ('dependency', 'operation'))
+
+# Database
+db_query_duration = registry.histogram(
+    'portal_db_query_duration_seconds', 'Database statement latency by statement type',
+    ('statement',))
+
+# Caches and data
+cache_requests_total = registry.counter(
+    'portal_cache_requests_total', 'Cache lookups by cache and result (hit, stale, miss)',
+    ('cache', 'result'))
+sheet_rows = registry.gauge(
+    'portal_sheet_rows', 'Data rows in the cached credential sheet')
+sheet_changes_total = registry.counter(
+    'portal_sheet_changes_total', 'Guests added to, removed from or moved within the sheet',
+    ('change',))
+
+
+def timed(name):
+    """
+    Decorator recording a function's latency in portal_function_duration_seconds
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                function_duration.observe(time.perf_counter() - start, function=name)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def track_dependency(dependency, operation):
+    """
+    Time a call to an external dependency and count its outcome
+
+    Args:
+        dependency: e.g. 'google_sheets' or 'mikrotik'
+        operation: The call being made, e.g. 'values.get'
+    """
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'success'
+    finally:
+        dependency_duration.observe(time.perf_counter() - start,
+                                    dependency=dependency, operation=operation)
+        dependency_calls_total.inc(dependency=dependency, operation=operation, outcome=outcome)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info['metrics_query_start'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _record_query_time(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop('metrics_query_start', None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    statement_type = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+    db_query_duration.observe(elapsed, statement=statement_type)
+
+
+# Multi-process aggregation
+
+# Counters and histograms of exited workers (see mark_process_dead)
+DEAD_SNAPSHOT = 'dead.json'
+# A file not rewritten for this many flush intervals belongs to a dead process
+STALE_FLUSH_INTERVALS = 3
+
+
+def _snapshot_path(pid=None):
+    return os.path.join(METRICS_DIR, f"{pid or os.getpid()}.json")
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def write_snapshot():
+    """
+    Write this process's metrics to METRICS_DIR (no-op when it isn't set)
+    """
+    if not METRICS_DIR:
+        return
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        _write_json(_snapshot_path(), registry.dump())
+    except OSError as e:
+        logger.error(f"Error writing metrics snapshot: {str(e)}")
+
+
+def _without_gauges(snapshot):
+    return {name: values for name, values in snapshot.items()
+            if name in registry.metrics and registry.metrics[name].kind != 'gauge'}
+
+
+def mark_process_dead(pid):
+    """
+    Fold an exited worker's counters and histograms into dead.json and delete its file
+
+    Called from the gunicorn master (child_exit), which is single-threaded,
+    so dead.json is never updated concurrently. The worker's gauges are
+    dropped: they described a process that no longer exists.
+    """
+    if not METRICS_DIR:
+        return
+    path = _snapshot_path(pid)
+    dead_path = os.path.join(METRICS_DIR, DEAD_SNAPSHOT)
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError) as e:
+        logger.error(f"Error reading metrics snapshot of worker {pid}: {str(e)}")
+        snapshot = {}
+    try:
+        snapshots = [_without_gauges(snapshot)]
+        if os.path.exists(dead_path):
+            with open(dead_path) as f:
+                snapshots.append(json.load(f))
+        merged = _merge(snapshots)
+        _write_json(dead_path, {name: [[list(key), value] for key, value in values.items()]
+                                for name, values in merged.items() if values})
+        os.remove(path)
+    except (OSError, ValueError) as e:
+        logger.error(f"Error archiving metrics snapshot of worker {pid}: {str(e)}")
+
+
+def _load_snapshots():
+    """
+    Every process's dumped metrics, oldest file first (so later gauges win)
+    """
+    if not METRICS_DIR:
+        return [registry.dump()]
+
+    write_snapshot()
+    try:
+        names = [name for name in os.listdir(METRICS_DIR) if name.endswith('.json')]
+    except OSError:
+        return [registry.dump()]
+
+    stale_before = time.time() - STALE_FLUSH_INTERVALS * METRICS_FLUSH_INTERVAL
+    files = []
+    for name in names:
+        path = os.path.join(METRICS_DIR, name)
+        try:
+            mtime = os.path.getmtime(path)
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            # Written concurrently or already removed; the next scrape will see it
+            continue
+        if mtime < stale_before:
+            # A worker that died without child_exit running: keep its counts,
+            # but its gauges must not override the live workers'
+            snapshot = _without_gauges(snapshot)
+        files.append((mtime, snapshot))
+    files.sort(key=lambda item: item[0])
+    return [data for _, data in files]
+
+
+def _merge(snapshots):
+    merged = {name: {} for name in registry.metrics}
+    for snapshot in snapshots:
+        for name, values in snapshot.items():
+            metric = registry.metrics.get(name)
+            if metric is None:
+                continue
+            target = merged[name]
+            for labels, value in values:
+                key = tuple(labels)
+                if metric.kind == 'gauge':
+                    target[key] = value
+                elif metric.kind == 'counter':
+                    target[key] = target.get(key, 0) + value
+                else:
+                    counts, total, count = value
+                    if key not in target:
+                        target[key] = [list(counts), total, count]
+                    else:
+                        entry = target[key]
+                        entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                        entry[1] += total
+                        entry[2] += count
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def render_metrics():
+    """
+    All metrics, merged across processes, in the Prometheus text format
+    """
+    merged = _merge(_load_snapshots())
+    lines = []
+    for name, metric in registry.metrics.items():
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for key, value in sorted(merged[name].items()):
+            if metric.kind != 'histogram':
+                lines.append(f"{name}{_format_labels(metric.labelnames, key)} {value}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(metric.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                labels = _format_labels(metric.labelnames, key, [('le', bound)])
+                lines.append(f"{name}_bucket{labels} {cumulative}")
+            labels = _format_labels(metric.labelnames, key)
+            lines.append(f"{name}_sum{labels} {total}")
+            lines.append(f"{name}_count{labels} {count}")
+    return '\n'.join(lines) + '\n'
+
+
+_writer_thread = None
+
+
+def _writer_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        write_snapshot()
+
+
+def reset_metrics():
+    """
+    Zero this process's metrics
+
+    A freshly forked worker inherits the parent's values, which the
+    parent's own snapshot already reports; keeping them would count them
+    twice.
+    """
+    for metric in registry.metrics.values():
+        metric.reset()
+
+
+def start_metrics_writer():
+    """
+    Start the thread that periodically writes this process's snapshot
+
+    Threads don't survive fork, so gunicorn workers call this again after
+    forking.
+    """
+    global _writer_thread
+    if not METRICS_DIR:
+        return
+    _writer_thread = threading.Thread(target=_writer_loop, name='metrics-writer', daemon=True)
+    _writer_thread.start()
+
+
+def init_metrics(app):
+    """
+    Record latency and status for every Flask request
+    """
+    from flask import g, request
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            endpoint = request.endpoint or 'unmatched'
+            http_request_duration.observe(time.perf_counter() - start,
+                                          endpoint=endpoint, method=request.method)
+            http_requests_total.inc(endpoint=endpoint, method=request.method,
+                                    status=response.status_code)
+        return response
+
+    start_metrics_writer()
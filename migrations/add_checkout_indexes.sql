@@ -0,0 +1,15 @@
+-- Room checkout looks guests up by room and their sessions that are still
+-- open. Room numbers are now stored normalized (see normalize_room_number in
+-- google_sheets.py); the UPDATE brings existing guest rows in line using the
+-- same rules. CONCURRENTLY keeps the tables writable while the indexes
+-- build; run outside a transaction.
+UPDATE users SET room_number = CASE
+    WHEN UPPER(room_number) ~ '\d+\s*DORM' THEN substring(UPPER(room_number) from '(\d+)\s*DORM') || 'DORM'
+    WHEN UPPER(room_number) LIKE '%DORM%' AND room_number ~ '\d' THEN substring(room_number from '\d+') || 'DORM'
+    WHEN UPPER(room_number) LIKE '%DORM%' THEN UPPER(TRIM(room_number))
+    WHEN REPLACE(TRIM(room_number), ' ', '') ~ '^\d$' THEN 'R' || REPLACE(TRIM(room_number), ' ', '')
+    ELSE UPPER(REPLACE(TRIM(room_number), ' ', ''))
+END
+WHERE user_type = 'guest' AND room_number IS NOT NULL;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_room_number ON users (room_number);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_login_sessions_open_user ON login_sessions (user_id) WHERE logout_time IS NULL;
@@ -0,0 +1,7 @@
+-- Indexes for the paginated manage-users tabs (newest first by id, per
+-- user_type or is_active) and mobile-number prefix search. The All tab uses
+-- the primary key. CONCURRENTLY keeps the users table writable while they
+-- build; run outside a transaction.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_type_id ON users (user_type, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_active_id ON users (is_active, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_mobile_prefix ON users (mobile_number varchar_pattern_ops);
@@ -3,12 +3,86 @@ import routeros_api
 import time
 import os
 import socket
-from config import MIKROTIK_HOST, MIKROTIK_PORT, MIKROTIK_USERNAME, MIKROTIK_PASSWORD
+import hashlib
+import threading
+from contextlib import contextmanager
+from config import (MIKROTIK_HOST, MIKROTIK_PORT, MIKROTIK_USERNAME, MIKROTIK_PASSWORD, HOTSPOT_USER_CACHE_TTL,
+                    MIKROTIK_SOCKET_TIMEOUT)
 from error_handler import ErrorHandler, ErrorCategory
+from circuit_breaker import get_breaker
+from deadline import DeadlineExceeded, deadline_expired, timeout_for
+from metrics import timed, track_dependency, cache_requests_total
+from tracing import span
+from local_store import bump_generation, get_generation
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+def _password_hash(password):
+    """
+    Hash a hotspot password for the provisioned-user cache
+    """
+    return hashlib.sha256((password or '').encode('utf-8')).hexdigest()
+
+# Errors meaning the router (or the path to it) is unhealthy, as opposed to
+# the router refusing a command (RouterOsApiCommunicationError)
+ROUTER_FAILURES = (OSError,
+                   routeros_api.exceptions.RouterOsApiConnectionError,
+                   routeros_api.exceptions.RouterOsApiFatalCommunicationError,
+                   routeros_api.exceptions.FatalRouterOsApiError)
+
+class _TracedResource:
+    """
+    RouterOS resource whose commands are recorded as trace spans
+    
+    Each command's outcome also feeds the circuit breaker: a router that
+    accepts connections but doesn't answer commands counts as down.
+    """
+    
+    TRACED_COMMANDS = ('get', 'add', 'set', 'remove', 'call')
+    
+    def __init__(self, resource, path, breaker):
+        self._resource = resource
+        self._path = path
+        self._breaker = breaker
+    
+    def __getattr__(self, name):
+        attr = getattr(self._resource, name)
+        if name not in self.TRACED_COMMANDS:
+            return attr
+        
+        def traced(*args, **kwargs):
+            with span(f"routeros {self._path} {name}"):
+                try:
+                    result = attr(*args, **kwargs)
+                except routeros_api.exceptions.RouterOsApiCommunicationError:
+                    # The router answered, it just refused the command
+                    self._breaker.record_success()
+                    raise
+                except ROUTER_FAILURES as e:
+                    # Running out of our own request budget says nothing about the router
+                    if not isinstance(e, DeadlineExceeded) and not deadline_expired():
+                        self._breaker.record_failure(e)
+                    raise
+                self._breaker.record_success()
+                return result
+        return traced
+
+class _TracedApi:
+    """
+    RouterOS API handle that hands out traced resources
+    """
+    
+    def __init__(self, api, breaker):
+        self._api = api
+        self._breaker = breaker
+    
+    def get_resource(self, path, *args, **kwargs):
+        return _TracedResource(self._api.get_resource(path, *args, **kwargs), path, self._breaker)
+    
+    def __getattr__(self, name):
+        return getattr(self._api, name)
+
 class MikroTikAPI:
     """
     A class to handle interactions with MikroTik router API
@@ -24,10 +98,34 @@ class MikroTikAPI:
         self.password = password
         self.connection = None
         
+        # routeros_api connections are not thread-safe (see session)
+        self._connection_lock = threading.RLock()
+        
+        # Hotspot usernames already on the router, mapped to a hash of their
+        # password (None when the router didn't report it)
+        self._provisioned_users = None
+        self._provisioned_loaded_at = 0
+        self._provisioned_generation = None
+        self._provisioned_lock = threading.Lock()
+        
+        # Fail fast while the router is down, serving the last known active users
+        self.breaker = get_breaker(ErrorCategory.MIKROTIK)
+        self._last_active_users = []
+        
     def connect(self):
         """
         Establish a connection to the MikroTik router
+        
+        Socket operations are bounded by the time left in the current request
+        (see deadline), or MIKROTIK_SOCKET_TIMEOUT outside a request.
+        Callers go through session() so the connection is never shared
+        between threads.
         """
+        socket_timeout = timeout_for(MIKROTIK_SOCKET_TIMEOUT)
+        
+        if not self.breaker.allow_request():
+            raise ConnectionError(self.breaker.open_error())
+        
         if self.connection is None:
             try:
                 # Create a connection to the router
@@ -38,11 +136,16 @@ class MikroTikAPI:
                     port=self.port,
                     plaintext_login=True
                 )
-                api = self.connection.get_api()
-                return api
-            except socket.timeout:
+                self.connection.socket_timeout = socket_timeout
+                with track_dependency('mikrotik', 'connect'), span('routeros connect', host=self.host):
+                    api = self.connection.get_api()
+                # Success is only recorded once a command completes (see _TracedResource)
+                return _TracedApi(api, self.breaker)
+            except socket.timeout as e:
                 logger.error("Failed to connect to MikroTik router: timed out")
                 self.connection = None
+                if not deadline_expired():
+                    self.breaker.record_failure(e)
                 raise ConnectionError(
                     ErrorHandler.format_error(
                         ErrorCategory.MIKROTIK, 
@@ -51,6 +154,7 @@ class MikroTikAPI:
                     )
                 )
             except routeros_api.exceptions.RouterOsApiConnectionError as e:
+                self.breaker.record_failure(e)
                 if "invalid user name or password" in str(e).lower():
                     logger.error(f"Failed to authenticate with MikroTik router: {str(e)}")
                     self.connection = None
@@ -72,6 +176,7 @@ class MikroTikAPI:
             except Exception as e:
                 logger.error(f"Failed to connect to MikroTik router: {str(e)}")
                 self.connection = None
+                self.breaker.record_failure(e)
                 raise ConnectionError(
                     ErrorHandler.format_error(
                         ErrorCategory.MIKROTIK, 
@@ -80,20 +185,86 @@ class MikroTikAPI:
                     )
                 )
         else:
-            return self.connection.get_api()
+            self.connection.set_timeout(socket_timeout)
+            return _TracedApi(self.connection.get_api(), self.breaker)
     
-    def disconnect(self):
+    @contextmanager
+    def session(self):
         """
-        Close the connection to the MikroTik router
+        Exclusive use of the router connection
+        
+        The router API matches replies to commands by tag on one socket, so
+        two threads sharing the connection read each other's replies. With
+        threaded gunicorn workers, requests and background jobs run at the
+        same time; every router conversation holds this lock for its
+        duration. The wait is bounded like the socket timeout.
+        
+        Yields:
+            The API handle from connect()
+        """
+        if not self._connection_lock.acquire(timeout=timeout_for(MIKROTIK_SOCKET_TIMEOUT)):
+            raise ConnectionError(
+                ErrorHandler.format_error(
+                    ErrorCategory.MIKROTIK,
+                    "connection_timeout",
+                    "Router connection busy"
+                )
+            )
+        try:
+            yield self.connect()
+        finally:
+            self._connection_lock.release()
+    
+    def reset_after_fork(self):
         """
-        if self.connection:
+        Forget the connection and lock inherited from the parent process
+        
+        The socket is closed in this process only, without talking to the
+        router, and a lock held by a parent thread at fork time is replaced.
+        """
+        self._connection_lock = threading.RLock()
+        if self.connection is not None:
             try:
-                self.connection.disconnect()
+                self.connection.socket.close()
             except Exception:
                 pass
-            finally:
-                self.connection = None
+            self.connection = None
+        self.invalidate_provisioned_users(publish=False)
     
+    def _record_router_failure(self, error):
+        """
+        Drop the connection after a connection-level failure
+        
+        The breaker has already counted it: connect() counts its own errors
+        and _TracedResource counts command failures. API-level errors (e.g.
+        a duplicate entry) leave the connection usable.
+        """
+        if isinstance(error, ConnectionError) and error.args and isinstance(error.args[0], dict):
+            return
+        if isinstance(error, DeadlineExceeded):
+            return
+        if deadline_expired():
+            # The request ran out of time, not the router; the half-read
+            # connection still can't be reused
+            self.disconnect()
+            return
+        if isinstance(error, ROUTER_FAILURES):
+            self.disconnect()
+    
+    def disconnect(self):
+        """
+        Close the connection to the MikroTik router
+        """
+        with self._connection_lock:
+            if self.connection:
+                try:
+                    self.connection.disconnect()
+                except Exception:
+                    pass
+                finally:
+                    self.connection = None
+    
+    @timed('get_active_users')
     def get_active_users(self):
         """
         Get a list of active users from the router's hotspot
@@ -105,10 +276,11 @@ class MikroTikAPI:
             return []
             
         try:
-            api = self.connect()
-            hotspot_active = api.get_resource('/ip/hotspot/active')
-            active_users = hotspot_active.get()
-            
+            with self.session() as api:
+                hotspot_active = api.get_resource('/ip/hotspot/active')
+                with track_dependency('mikrotik', 'hotspot_active.get'):
+                    active_users = hotspot_active.get()
+                
             # Format the users for display
             users = []
             for user in active_users:
@@ -121,126 +293,460 @@ class MikroTikAPI:
                     'bytes_in': user.get('bytes-in', '0'),
                     'bytes_out': user.get('bytes-out', '0')
                 })
-            
+                
+            self._last_active_users = users
             return users
-        except socket.timeout:
+        except socket.timeout as e:
+            self._record_router_failure(e)
             error_info = ErrorHandler.format_error(
                 ErrorCategory.MIKROTIK, 
                 "connection_timeout"
             )
             logger.error(f"Error getting active users: {error_info['title']} - {error_info['message']}")
-            # Return empty list instead of raising exception to avoid breaking the admin page
-            return []
+            # Return the last known list instead of raising exception to avoid breaking the admin page
+            return list(self._last_active_users)
         except ConnectionError as e:
-            # This is likely from our own error handler in connect()
+            # This is likely from our own error handler in connect(), or the circuit breaker
             logger.error(f"Error getting active users: {str(e)}")
-            return []
+            return list(self._last_active_users)
         except Exception as e:
+            self._record_router_failure(e)
             error_info = ErrorHandler.format_error(
                 ErrorCategory.MIKROTIK, 
                 "api_error",
                 f"Error details: {str(e)}"
             )
             logger.error(f"Error getting active users: {error_info['title']} - {error_info['message']}")
-            # Return empty list instead of raising exception to avoid breaking the admin page
-            return []
+            # Return the last known list instead of raising exception to avoid breaking the admin page
+            return list(self._last_active_users)
     
-    def add_user(self, username, password):
+    def add_user(self, username, password, comment=None):
         """
         Add a user to the hotspot users (if needed) and authenticate them
         
         For MikroTik captive portal, we might not need to manually add the user
         as the login process would happen through the redirect.
         
-        This is here as a placeholder for potential additional functionality.
+        Args:
+            username: Hotspot username (the mobile number)
+            password: Hotspot password
+            comment: Optional comment to tag the router entry with (e.g. GUEST_USER_COMMENT)
         """
         # Check if we're in development mode - if so, return success without contacting router
         if os.environ.get('DEVELOPMENT_MODE', 'false').lower() == 'true':
             logger.info(f"Development mode: Simulating successful user addition for: {username}")
             return True
             
-        try:
-            api = self.connect()
-            
-            # Check if the user already exists
-            hotspot_users = api.get_resource('/ip/hotspot/user')
-            existing_users = hotspot_users.get(name=username)
-            
-            # If user doesn't exist, create them
-            if not existing_users:
-                hotspot_users.add(
-                    name=username,
-                    password=password,
-                    profile='default'
-                )
-                logger.debug(f"Created hotspot user: {username}")
+        # Returning users are answered from the provisioned-user cache without a router round trip
+        if self._is_provisioned(username, password):
+            cache_requests_total.inc(cache='hotspot_users', result='hit')
+            logger.debug(f"Hotspot user already provisioned: {username}")
+            return True
+        cache_requests_total.inc(cache='hotspot_users', result='miss')
             
+        try:
+            with self.session() as api:
+                hotspot_users = api.get_resource('/ip/hotspot/user')
+                    
+                # Seed the cache with one bulk fetch, then check again
+                if self._provisioned_cache_expired(self._shared_provisioned_generation()):
+                    with track_dependency('mikrotik', 'hotspot_user.get_all'):
+                        self._load_provisioned_users(hotspot_users)
+                    if self._is_provisioned(username, password):
+                        return True
+                    
+                with self._provisioned_lock:
+                    known = self._provisioned_users is not None and username in self._provisioned_users
+                    
+                with track_dependency('mikrotik', 'hotspot_user.add'):
+                    if known:
+                        # The user exists with a different password - update it
+                        self._update_user_password(hotspot_users, username, password, comment)
+                    else:
+                        try:
+                            hotspot_users.add(**self._hotspot_user_fields(username, password, comment))
+                            logger.debug(f"Created hotspot user: {username}")
+                        except routeros_api.exceptions.RouterOsApiCommunicationError as e:
+                            # Another worker (or the sheet sync) created it first
+                            if 'already have' not in str(e).lower():
+                                raise
+                            self._update_user_password(hotspot_users, username, password, comment)
+                
+            self._remember_provisioned(username, password)
             return True
         except Exception as e:
             logger.error(f"Error adding user: {str(e)}")
+            self._record_router_failure(e)
+            # Our view of the router may be wrong; re-seed on the next call
+            self.invalidate_provisioned_users(publish=False)
             return False
     
-    def remove_user(self, user_id):
+    def _update_user_password(self, hotspot_users, username, password, comment=None):
         """
-        Disconnect a user from the hotspot and add to block list
+        Set the password of an existing hotspot user, creating the user if it has gone
+        """
+        existing_users = hotspot_users.get(name=username)
+        if existing_users:
+            hotspot_users.set(id=existing_users[0]['id'], password=password)
+            logger.debug(f"Updated hotspot user password: {username}")
+        else:
+            hotspot_users.add(**self._hotspot_user_fields(username, password, comment))
+            logger.debug(f"Created hotspot user: {username}")
+    
+    def _hotspot_user_fields(self, username, password, comment=None):
+        fields = {'name': username, 'password': password, 'profile': 'default'}
+        if comment:
+            fields['comment'] = comment
+        return fields
+    
+    @timed('sync_hotspot_users')
+    def sync_hotspot_users(self, desired_users, comment, batch_size=50, hold_removals=None):
+        """
+        Bring the router's tagged hotspot users in line with a desired set
+        
+        Only entries carrying the given comment are managed; staff accounts and
+        anything created by hand on the router are left alone. The router list
+        is fetched once and only the needed adds, password updates and removes
+        are sent, over a single connection in batches of batch_size. The
+        connection is released between batches so logins are not held up
+        behind a large sync.
         
         Args:
-            user_id: This can be either the ID of the active connection or the username
+            desired_users: Dict mapping username to password
+            comment: Comment identifying entries managed by this sync
+            batch_size: Number of router commands per batch
+            hold_removals: Optional function called with the number of removals
+                and of managed entries; removals are held back when it returns True
+            
+        Returns:
+            Dict with counts of added, updated, removed, failed and held-back entries
         """
+        result = {'added': 0, 'updated': 0, 'removed': 0, 'failed': 0, 'held': 0}
+        
         # Check if we're in development mode - if so, return success without contacting router
         if os.environ.get('DEVELOPMENT_MODE', 'false').lower() == 'true':
-            logger.info(f"Development mode: Simulating successful user removal for: {user_id}")
-            return True
+            logger.info(f"Development mode: Simulating hotspot sync of {len(desired_users)} users")
+            result['added'] = len(desired_users)
+            return result
+        
+        with self.session() as api:
+            existing_users = api.get_resource('/ip/hotspot/user').get()
+        
+        managed = {u.get('name'): u for u in existing_users if u.get('comment') == comment}
+        unmanaged = {u.get('name') for u in existing_users if u.get('comment') != comment}
+        
+        commands = []
+        for name, password in desired_users.items():
+            if name in unmanaged:
+                continue
+            current = managed.get(name)
+            if current is None:
+                commands.append(('added', 'add', self._hotspot_user_fields(name, password, comment)))
+            elif current.get('password') is not None and current.get('password') != password:
+                commands.append(('updated', 'set', {'id': current['id'], 'password': password}))
+        removals = [('removed', 'remove', {'id': current['id']})
+                    for name, current in managed.items() if name not in desired_users]
+        if removals and hold_removals is not None and hold_removals(len(removals), len(managed)):
+            # Most likely an empty or truncated sheet read; don't wipe the guests
+            logger.warning(f"Hotspot sync would remove {len(removals)} of {len(managed)} guest entries; "
+                           f"holding back removals")
+            result['held'] = len(removals)
+        else:
+            commands.extend(removals)
+        
+        self._apply_hotspot_commands(commands, result, comment, batch_size)
+            
+        # The router now matches the desired set; re-seed the cache on next use
+        self.invalidate_provisioned_users()
+        logger.info(f"Hotspot sync complete: {result}")
+        return result
+    
+    @timed('provision_hotspot_users')
+    def provision_hotspot_users(self, users, comment=None, batch_size=50):
+        """
+        Make sure the router has a hotspot user for each username and password
+        
+        Used after a bulk import so those users' first login needs no router
+        write. The router list is fetched once and only missing users and
+        changed passwords are sent, in batches like sync_hotspot_users.
+        Nothing is removed.
+        
+        Args:
+            users: Dict mapping username to password
+            comment: Optional comment for newly created entries
+            batch_size: Number of router commands per batch
             
+        Returns:
+            Dict with counts of added, updated, unchanged and failed entries
+        """
+        result = {'added': 0, 'updated': 0, 'unchanged': 0, 'failed': 0}
+        
+        # Check if we're in development mode - if so, return success without contacting router
+        if os.environ.get('DEVELOPMENT_MODE', 'false').lower() == 'true':
+            logger.info(f"Development mode: Simulating provisioning of {len(users)} hotspot users")
+            result['added'] = len(users)
+            return result
+        
+        with self.session() as api:
+            existing_users = {u.get('name'): u for u in api.get_resource('/ip/hotspot/user').get()}
+        
+        commands = []
+        for name, password in users.items():
+            current = existing_users.get(name)
+            if current is None:
+                commands.append(('added', 'add', self._hotspot_user_fields(name, password, comment)))
+            elif current.get('password') is not None and current.get('password') != password:
+                commands.append(('updated', 'set', {'id': current['id'], 'password': password}))
+            else:
+                result['unchanged'] += 1
+        
+        self._apply_hotspot_commands(commands, result, comment, batch_size)
+        
+        self.invalidate_provisioned_users()
+        logger.info(f"Hotspot provisioning complete: {result}")
+        return result
+    
+    def _apply_hotspot_commands(self, commands, result, comment, batch_size):
+        """
+        Send (action, method, fields) commands to /ip/hotspot/user in batches
+        
+        Each batch runs in its own session so logins can get the connection
+        in between. An add that finds the user already there (a login created
+        it since the list was fetched) becomes a password update.
+        
+        Args:
+            commands: List of (result key, resource method name, fields)
+            result: Dict of counts updated in place, with a 'failed' key
+            comment: Comment for entries created by the fallback update
+            batch_size: Number of router commands per batch
+        """
+        for start in range(0, len(commands), batch_size):
+            batch = commands[start:start + batch_size]
+            with self.session() as api:
+                hotspot_users = api.get_resource('/ip/hotspot/user')
+                for action, command, fields in batch:
+                    try:
+                        try:
+                            getattr(hotspot_users, command)(**fields)
+                            result[action] += 1
+                        except routeros_api.exceptions.RouterOsApiCommunicationError as e:
+                            # A login created the user since the list was fetched
+                            if action != 'added' or 'already have' not in str(e).lower():
+                                raise
+                            self._update_user_password(hotspot_users, fields['name'], fields['password'], comment)
+                            result['updated'] += 1
+                    except Exception as e:
+                        logger.error(f"Hotspot batch could not apply {action} ({fields.get('name', fields.get('id'))}): {str(e)}")
+                        result['failed'] += 1
+                        self._record_router_failure(e)
+                        if self.connection is None:
+                            # The connection is gone; stop instead of failing every remaining command
+                            raise
+            logger.debug(f"Hotspot batch {start // batch_size + 1}: {len(batch)} commands")
+        
+    def _shared_provisioned_generation(self):
+        """
+        Generation of the router's user list shared by all workers (see invalidate_provisioned_users)
+        """
         try:
-            api = self.connect()
-            hotspot_active = api.get_resource('/ip/hotspot/active')
+            return get_generation('hotspot_users')
+        except Exception as e:
+            logger.error(f"Error reading hotspot user generation: {str(e)}")
+            return None
+    
+    def _provisioned_cache_expired(self, generation=None):
+        """
+        Check whether the cache must be re-seeded: never loaded, older than the
+        TTL, or loaded before another worker changed the router's user list
+        """
+        return (self._provisioned_users is None or
+                time.time() - self._provisioned_loaded_at > HOTSPOT_USER_CACHE_TTL or
+                (generation is not None and generation != self._provisioned_generation))
+        
+    def _load_provisioned_users(self, hotspot_users):
+        """
+        Seed the provisioned-user cache from the router's /ip/hotspot/user list
             
-            # Store MAC address to block later if this is a username
-            mac_to_block = None
+        Args:
+            hotspot_users: The /ip/hotspot/user resource
+        """
+        # Read before fetching, so a change made meanwhile counts as newer
+        generation = self._shared_provisioned_generation()
+        provisioned = {}
+        for user in hotspot_users.get():
+            name = user.get('name')
+            if name:
+                password = user.get('password')
+                provisioned[name] = _password_hash(password) if password is not None else None
             
-            # Check if user_id is an active connection ID
+        with self._provisioned_lock:
+            self._provisioned_users = provisioned
+            self._provisioned_loaded_at = time.time()
+            self._provisioned_generation = generation
+        logger.info(f"Loaded {len(provisioned)} provisioned hotspot users from router")
+        
+    def _is_provisioned(self, username, password):
+        """
+        Check the cache for a hotspot user with this username and password
+        """
+        generation = self._shared_provisioned_generation()
+        with self._provisioned_lock:
+            if self._provisioned_cache_expired(generation):
+                return False
+            if username not in self._provisioned_users:
+                return False
+            cached_hash = self._provisioned_users[username]
+        # An unknown password means the router didn't report it; trust the existing account
+        return cached_hash is None or cached_hash == _password_hash(password)
+        
+    def _remember_provisioned(self, username, password):
+        with self._provisioned_lock:
+            if self._provisioned_users is not None:
+                self._provisioned_users[username] = _password_hash(password)
+        
+    def invalidate_provisioned_users(self, publish=True):
+        """
+        Drop the provisioned-user cache so it is re-seeded from the router
+        
+        Args:
+            publish: Also bump the shared generation so every other worker's
+                cache is dropped (the router's user list changed); False when
+                only this process's view is in doubt
+        """
+        with self._provisioned_lock:
+            self._provisioned_users = None
+            self._provisioned_loaded_at = 0
+        if publish:
             try:
-                # If it's a connection ID, get the user details first to get the MAC
-                user_details = hotspot_active.get(id=user_id)
-                if user_details and len(user_details) > 0:
-                    mac_to_block = user_details[0].get('mac-address')
-                
-                # Disconnect the user
-                hotspot_active.remove(id=user_id)
-                logger.debug(f"Disconnected user with connection ID: {user_id}")
+                bump_generation('hotspot_users')
+            except Exception as e:
+                logger.error(f"Error publishing hotspot user change: {str(e)}")
+        
+    def remove_user(self, user_id):
+        """
+        Disconnect a user from the hotspot and add to block list
+            
+        Args:
+            user_id: This can be either the ID of the active connection or the username
+        """
+        # Check if we're in development mode - if so, return success without contacting router
+        if os.environ.get('DEVELOPMENT_MODE', 'false').lower() == 'true':
+            logger.info(f"Development mode: Simulating successful user removal for: {user_id}")
+            return True
                 
-                # Block the MAC address if found
-                if mac_to_block:
-                    self._block_mac_address(mac_to_block, user_details[0].get('user', 'unknown'))
+        try:
+            with self.session() as api:
+                hotspot_active = api.get_resource('/ip/hotspot/active')
                 
-                return True
-            except Exception as e:
-                logger.debug(f"Not a connection ID or error: {str(e)}")
+                # Store MAC address to block later if this is a username
+                mac_to_block = None
                 
-                # If not, try to find the user by username
-                active_users = hotspot_active.get(user=user_id)
-                if active_users:
-                    for user in active_users:
-                        # Get MAC address before disconnecting
-                        mac_to_block = user.get('mac-address')
-                        
-                        # Disconnect the user
-                        hotspot_active.remove(id=user['id'])
-                        logger.debug(f"Disconnected user: {user_id} with connection ID: {user['id']}")
-                        
-                        # Block the MAC address
-                        if mac_to_block:
-                            self._block_mac_address(mac_to_block, user_id)
+                # Check if user_id is an active connection ID
+                try:
+                    # If it's a connection ID, get the user details first to get the MAC
+                    user_details = hotspot_active.get(id=user_id)
+                    if user_details and len(user_details) > 0:
+                        mac_to_block = user_details[0].get('mac-address')
+                    
+                    # Disconnect the user
+                    hotspot_active.remove(id=user_id)
+                    logger.debug(f"Disconnected user with connection ID: {user_id}")
+                    
+                    # Block the MAC address if found
+                    if mac_to_block:
+                        self._block_mac_address(mac_to_block, user_details[0].get('user', 'unknown'))
                     
                     return True
-                else:
-                    logger.warning(f"User not found to disconnect: {user_id}")
-                    return False
+                except Exception as e:
+                    logger.debug(f"Not a connection ID or error: {str(e)}")
+                    
+                    # If not, try to find the user by username
+                    active_users = hotspot_active.get(user=user_id)
+                    if active_users:
+                        for user in active_users:
+                            # Get MAC address before disconnecting
+                            mac_to_block = user.get('mac-address')
+                            
+                            # Disconnect the user
+                            hotspot_active.remove(id=user['id'])
+                            logger.debug(f"Disconnected user: {user_id} with connection ID: {user['id']}")
+                            
+                            # Block the MAC address
+                            if mac_to_block:
+                                self._block_mac_address(mac_to_block, user_id)
+                        
+                        return True
+                    else:
+                        logger.warning(f"User not found to disconnect: {user_id}")
+                        return False
         except Exception as e:
             logger.error(f"Error removing user: {str(e)}")
+            self._record_router_failure(e)
             return False
     
+    @timed('disconnect_users')
+    def disconnect_users(self, usernames, batch_size=50):
+        """
+        Disconnect every active hotspot session of the given users
+        
+        The active list and the login cookies are fetched once and the
+        matching entries removed in batches, each batch in its own session
+        like sync_hotspot_users. Removing the cookies stops the devices from
+        logging straight back in without the portal. The hotspot user entries
+        themselves are left alone.
+        
+        Args:
+            usernames: Hotspot usernames (mobile numbers)
+            batch_size: Number of router commands per batch
+            
+        Returns:
+            Dict with counts of disconnected sessions, removed cookies and failed removals
+        """
+        usernames = set(usernames)
+        result = {'disconnected': 0, 'cookies': 0, 'failed': 0}
+        
+        # Check if we're in development mode - if so, return success without contacting router
+        if os.environ.get('DEVELOPMENT_MODE', 'false').lower() == 'true':
+            logger.info(f"Development mode: Simulating disconnect of {len(usernames)} users")
+            return result
+        if not usernames:
+            return result
+        
+        with self.session() as api:
+            with track_dependency('mikrotik', 'hotspot_active.get'):
+                active = api.get_resource('/ip/hotspot/active').get()
+            with track_dependency('mikrotik', 'hotspot_cookie.get'):
+                cookies = api.get_resource('/ip/hotspot/cookie').get()
+        
+        commands = [('disconnected', '/ip/hotspot/active', entry['id'])
+                    for entry in active if entry.get('user') in usernames]
+        commands += [('cookies', '/ip/hotspot/cookie', entry['id'])
+                     for entry in cookies if entry.get('user') in usernames]
+        
+        for start in range(0, len(commands), batch_size):
+            batch = commands[start:start + batch_size]
+            with self.session() as api:
+                resources = {}
+                for action, path, entry_id in batch:
+                    if path not in resources:
+                        resources[path] = api.get_resource(path)
+                    try:
+                        resources[path].remove(id=entry_id)
+                        result[action] += 1
+                    except Exception as e:
+                        if 'no such item' in str(e).lower():
+                            # The device logged out since the list was fetched
+                            continue
+                        logger.error(f"Could not remove {path} entry {entry_id}: {str(e)}")
+                        result['failed'] += 1
+                        self._record_router_failure(e)
+                        if self.connection is None:
+                            # The connection is gone; stop instead of failing every remaining command
+                            raise
+        
+        logger.info(f"Disconnected {len(usernames)} users: {result}")
+        return result
+    
     def _block_mac_address(self, mac_address, username):
         """
         Add a MAC address to the block list
@@ -264,29 +770,29 @@ class MikroTikAPI:
             return False
                 
         try:
-            api = self.connect()
-            
-            # Add to MikroTik address list (for firewall)
-            ip_firewall_addr_list = api.get_resource('/ip/firewall/address-list')
-            
-            # Check if already in the block list
-            existing = ip_firewall_addr_list.get(address=mac_address, list="blocked-hotspot-users")
-            if existing:
-                logger.debug(f"MAC {mac_address} already in block list")
+            with self.session() as api:
+                # Add to MikroTik address list (for firewall)
+                ip_firewall_addr_list = api.get_resource('/ip/firewall/address-list')
+                
+                # Check if already in the block list
+                existing = ip_firewall_addr_list.get(address=mac_address, list="blocked-hotspot-users")
+                if existing:
+                    logger.debug(f"MAC {mac_address} already in block list")
+                    return True
+                    
+                # Add to the block list with a comment for reference
+                ip_firewall_addr_list.add(
+                    list="blocked-hotspot-users",
+                    address=mac_address,
+                    comment=f"Blocked user: {username} on {time.strftime('%Y-%m-%d %H:%M:%S')}"
+                )
+                
+                logger.info(f"Added MAC {mac_address} to block list (user: {username})")
                 return True
                 
-            # Add to the block list with a comment for reference
-            ip_firewall_addr_list.add(
-                list="blocked-hotspot-users",
-                address=mac_address,
-                comment=f"Blocked user: {username} on {time.strftime('%Y-%m-%d %H:%M:%S')}"
-            )
-            
-            logger.info(f"Added MAC {mac_address} to block list (user: {username})")
-            return True
-            
         except Exception as e:
             logger.error(f"Error blocking MAC address: {str(e)}")
+            self._record_router_failure(e)
             return False
     
     def _is_valid_mac(self, mac):
@@ -3,6 +3,16 @@ from main import db
 
 class User(db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        # Newest-first (id descending) listing per manage-users tab (see migrations/add_user_list_indexes.sql)
+        db.Index('ix_users_type_id', 'user_type', 'id'),
+        db.Index('ix_users_active_id', 'is_active', 'id'),
+        # Prefix search on mobile number (LIKE '98%' needs pattern ops outside the C locale)
+        db.Index('ix_users_mobile_prefix', 'mobile_number',
+                 postgresql_ops={'mobile_number': 'varchar_pattern_ops'}),
+        # Room checkout (room numbers are stored normalized, see migrations/add_checkout_indexes.sql)
+        db.Index('ix_users_room_number', 'room_number'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     mobile_number = db.Column(db.String(20), unique=True, nullable=False)
@@ -22,6 +32,12 @@ class User(db.Model):
 
 class LoginSession(db.Model):
     __tablename__ = 'login_sessions'
+    __table_args__ = (
+        # Open sessions per user, for room checkout
+        db.Index('ix_login_sessions_open_user', 'user_id',
+                 postgresql_where=db.text('logout_time IS NULL'),
+                 sqlite_where=db.text('logout_time IS NULL')),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -0,0 +1,91 @@
+"""
+Rendered-page cache for the public portal
+
+Phones open the captive portal over and over (OS connectivity probes, app
+switches), and the login page is identical for everyone apart from flash
+messages. The page shell is rendered through Jinja once per process with a
+placeholder where the flash messages go; requests then only splice in their
+messages, and clients revalidating with If-None-Match/If-Modified-Since get
+a 304.
+"""
+import hashlib
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+
+from flask import render_template, get_flashed_messages, request, make_response
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+FLASH_PLACEHOLDER = '<!--flash-messages-->'
+
+
+class CachedPage:
+    """
+    A template rendered once, with flash messages injected per request
+    """
+
+    def __init__(self, template, **context):
+        """
+        Args:
+            template: Template name, e.g. 'login.html'
+            context: Template context that is the same for every request
+        """
+        self.template = template
+        self.context = context
+        self._html = None
+        self._etag = None
+        self._last_modified = None
+        self._lock = threading.Lock()
+
+    def _render_shell(self, app):
+        html = render_template(self.template, flash_placeholder=FLASH_PLACEHOLDER, **self.context)
+
+        # Last-Modified follows the template sources so it agrees across workers
+        mtimes = []
+        for loader_path in app.jinja_loader.searchpath:
+            for name in (self.template, 'base.html', '_flash_messages.html'):
+                path = os.path.join(app.root_path, loader_path, name)
+                if os.path.exists(path):
+                    mtimes.append(os.path.getmtime(path))
+        last_modified = datetime.fromtimestamp(max(mtimes), tz=timezone.utc) if mtimes else datetime.now(timezone.utc)
+
+        self._etag = hashlib.sha256(html.encode('utf-8')).hexdigest()[:16]
+        self._last_modified = last_modified.replace(microsecond=0)
+        self._html = html
+        logger.debug(f"Rendered page shell for {self.template} (etag {self._etag})")
+
+    def response(self, app):
+        """
+        Build the response for the current request
+
+        Without pending flash messages the cached shell is returned as is (or
+        a 304 when the client's copy is current). With messages, they are
+        rendered and spliced into the shell, and no validators are sent.
+        """
+        if self._html is None:
+            with self._lock:
+                if self._html is None:
+                    self._render_shell(app)
+
+        messages = get_flashed_messages(with_categories=True)
+        if messages:
+            flash_html = render_template('_flash_messages.html', messages=messages)
+            response = make_response(self._html.replace(FLASH_PLACEHOLDER, flash_html, 1))
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+
+        response = make_response(self._html)
+        response.set_etag(self._etag)
+        response.last_modified = self._last_modified
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+
+    def invalidate(self):
+        """
+        Force the shell to be rendered again on the next request
+        """
+        with self._lock:
+            self._html = None
@@ -0,0 +1,305 @@
+"""
+On-demand sampling profiler for live workers
+
+An admin starts a profiling session from /admin/traces. The session either
+runs for N seconds or covers the next N requests to a route such as
+/login. The session is described by a control file in PROFILE_DIR, so
+every gunicorn worker picks it up without a restart.
+
+While a session runs, a sampler thread in each worker reads
+sys._current_frames() every PROFILE_INTERVAL_MS. It counts the stacks of
+request threads, and only those handling the chosen route when one was
+given. When the session ends, each worker writes its stacks to
+PROFILE_DIR/<session>.<pid>.collapsed. The download merges these into
+one collapsed-stack file that flamegraph.pl or speedscope can read.
+
+When no session runs, the only cost is one clock comparison per request
+(the control file is checked at most once a second).
+
+Sessions are picked up on requests, not by a background thread: a worker
+that receives no request during a session never samples, and a worker only
+starts sampling at its first request after the session starts. A
+route-targeted session can therefore miss the first requests of a burst
+(up to one per worker, plus anything that arrives within the check
+interval).
+"""
+import collections
+import json
+import logging
+import os
+import secrets
+import sys
+import threading
+import time
+
+from config import PROFILE_DIR, PROFILE_INTERVAL_MS, PROFILE_MAX_SECONDS
+from local_store import get_store
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+CONTROL_FILE = os.path.join(PROFILE_DIR, 'control.json')
+REQUEST_COUNT_NAMESPACE = 'profiler_requests'
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)})"
+
+
+def _collapse(frame):
+    """
+    A stack as 'outer;...;inner', the collapsed-stack format
+    """
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+def _read_control():
+    try:
+        with open(CONTROL_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def start_session(seconds=None, requests=None, route=None, interval_ms=PROFILE_INTERVAL_MS):
+    """
+    Start a profiling session in every worker
+
+    Args:
+        seconds: Profile for this many seconds
+        requests: Or stop after this many requests (to route, if given)
+        route: Only sample requests whose path starts with this
+        interval_ms: Sampling interval
+
+    Returns:
+        The session's control dict
+    """
+    seconds = min(seconds or PROFILE_MAX_SECONDS, PROFILE_MAX_SECONDS)
+    session = {
+        # Random suffix: two sessions started in the same second must not share files or counters
+        'id': f"{time.strftime('%Y%m%d-%H%M%S')}-{secrets.randbelow(10 ** 6):06d}",
+        'started_at': time.time(),
+        'until': time.time() + seconds,
+        'requests': requests,
+        'route': route or None,
+        'interval_ms': max(1, interval_ms),
+    }
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    tmp_path = f"{CONTROL_FILE}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(session, f)
+    os.replace(tmp_path, CONTROL_FILE)
+    logger.info(f"Started profiling session {session['id']}")
+    return session
+
+
+def stop_session():
+    """
+    End the running session; workers write their stacks within a second
+    """
+    try:
+        os.remove(CONTROL_FILE)
+    except FileNotFoundError:
+        pass
+
+
+def list_sessions():
+    """
+    Profiles available for download, newest first
+
+    Returns:
+        List of dicts with the session id, worker count and sample count
+    """
+    sessions = collections.defaultdict(lambda: {'workers': 0, 'samples': 0})
+    try:
+        names = os.listdir(PROFILE_DIR)
+    except OSError:
+        return []
+    for name in names:
+        if not name.endswith('.collapsed'):
+            continue
+        session_id = name.split('.', 1)[0]
+        entry = sessions[session_id]
+        entry['workers'] += 1
+        try:
+            with open(os.path.join(PROFILE_DIR, name)) as f:
+                entry['samples'] += sum(int(line.rsplit(' ', 1)[1]) for line in f if line.strip())
+        except (OSError, ValueError, IndexError):
+            continue
+    return [dict(id=session_id, **entry) for session_id, entry in sorted(sessions.items(), reverse=True)]
+
+
+def merged_profile(session_id):
+    """
+    A session's stacks from all workers, as collapsed-stack text
+
+    Returns:
+        The text, or None if the session has no profile files
+    """
+    counts = collections.Counter()
+    found = False
+    prefix = f"{session_id}."
+    try:
+        names = os.listdir(PROFILE_DIR)
+    except OSError:
+        return None
+    for name in names:
+        if not (name.startswith(prefix) and name.endswith('.collapsed')):
+            continue
+        found = True
+        with open(os.path.join(PROFILE_DIR, name)) as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack and count.isdigit():
+                    counts[stack] += int(count)
+    if not found:
+        return None
+    return ''.join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+def get_status():
+    """
+    The running session (if any) and the profiles available for download
+    """
+    session = _read_control()
+    if session and session['until'] <= time.time():
+        session = None
+    if session and session.get('requests'):
+        session['requests_seen'] = get_store().get(REQUEST_COUNT_NAMESPACE, session['id']) or 0
+        if session['requests_seen'] >= session['requests']:
+            session = None
+    return {'running': session, 'sessions': list_sessions()}
+
+
+class Profiler:
+    """
+    Per-worker side of a profiling session
+    """
+
+    def __init__(self):
+        self.session = None
+        self._next_check = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._stacks = collections.Counter()
+        # Thread ident -> path for requests being sampled
+        self._requests = {}
+
+    def poll(self):
+        """
+        Pick up a new session from the control file (cheap; call per request)
+
+        Only called from requests, so an idle worker never starts sampling,
+        and a session starts here, on the first request after it was created
+        (see the module docstring).
+        """
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + 1
+        if self.session is not None:
+            return
+        session = _read_control()
+        if session and session['until'] > time.time() and not self._finished(session):
+            self._start(session)
+
+    def _finished(self, session):
+        return os.path.exists(self._output_path(session))
+
+    def _output_path(self, session):
+        return os.path.join(PROFILE_DIR, f"{session['id']}.{os.getpid()}.collapsed")
+
+    def _start(self, session):
+        self.session = session
+        self._stacks = collections.Counter()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+        logger.info(f"Profiling session {session['id']} started in worker {os.getpid()}")
+
+    def request_started(self, ident, path):
+        session = self.session
+        if session is None:
+            return
+        if session['route'] is None or path.startswith(session['route']):
+            self._requests[ident] = path
+
+    def request_finished(self, ident):
+        path = self._requests.pop(ident, None)
+        session = self.session
+        if path is not None and session is not None and session.get('requests'):
+            get_store().update(
+                REQUEST_COUNT_NAMESPACE, session['id'], lambda count: (count or 0) + 1,
+                ttl=PROFILE_MAX_SECONDS
+            )
+
+    def _should_stop(self, session):
+        if time.time() >= session['until']:
+            return True
+        control = _read_control()
+        if control is None or control['id'] != session['id']:
+            return True
+        if session.get('requests'):
+            seen = get_store().get(REQUEST_COUNT_NAMESPACE, session['id']) or 0
+            return seen >= session['requests']
+        return False
+
+    def _run(self):
+        session = self.session
+        interval = session['interval_ms'] / 1000
+        own_ident = threading.get_ident()
+        next_check = time.monotonic() + 1
+        try:
+            while not self._stop.wait(interval):
+                frames = sys._current_frames()
+                for ident in list(self._requests):
+                    frame = frames.get(ident)
+                    if frame is not None and ident != own_ident:
+                        self._stacks[_collapse(frame)] += 1
+                if time.monotonic() >= next_check:
+                    next_check = time.monotonic() + 1
+                    if self._should_stop(session):
+                        break
+        except Exception as e:
+            logger.error(f"Profiler error: {str(e)}")
+        finally:
+            self._write(session)
+            self.session = None
+            self._requests.clear()
+
+    def _write(self, session):
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            with open(self._output_path(session), 'w') as f:
+                for stack, count in self._stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            logger.info(f"Profiling session {session['id']} finished in worker {os.getpid()}: "
+                        f"{sum(self._stacks.values())} samples")
+        except OSError as e:
+            logger.error(f"Error writing profile: {str(e)}")
+
+
+profiler = Profiler()
+
+
+def init_profiler(app):
+    """
+    Let each request pick up profiling sessions and register itself for sampling
+    """
+    from flask import request
+
+    @app.before_request
+    def _profile_request():
+        profiler.poll()
+        if profiler.session is not None:
+            profiler.request_started(threading.get_ident(), request.path)
+
+    @app.teardown_request
+    def _finish_profiled_request(exc=None):
+        if profiler.session is not None:
+            profiler.request_finished(threading.get_ident())
@@ -0,0 +1,168 @@
+"""
+Sliding-window login throttling
+
+Login attempts are counted per MAC address and per mobile number, twice:
+every attempt against a higher limit (LOGIN_ATTEMPT_LIMIT), counted before
+the login does any DB, Sheets or router work, and failed attempts against
+LOGIN_RATE_LIMIT. The client IP is deliberately not a key: every guest reaches the portal
+through the router's NAT (or the platform's proxy), so one IP stands for the
+whole guesthouse. Each key keeps a compact [window_start, previous_count, current_count,
+locked_until] counter in the shared local store, and the sliding-window
+estimate weights the previous window by how much of it still overlaps the
+current one. Keys that exceed the limit are locked out for a while.
+"""
+import logging
+import time
+
+from config import LOGIN_RATE_LIMIT, LOGIN_ATTEMPT_LIMIT, LOGIN_RATE_WINDOW, LOGIN_LOCKOUT_SECONDS
+from local_store import get_store
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class SlidingWindowLimiter:
+    """
+    Sliding-window rate limiter with lockout
+    """
+
+    def __init__(self, namespace, limit, window, lockout):
+        """
+        Args:
+            namespace: Store namespace for this limiter's counters
+            limit: Maximum attempts allowed per window
+            window: Window length in seconds
+            lockout: Lockout duration in seconds once the limit is exceeded
+        """
+        self.namespace = namespace
+        self.limit = limit
+        self.window = window
+        self.lockout = lockout
+
+    def hit(self, key, now=None):
+        """
+        Record an attempt for key
+
+        Returns:
+            Seconds until the key may retry, or 0 if the attempt is allowed
+        """
+        now = now or time.time()
+
+        def _record(counter):
+            window_start, previous, current, locked_until = counter or [now, 0, 0, 0]
+
+            # Roll the window forward
+            elapsed_windows = int((now - window_start) // self.window)
+            if elapsed_windows == 1:
+                window_start, previous, current = window_start + self.window, current, 0
+            elif elapsed_windows > 1:
+                window_start, previous, current = now, 0, 0
+
+            if locked_until > now:
+                return [window_start, previous, current, locked_until]
+
+            current += 1
+            overlap = 1 - (now - window_start) / self.window
+            if previous * overlap + current > self.limit:
+                locked_until = now + self.lockout
+            return [window_start, previous, current, locked_until]
+
+        ttl = max(2 * self.window, self.lockout)
+        counter = get_store().update(self.namespace, key, _record, ttl)
+        locked_until = counter[3]
+        return max(0, int(locked_until - now + 0.999)) if locked_until > now else 0
+
+    def retry_in(self, key, now=None):
+        """
+        Check key without recording an attempt
+
+        Returns:
+            Seconds until the key may retry, or 0 if it is not locked out
+        """
+        now = now or time.time()
+        counter = get_store().get(self.namespace, key)
+        if not counter or counter[3] <= now:
+            return 0
+        return max(1, int(counter[3] - now + 0.999))
+
+    def reset(self, key):
+        """
+        Clear the counter for key (e.g. after a successful login)
+        """
+        get_store().delete(self.namespace, key)
+
+
+login_limiter = SlidingWindowLimiter(
+    'login_attempts',
+    limit=LOGIN_RATE_LIMIT,
+    window=LOGIN_RATE_WINDOW,
+    lockout=LOGIN_LOCKOUT_SECONDS
+)
+
+attempt_limiter = SlidingWindowLimiter(
+    'login_requests',
+    limit=LOGIN_ATTEMPT_LIMIT,
+    window=LOGIN_RATE_WINDOW,
+    lockout=LOGIN_LOCKOUT_SECONDS
+)
+
+
+def _login_keys(mac_address, mobile_number):
+    return [f"{kind}:{value.strip().lower()}"
+            for kind, value in (('mac', mac_address), ('mobile', mobile_number)) if value]
+
+
+def check_login_attempt(mac_address=None, mobile_number=None):
+    """
+    Count a login attempt and check whether the client is locked out
+
+    Every attempt counts against LOGIN_ATTEMPT_LIMIT, whatever its outcome;
+    failed attempts are counted separately (see record_failed_login).
+
+    Args:
+        mac_address: Client MAC address from the MikroTik redirect, if known
+        mobile_number: Mobile number entered in the form
+
+    Returns:
+        Seconds until the client may retry, or 0 if the attempt is allowed
+    """
+    retry_after = 0
+    for key in _login_keys(mac_address, mobile_number):
+        try:
+            wait = login_limiter.retry_in(key) if LOGIN_RATE_LIMIT > 0 else 0
+            if not wait and LOGIN_ATTEMPT_LIMIT > 0:
+                wait = attempt_limiter.hit(key)
+        except Exception as e:
+            # Never block logins because the throttle store is unavailable
+            logger.error(f"Login throttle error for {key.split(':')[0]}: {str(e)}")
+            continue
+        if wait:
+            logger.warning(f"Login throttled by {key.split(':')[0]} key, retry in {wait}s")
+        retry_after = max(retry_after, wait)
+    return retry_after
+
+
+def record_failed_login(mac_address=None, mobile_number=None):
+    """
+    Count a failed login against the client's MAC address and the mobile number tried
+    """
+    if LOGIN_RATE_LIMIT <= 0:
+        return
+    for key in _login_keys(mac_address, mobile_number):
+        try:
+            login_limiter.hit(key)
+        except Exception as e:
+            logger.error(f"Login throttle error for {key.split(':')[0]}: {str(e)}")
+
+
+def reset_login_attempts(mac_address=None, mobile_number=None):
+    """
+    Clear the client's failed-attempt counters after a successful login
+
+    The attempt counters are left alone; they expire with their window.
+    """
+    for key in _login_keys(mac_address, mobile_number):
+        try:
+            login_limiter.reset(key)
+        except Exception as e:
+            logger.error(f"Error resetting login throttle: {str(e)}")
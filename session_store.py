@@ -0,0 +1,149 @@
+"""
+Server-side sessions for captive-portal state
+
+With SESSION_BACKEND=local, session data (MikroTik redirect parameters, the
+logged-in guest, flash messages) lives in the shared local store instead of
+Flask's signed cookie. The browser only carries a short opaque session id,
+entries expire after PORTAL_SESSION_TTL seconds, and active portal sessions
+can be looked up on the server.
+"""
+import logging
+import secrets
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from config import PORTAL_SESSION_TTL
+from local_store import get_store
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+SESSION_NAMESPACE = 'portal_sessions'
+
+
+def _new_sid():
+    return secrets.token_urlsafe(16)
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """
+    Session dict that tracks modifications and knows its store id
+    """
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid or _new_sid()
+        self.new = new
+        self.modified = False
+        self.previous_sid = None
+
+    def regenerate(self):
+        """
+        Move the session to a fresh id (call after a privilege change such as login)
+        """
+        if not self.new and self.previous_sid is None:
+            self.previous_sid = self.sid
+        self.sid = _new_sid()
+        self.modified = True
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """
+    Flask session interface backed by the shared local store
+    """
+
+    def __init__(self, ttl=PORTAL_SESSION_TTL):
+        self.ttl = ttl
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            try:
+                data = get_store().get(SESSION_NAMESPACE, sid)
+            except Exception as e:
+                logger.error(f"Error loading session: {str(e)}")
+                data = None
+            if data is not None:
+                return ServerSideSession(data, sid=sid)
+        return ServerSideSession(new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        # Like open_session, a locked or unavailable store must not turn the response into a 500
+        if session.previous_sid:
+            try:
+                get_store().delete(SESSION_NAMESPACE, session.previous_sid)
+            except Exception as e:
+                logger.error(f"Error deleting previous session: {str(e)}")
+
+        if not session:
+            if session.modified and not session.new:
+                try:
+                    get_store().delete(SESSION_NAMESPACE, session.sid)
+                except Exception as e:
+                    logger.error(f"Error deleting session: {str(e)}")
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if not session.modified:
+            return
+
+        try:
+            get_store().set(SESSION_NAMESPACE, session.sid, dict(session), self.ttl)
+        except Exception as e:
+            # The changes are lost for this request; keep the client's current cookie
+            logger.error(f"Error saving session: {str(e)}")
+            return
+        response.set_cookie(
+            name,
+            session.sid,
+            max_age=self.ttl,
+            httponly=self.get_cookie_httponly(app),
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+            domain=domain,
+            path=path
+        )
+
+
+def get_active_portal_sessions():
+    """
+    List active portal sessions that belong to a logged-in user
+
+    Returns:
+        List of dicts with the session's mobile number, user type, MAC, IP and login time
+    """
+    sessions = []
+    for _, data in get_store().items(SESSION_NAMESPACE):
+        if data.get('authenticated'):
+            sessions.append({
+                'mobile_number': data.get('user_mobile'),
+                'user_type': data.get('user_type'),
+                'mac_address': data.get('mac'),
+                'ip_address': data.get('ip'),
+                'login_time': data.get('login_time'),
+                'login_session_id': data.get('login_session_id'),
+            })
+    return sessions
+
+
+def init_sessions(app, backend):
+    """
+    Install the session backend named by SESSION_BACKEND
+
+    Args:
+        app: The Flask app
+        backend: 'cookie' (Flask's signed cookie, the default) or 'local'
+    """
+    if backend == 'local':
+        app.session_interface = ServerSideSessionInterface()
+        logger.info("Using server-side portal sessions")
+    elif backend != 'cookie':
+        logger.warning(f"Unknown SESSION_BACKEND '{backend}', using cookie sessions")
@@ -2,13 +2,18 @@ document.addEventListener('DOMContentLoaded', function() {
     // Initialize variables
     const refreshBtn = document.getElementById('refreshBtn');
     const refreshSheetBtn = document.getElementById('refreshSheetBtn');
+    const syncHotspotBtn = document.getElementById('syncHotspotBtn');
     const googleSetupBtn = document.getElementById('googleSetupBtn');
+    const checkoutBtn = document.getElementById('checkoutBtn');
     const refreshSpinner = document.getElementById('refreshSpinner');
     const userTableBody = document.getElementById('userTableBody');
     const disconnectModal = new bootstrap.Modal(document.getElementById('disconnectModal'));
     const googleSetupModal = new bootstrap.Modal(document.getElementById('googleSetupModal'));
     const disconnectUserName = document.getElementById('disconnectUserName');
     const confirmDisconnectBtn = document.getElementById('confirmDisconnectBtn');
+    const checkoutModal = new bootstrap.Modal(document.getElementById('checkoutModal'));
+    const checkoutRooms = document.getElementById('checkoutRooms');
+    const confirmCheckoutBtn = document.getElementById('confirmCheckoutBtn');
     let currentUserId = null;
     let chartInstance = null;
     
@@ -243,6 +248,53 @@ document.addEventListener('DOMContentLoaded', function() {
             });
     }
     
+    // Pre-provision guest hotspot users from the sheet
+    function syncHotspotUsers() {
+        fetch('/api/sync_hotspot_users', { method: 'POST' })
+            .then(response => response.json())
+            .then(data => {
+                if (data.success) {
+                    alert(data.message);
+                } else {
+                    const message = data.error ? data.error.message : data.message;
+                    console.error('Failed to sync hotspot users:', message);
+                    alert('Failed to sync hotspot users: ' + message);
+                }
+            })
+            .catch(error => {
+                console.error('Error syncing hotspot users:', error);
+                alert('Error syncing hotspot users. Please try again.');
+            });
+    }
+    
+    // Disconnect all guests of the entered rooms
+    function checkoutRoomList() {
+        const formData = new FormData();
+        formData.append('rooms', checkoutRooms.value);
+        
+        fetch('/api/checkout_rooms', {
+            method: 'POST',
+            body: formData
+        })
+            .then(response => response.json())
+            .then(data => {
+                if (data.success) {
+                    checkoutModal.hide();
+                    checkoutRooms.value = '';
+                    refreshUserData();
+                    alert(data.message);
+                } else {
+                    const message = data.error ? data.error.message : data.message;
+                    console.error('Failed to check out rooms:', message);
+                    alert('Failed to check out rooms: ' + message);
+                }
+            })
+            .catch(error => {
+                console.error('Error checking out rooms:', error);
+                alert('Error checking out rooms. Please try again.');
+            });
+    }
+    
     // Event: Refresh button click
     if (refreshBtn) {
         refreshBtn.addEventListener('click', refreshUserData);
@@ -253,6 +305,22 @@ document.addEventListener('DOMContentLoaded', function() {
         refreshSheetBtn.addEventListener('click', refreshSheetData);
     }
     
+    // Event: Sync Hotspot Users button click
+    if (syncHotspotBtn) {
+        syncHotspotBtn.addEventListener('click', syncHotspotUsers);
+    }
+    
+    // Event: Room Checkout button click
+    if (checkoutBtn) {
+        checkoutBtn.addEventListener('click', function() {
+            checkoutModal.show();
+        });
+    }
+    
+    if (confirmCheckoutBtn) {
+        confirmCheckoutBtn.addEventListener('click', checkoutRoomList);
+    }
+    
     // Event: Google Setup button click
     if (googleSetupBtn) {
         googleSetupBtn.addEventListener('click', function() {
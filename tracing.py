@@ -0,0 +1,262 @@
+"""
+Lightweight request tracing
+
+Every request gets a trace. Spans are recorded around each SQLAlchemy
+statement, Google Sheets call and RouterOS command made while handling
+it. This includes calls made on the login-check threads, which run in a
+copy of the request context.
+
+Requests slower than TRACE_SLOW_THRESHOLD_MS are kept with their full
+span tree. The last TRACE_BUFFER_SIZE are held in memory, and they are
+also appended to TRACE_FILE (JSON lines) when it is set, so one admin
+page can show slow requests from every worker.
+
+Outside a request (background refreshes, the hotspot sync) there is no
+trace, and span() costs a single contextvar lookup.
+"""
+import collections
+import contextvars
+import itertools
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import TRACE_SLOW_THRESHOLD_MS, TRACE_BUFFER_SIZE, TRACE_FILE
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+_current_trace = contextvars.ContextVar('trace', default=None)
+_current_span = contextvars.ContextVar('trace_span', default=None)
+
+_slow_traces = collections.deque(maxlen=TRACE_BUFFER_SIZE)
+_trace_file_lock = threading.Lock()
+
+
+class Span:
+    """
+    One timed operation within a trace
+    """
+
+    __slots__ = ('span_id', 'parent_id', 'name', 'attributes', 'start', 'duration', 'error')
+
+    def __init__(self, span_id, parent_id, name, attributes):
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.duration = None
+        self.error = None
+
+    def finish(self, error=None):
+        self.duration = time.perf_counter() - self.start
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+
+
+class Trace:
+    """
+    The spans recorded while handling one request
+    """
+
+    def __init__(self, name):
+        self.trace_id = secrets.token_hex(8)
+        self.name = name
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.status = None
+        self.spans = []
+        self._next_id = itertools.count(1).__next__
+
+    def start_span(self, name, attributes):
+        parent = _current_span.get()
+        span = Span(self._next_id(), parent.span_id if parent else None, name, attributes)
+        self.spans.append(span)
+        return span
+
+    def to_dict(self):
+        spans = []
+        for span in sorted(self.spans, key=lambda s: s.start):
+            spans.append({
+                'id': span.span_id,
+                'parent_id': span.parent_id,
+                'name': span.name,
+                'attributes': span.attributes,
+                'offset_ms': round((span.start - self.start) * 1000, 2),
+                'duration_ms': round(span.duration * 1000, 2) if span.duration is not None else None,
+                'error': span.error,
+            })
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'status': self.status,
+            'started_at': self.started_at,
+            'duration_ms': round(self.duration * 1000, 2),
+            'pid': os.getpid(),
+            'spans': spans,
+        }
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Record a span in the current trace (no-op outside a traced request)
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    current = trace.start_span(name, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.finish(e)
+        raise
+    else:
+        current.finish()
+    finally:
+        _current_span.reset(token)
+
+
+def traced(name):
+    """
+    Decorator recording each call of a function as a span
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_trace(name):
+    _current_span.set(None)
+    trace = Trace(name)
+    _current_trace.set(trace)
+    return trace
+
+
+def finish_trace(status=None):
+    """
+    End the current trace and keep it if it was slow
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    _current_trace.set(None)
+    _current_span.set(None)
+    trace.duration = time.perf_counter() - trace.start
+    trace.status = status
+    if trace.duration * 1000 < TRACE_SLOW_THRESHOLD_MS:
+        return
+
+    record = trace.to_dict()
+    _slow_traces.append(record)
+    if TRACE_FILE:
+        try:
+            with _trace_file_lock, open(TRACE_FILE, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+        except OSError as e:
+            logger.error(f"Error writing slow trace: {str(e)}")
+
+
+def get_slow_traces(limit=None):
+    """
+    Most recent slow traces first, from TRACE_FILE when set (all workers)
+    """
+    limit = limit or TRACE_BUFFER_SIZE
+    if not TRACE_FILE:
+        return list(reversed(_slow_traces))[:limit]
+
+    try:
+        with open(TRACE_FILE) as f:
+            lines = collections.deque(f, maxlen=limit)
+    except OSError:
+        return list(reversed(_slow_traces))[:limit]
+
+    traces = []
+    for line in reversed(lines):
+        try:
+            traces.append(json.loads(line))
+        except ValueError:
+            continue
+    return traces
+
+
+def span_depths(trace):
+    """
+    Spans of a trace dict in tree order, each with its nesting depth
+
+    Returns:
+        List of (depth, span) tuples
+    """
+    children = collections.defaultdict(list)
+    for item in trace['spans']:
+        children[item['parent_id']].append(item)
+
+    ordered = []
+
+    def walk(parent_id, depth):
+        for item in children.get(parent_id, []):
+            ordered.append((depth, item))
+            walk(item['id'], depth + 1)
+
+    walk(None, 0)
+    return ordered
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query_span(conn, cursor, statement, parameters, context, executemany):
+    trace = _current_trace.get()
+    if trace is not None:
+        conn.info['trace_span'] = trace.start_span('db.query', {'statement': statement[:200]})
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _finish_query_span(conn, cursor, statement, parameters, context, executemany):
+    query_span = conn.info.pop('trace_span', None)
+    if query_span is not None:
+        query_span.finish()
+
+
+@event.listens_for(Engine, 'handle_error')
+def _fail_query_span(context):
+    query_span = context.connection.info.pop('trace_span', None) if context.connection else None
+    if query_span is not None:
+        query_span.finish(context.original_exception)
+
+
+def init_tracing(app):
+    """
+    Trace every Flask request
+    """
+    from flask import request
+
+    @app.before_request
+    def _start_request_trace():
+        start_trace(f"{request.method} {request.path}")
+
+    @app.after_request
+    def _record_response_status(response):
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _finish_request_trace(exc=None):
+        trace = _current_trace.get()
+        finish_trace(trace.status if trace and trace.status else (500 if exc else None))
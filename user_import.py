@@ -0,0 +1,225 @@
+"""
+Bulk CSV import of special users (staff, family, friends)
+
+The whole file is validated in one pass. All valid rows are then upserted
+with a single multi-row INSERT ... ON CONFLICT DO UPDATE (row by row on
+databases without ON CONFLICT). An existing account is only updated when it
+already has the same user type (or when overwrite is asked for). Otherwise
+the row is reported as a conflict, so a guest or a staff account is never
+silently turned into something else.
+
+Expected columns (header row required): mobile_number, password, user_type,
+and optionally is_active (true/false, yes/no, 1/0; default true).
+"""
+import csv
+import io
+import logging
+from datetime import datetime
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from config import IMPORT_MAX_ROWS
+from main import db
+from models import User
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+IMPORT_USER_TYPES = ('staff', 'family', 'friend')
+REQUIRED_COLUMNS = ('mobile_number', 'password', 'user_type')
+TRUE_VALUES = ('1', 'true', 'yes', 'y')
+FALSE_VALUES = ('0', 'false', 'no', 'n')
+
+
+class ImportReport:
+    """
+    Outcome of an import: counts, plus one entry per row that was not applied
+    """
+
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.problems = []
+        self.provisioned = None
+
+    def problem(self, line, mobile_number, status, message):
+        self.problems.append({'line': line, 'mobile_number': mobile_number, 'status': status,
+                              'message': message})
+
+    @property
+    def applied(self):
+        return self.inserted + self.updated
+
+
+def parse_user_csv(text, report):
+    """
+    Validate CSV text in one pass
+
+    Args:
+        text: The uploaded file's contents
+        report: ImportReport receiving a problem entry per invalid row
+
+    Returns:
+        List of (line number, row dict) for the valid rows
+    """
+    reader = csv.DictReader(io.StringIO(text))
+    header = [name.strip().lower() for name in (reader.fieldnames or [])]
+    missing = [name for name in REQUIRED_COLUMNS if name not in header]
+    if missing:
+        report.problem(1, '', 'error', f"Missing column(s): {', '.join(missing)}")
+        return []
+    reader.fieldnames = header
+
+    rows = []
+    seen = {}
+    for record in reader:
+        line = reader.line_num
+        if len(rows) + len(report.problems) >= IMPORT_MAX_ROWS:
+            report.problem(line, '', 'error', f"Only {IMPORT_MAX_ROWS} rows can be imported at once")
+            break
+        mobile_number = (record.get('mobile_number') or '').strip()
+        password = (record.get('password') or '').strip()
+        user_type = (record.get('user_type') or '').strip().lower()
+        is_active = (record.get('is_active') or 'true').strip().lower()
+
+        if not any((mobile_number, password, user_type)):
+            continue
+        if not mobile_number.isdigit():
+            report.problem(line, mobile_number, 'error',
+                           "Mobile number should contain only digits without country code")
+        elif not password:
+            report.problem(line, mobile_number, 'error', "Password is required")
+        elif user_type not in IMPORT_USER_TYPES:
+            report.problem(line, mobile_number, 'error',
+                           f"User type must be one of {', '.join(IMPORT_USER_TYPES)}")
+        elif is_active not in TRUE_VALUES + FALSE_VALUES:
+            report.problem(line, mobile_number, 'error', "is_active must be true or false")
+        elif mobile_number in seen:
+            report.problem(line, mobile_number, 'error', f"Duplicate of line {seen[mobile_number]}")
+        else:
+            seen[mobile_number] = line
+            rows.append((line, {
+                'mobile_number': mobile_number,
+                'password': password,
+                'user_type': user_type,
+                'is_active': is_active in TRUE_VALUES,
+            }))
+    return rows
+
+
+def _dialect_insert():
+    """
+    INSERT construct with ON CONFLICT support for the configured database
+
+    Returns:
+        The insert construct, or None if the database has no ON CONFLICT
+    """
+    name = db.engine.dialect.name
+    if name == 'postgresql':
+        return postgresql.insert(User)
+    if name == 'sqlite':
+        return sqlite.insert(User)
+    return None
+
+
+def _merge_rows(rows, overwrite, now):
+    """
+    Per-row insert or update, for databases without ON CONFLICT
+
+    Applies the same rule as the single-statement upsert but is not atomic
+    against concurrent writers: a user created meanwhile makes the commit fail.
+
+    Returns:
+        Set of the mobile numbers that were applied
+    """
+    numbers = [row['mobile_number'] for _, row in rows]
+    users = {user.mobile_number: user for user in User.query.filter(User.mobile_number.in_(numbers))}
+    applied_numbers = set()
+    for _, row in rows:
+        user = users.get(row['mobile_number'])
+        if user is None:
+            db.session.add(User(created_at=now, updated_at=now, **row))
+        elif overwrite or user.user_type == row['user_type']:
+            user.password = row['password']
+            user.user_type = row['user_type']
+            user.is_active = row['is_active']
+            user.updated_at = now
+        else:
+            continue
+        applied_numbers.add(row['mobile_number'])
+    return applied_numbers
+
+
+def upsert_users(rows, report, overwrite=False):
+    """
+    Insert or update all rows in one statement and record per-row conflicts
+
+    Args:
+        rows: Valid rows from parse_user_csv
+        report: ImportReport to fill in
+        overwrite: Also update existing users whose user type differs
+
+    Returns:
+        List of the row dicts that were applied
+    """
+    if not rows:
+        return []
+
+    numbers = [row['mobile_number'] for _, row in rows]
+    # Only for the report (was it new, and what type is in the way); the
+    # upsert itself decides atomically
+    existing = dict(db.session.query(User.mobile_number, User.user_type)
+                    .filter(User.mobile_number.in_(numbers)))
+
+    now = datetime.utcnow()
+    insert = _dialect_insert()
+    if insert is None:
+        applied_numbers = _merge_rows(rows, overwrite, now)
+    else:
+        statement = insert.values([
+            dict(row, created_at=now, updated_at=now) for _, row in rows
+        ])
+        update_where = None if overwrite else (User.user_type == statement.excluded.user_type)
+        statement = statement.on_conflict_do_update(
+            index_elements=[User.mobile_number],
+            set_={
+                'password': statement.excluded.password,
+                'user_type': statement.excluded.user_type,
+                'is_active': statement.excluded.is_active,
+                'updated_at': now,
+            },
+            where=update_where
+        ).returning(User.mobile_number)
+        applied_numbers = set(db.session.execute(statement).scalars())
+    db.session.commit()
+
+    applied = []
+    for line, row in rows:
+        number = row['mobile_number']
+        if number in applied_numbers:
+            applied.append(row)
+            if number in existing:
+                report.updated += 1
+            else:
+                report.inserted += 1
+        else:
+            current = existing.get(number)
+            report.problem(line, number, 'conflict',
+                           f"Already exists as {current}" if current else "Created by someone else during the import")
+    logger.info(f"Imported users: {report.inserted} inserted, {report.updated} updated, "
+                f"{len(report.problems)} not applied")
+    return applied
+
+
+def import_users_csv(text, overwrite=False):
+    """
+    Validate and upsert a CSV of special users
+
+    Returns:
+        Tuple of (ImportReport, list of applied row dicts)
+    """
+    report = ImportReport()
+    rows = parse_user_csv(text, report)
+    applied = upsert_users(rows, report, overwrite)
+    report.problems.sort(key=lambda problem: problem['line'])
+    return report, applied